@@ -1,40 +1,70 @@
-from google.cloud import secretmanager
-from google.cloud import storage
 import numpy as np
 import pandas as pd
 
+from restaurant_finder.clients import get_secret
+from restaurant_finder.geo_functions import plan_hex_grid
 from restaurant_finder.config import (
     COORDINATES_BOTTOM_RIGHT_SUFFIX,
     COORDINATES_TOP_LEFT_SUFFIX,
+    GRID_CSV_CHUNKSIZE,
     RESTAURANT_BUCKET_NAME_SECRET_ID,
 )
 
-# Imports moved from get_latlong_from_bucket
-# import pandas as pd # Already imported at the top
-# import numpy as np # Already imported at the top
+# Columns read from grid CSV files and the dtypes they are parsed with.
+# RADIUS (meters) is optional; rows without it use the default radius.
+GRID_CSV_DTYPES = {'LAT': np.float64, 'LONG': np.float64, 'RADIUS': np.float64}
 
 
 def get_latlong_from_bucket(project_id,
                             bucket_name,
                             latlong_list, 
                             latlong_resolution,
-                            radius):
-
-    # use pandas to download csv from gcs bucket
-    df = pd.read_csv(f"gs://{bucket_name}/{latlong_list}", header=0, dtype={'LAT': np.float64, 'LONG': np.float64})
-
-    latlong_list = [(np.round(float(row.LAT), int(latlong_resolution)),
-                     np.round(float(row.LONG), int(latlong_resolution)),
-                     radius) 
-                    for index, row in df.iterrows()]
-
-    # deduplucate the latlong_list
-    latlong_list = list(set(latlong_list))
-
+                            radius,
+                            chunksize=GRID_CSV_CHUNKSIZE):
+    """
+    Reads a grid CSV from the bucket and returns its deduplicated points.
 
-    return latlong_list
+    Only the LAT, LONG and optional RADIUS columns are parsed, with fixed dtypes.
+    The file is streamed in chunks of chunksize rows; each chunk is rounded and
+    deduplicated before the next one is read, so memory follows the number of
+    unique points rather than the size of the file.
 
+    Args:
+        project_id: The Google Cloud project ID.
+        bucket_name: Name of the bucket holding the file.
+        latlong_list: Path of the CSV file inside the bucket.
+        latlong_resolution: Number of decimal places kept from LAT and LONG.
+        radius: Default search radius in meters.
+        chunksize: Rows read per chunk, or None to read the file in one go.
 
+    Returns:
+        A list of unique (latitude, longitude, radius) tuples.
+    """
+    # use pandas to download csv from gcs bucket
+    reader = pd.read_csv(f"gs://{bucket_name}/{latlong_list}", header=0,
+                         usecols=lambda column: column in GRID_CSV_DTYPES,
+                         dtype=GRID_CSV_DTYPES,
+                         chunksize=chunksize)
+    chunks = [reader] if chunksize is None else reader
+
+    resolution = int(latlong_resolution)
+    unique_chunks = []
+    for chunk in chunks:
+        points = pd.DataFrame({'LAT': chunk['LAT'].round(resolution),
+                               'LONG': chunk['LONG'].round(resolution)})
+        if 'RADIUS' in chunk.columns:
+            points['RADIUS'] = chunk['RADIUS'].fillna(radius)
+        # deduplicate within the chunk before keeping it
+        unique_chunks.append(points.dropna(subset=['LAT', 'LONG']).drop_duplicates())
+
+    if not unique_chunks:
+        return []
+    grid = pd.concat(unique_chunks, ignore_index=True)
+    if 'RADIUS' not in grid.columns:
+        grid['RADIUS'] = radius
+    grid = grid.drop_duplicates()
+
+    return list(zip(grid['LAT'].tolist(), grid['LONG'].tolist(), grid['RADIUS'].tolist()))
 
 
 def string_to_tuple(string):
@@ -57,6 +87,9 @@ def access_secret_version(project_id, secret_id, version_id="latest"):
     """
     Access the value of a secret version.
 
+    Values are cached in memory for a few minutes and the Secret Manager client
+    is shared process-wide, see restaurant_finder.clients.
+
     Args:
         project_id: The Google Cloud project ID.
         secret_id: The Secret Manager secret ID.
@@ -65,48 +98,40 @@ def access_secret_version(project_id, secret_id, version_id="latest"):
     Returns:
         The secret value.
     """
-
-    # Create the Secret Manager client.
-    client = secretmanager.SecretManagerServiceClient()
-
-    # Build the resource name of the secret version.
-    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-
-    # Access the secret version.
-    response = client.access_secret_version(request={"name": name})
-
-    # Return the decoded secret value.
-    return response.payload.data.decode("UTF-8")
+    return get_secret(project_id, secret_id, version_id=version_id)
 
 
 
 def get_bucket_name(project_id, version_id="latest"):
-
-    # Create the Secret Manager client.
-    client = secretmanager.SecretManagerServiceClient()
-    name = f"projects/{project_id}/secrets/{RESTAURANT_BUCKET_NAME_SECRET_ID}/versions/{version_id}"
-    response = client.access_secret_version(request={"name": name})
-    return response.payload.data.decode("UTF-8")
+    return get_secret(project_id, RESTAURANT_BUCKET_NAME_SECRET_ID, version_id=version_id)
 
 
 def get_coordinates(project_id, maps_zone_name, version_id="latest"):
 
-    # Create the Secret Manager client.
-    client = secretmanager.SecretManagerServiceClient()
-
     zone = maps_zone_name
 
     top_lef_secret_name = f'{zone}{COORDINATES_TOP_LEFT_SUFFIX}'
     bottom_right_secret_name = f'{zone}{COORDINATES_BOTTOM_RIGHT_SUFFIX}'
 
-    top_left = f"projects/{project_id}/secrets/{top_lef_secret_name}/versions/{version_id}"
-    bottom_right = f"projects/{project_id}/secrets/{bottom_right_secret_name}/versions/{version_id}"
-
+    return (get_secret(project_id, top_lef_secret_name, version_id=version_id),
+            get_secret(project_id, bottom_right_secret_name, version_id=version_id))
 
-    top_left_response = client.access_secret_version(request={"name": top_left})
-    bottom_right_response = client.access_secret_version(request={"name": bottom_right})
 
+def get_latlong_from_zone(project_id, maps_zone_name, radius, version_id="latest"):
+    """
+    Plans a hexagonal grid of search circles over a zone's bounding box.
 
-    return top_left_response.payload.data.decode("UTF-8"), bottom_right_response.payload.data.decode("UTF-8")
+    The corners are read from Secret Manager with get_coordinates, in the
+    "(lat, long)" format parsed by string_to_tuple.
 
+    Args:
+        project_id: The Google Cloud project ID.
+        maps_zone_name: Name of the zone, the prefix of its corner secrets.
+        radius: Radius of each search circle in meters.
+        version_id: The Secret Manager secret version ID.
 
+    Returns:
+        A list of (latitude, longitude, radius) tuples.
+    """
+    top_left, bottom_right = get_coordinates(project_id, maps_zone_name, version_id=version_id)
+    return plan_hex_grid(string_to_tuple(top_left), string_to_tuple(bottom_right), radius)
@@ -1,45 +1,197 @@
 import streamlit as st
 import pandas as pd
 from google.cloud import bigquery
+from restaurant_finder.clients import get_bigquery_client, get_table_version
+from restaurant_finder.config import VIEWER_CACHE_MAX_ENTRIES, VIEWER_CACHE_TTL_SECONDS, VIEWER_METADATA_TTL_SECONDS
 from google.api_core.exceptions import NotFound, Forbidden
 
+DEFAULT_PAGE_SIZE = 100
+MAX_FILTERS = 5
+FILTER_OPERATORS = ["=", "!=", "<", "<=", ">", ">=", "LIKE", "IS NULL", "IS NOT NULL"]
+NULL_OPERATORS = {"IS NULL", "IS NOT NULL"}
+
+# Query parameter type for each column type that can be filtered on, and how to read the typed-in value
+PARAMETER_TYPES = {
+    "STRING": ("STRING", str),
+    "INTEGER": ("INT64", int),
+    "INT64": ("INT64", int),
+    "FLOAT": ("FLOAT64", float),
+    "FLOAT64": ("FLOAT64", float),
+    "NUMERIC": ("NUMERIC", str),
+    "BOOLEAN": ("BOOL", lambda value: value.strip().lower() in ("true", "1", "yes")),
+    "BOOL": ("BOOL", lambda value: value.strip().lower() in ("true", "1", "yes")),
+    "DATE": ("DATE", str),
+    "DATETIME": ("DATETIME", str),
+    "TIMESTAMP": ("TIMESTAMP", str),
+}
+
+
+def filterable_fields(schema):
+    """
+    Top-level, non-repeated columns whose type can be passed as a query parameter.
+    """
+    return [field for field in schema if field.mode != "REPEATED" and field.field_type in PARAMETER_TYPES]
+
+
+def build_page_query(table_id, schema, columns, filters, page, page_size, order_by=None):
+    """
+    Builds a parameterized query for one page of a filtered table.
+
+    Column names are checked against the table schema, and filter values are
+    passed as query parameters, so nothing typed in the UI ends up in the SQL text.
+
+    Args:
+        table_id: Fully qualified table ID, project.dataset.table.
+        schema: The table's list of SchemaField.
+        columns: Names of the columns to select.
+        filters: List of (column, operator, value) tuples, ANDed together. value is ignored for IS [NOT] NULL.
+        page: Zero-based page number.
+        page_size: Rows per page.
+        order_by: Column to sort by, so pages are stable across queries, or None.
+
+    Returns:
+        A tuple (sql, query_parameters).
+    """
+    fields = {field.name: field for field in schema}
+    for name in list(columns) + [column for column, _, _ in filters] + ([order_by] if order_by else []):
+        if name not in fields:
+            raise ValueError(f"Unknown column: {name}")
+
+    conditions = []
+    parameters = []
+    for i, (column, operator, value) in enumerate(filters):
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Unsupported operator: {operator}")
+        if operator in NULL_OPERATORS:
+            conditions.append(f"`{column}` {operator}")
+            continue
+        parameter_type, parse = PARAMETER_TYPES[fields[column].field_type]
+        conditions.append(f"`{column}` {operator} @filter_{i}")
+        parameters.append(bigquery.ScalarQueryParameter(f"filter_{i}", parameter_type, parse(value)))
+
+    sql = f"SELECT {', '.join(f'`{column}`' for column in columns)} FROM `{table_id}`"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if order_by:
+        sql += f" ORDER BY `{order_by}`"
+    sql += " LIMIT @page_size OFFSET @page_offset"
+    parameters += [bigquery.ScalarQueryParameter("page_size", "INT64", page_size),
+                   bigquery.ScalarQueryParameter("page_offset", "INT64", page * page_size)]
+    return sql, parameters
+
+
+def read_page(client, table, columns, filters, page, page_size, order_by=None):
+    """
+    Reads one page of a table as an Arrow table, with only the selected columns.
+
+    Without filters or ordering, a page of a plain table is read straight from
+    it with list_rows, which scans (and bills) nothing. Views, materialized views
+    and external tables cannot be listed that way, so they, and every filtered or
+    ordered page, are read with a parameterized query of just the page, whose
+    result is downloaded through the BigQuery Storage Read API when it is large
+    enough to benefit.
+    """
+    if not filters and not order_by and table.table_type == "TABLE":
+        selected_fields = [field for field in table.schema if field.name in columns]
+        # The Storage Read API cannot start at an offset, so these pages come from the REST endpoint
+        rows = client.list_rows(table, selected_fields=selected_fields,
+                                start_index=page * page_size, max_results=page_size)
+        return rows.to_arrow(create_bqstorage_client=False)
+
+    sql, parameters = build_page_query(f"{table.project}.{table.dataset_id}.{table.table_id}", table.schema,
+                                       columns, filters, page, page_size, order_by)
+    query_job = client.query(sql, job_config=bigquery.QueryJobConfig(query_parameters=parameters))
+    return query_job.result().to_arrow(create_bqstorage_client=True)
+
+
+@st.cache_resource
+def _viewer_client():
+    return get_bigquery_client()
+
+
+@st.cache_data(ttl=VIEWER_METADATA_TTL_SECONDS, max_entries=VIEWER_CACHE_MAX_ENTRIES, show_spinner=False)
+def _table_metadata(table_id, version):
+    # Plain dict, so Streamlit can keep it; rebuilt with bigquery.Table.from_api_repr
+    return _viewer_client().get_table(table_id).to_api_repr()
+
+
+@st.cache_data(ttl=VIEWER_CACHE_TTL_SECONDS, max_entries=VIEWER_CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_page(table_id, columns, filters, page, page_size, order_by, modified, version):
+    """
+    One page of a table as a DataFrame, cached by everything that decides its rows.
+
+    modified is the table's last modification time and version the number of
+    writes this process has made to it (see clients.bump_table_version), so a
+    page is read again as soon as the table changes.
+    """
+    table = bigquery.Table.from_api_repr(_table_metadata(table_id, version))
+    return read_page(_viewer_client(), table, list(columns), list(filters), page, page_size, order_by).to_pandas()
+
+
+def _filter_inputs(schema):
+    fields = filterable_fields(schema)
+    if not fields:
+        return []
+    filters = []
+    n_filters = st.number_input("Number of filters", min_value=0, max_value=MAX_FILTERS, value=0, step=1)
+    for i in range(int(n_filters)):
+        column_col, operator_col, value_col = st.columns(3)
+        column = column_col.selectbox("Column", [field.name for field in fields], key=f"bq_filter_column_{i}")
+        operator = operator_col.selectbox("Operator", FILTER_OPERATORS, key=f"bq_filter_operator_{i}")
+        value = value_col.text_input("Value", key=f"bq_filter_value_{i}", disabled=operator in NULL_OPERATORS)
+        filters.append((column, operator, value))
+    return filters
+
+
 def display_bq_table():
     st.title("BigQuery Table Viewer")
 
     bq_uri = st.text_input("Enter BigQuery Table URI (e.g., project_id.dataset_id.table_id)", "")
-    load_button = st.button("Load Table")
-
-    if load_button and bq_uri:
-        try:
-            if len(bq_uri.split('.')) != 3:
-                st.error("Invalid BigQuery URI format. Please use 'project_id.dataset_id.table_id'")
-                return
-
-            client = bigquery.Client()
-            table_ref = client.get_table(bq_uri) # Try to get table to check existence and basic permissions
-
-            st.info(f"Fetching table: {bq_uri}")
-            
-            # Construct the query
-            query = f"SELECT * FROM `{bq_uri}`" # Use backticks for safety with special characters in names
-            
-            # Execute the query
-            query_job = client.query(query)
-            
-            # Convert to Pandas DataFrame
-            df = query_job.to_dataframe()
-            
-            st.success(f"Successfully loaded table: {bq_uri}")
+    if not bq_uri:
+        st.info("Enter a BigQuery Table URI to choose its columns and filters.")
+        return
+    if len(bq_uri.split('.')) != 3:
+        st.error("Invalid BigQuery URI format. Please use 'project_id.dataset_id.table_id'")
+        return
+
+    try:
+        # Metadata only: checks existence and permissions, and gives the schema and modified time
+        version = get_table_version(bq_uri)
+        table = bigquery.Table.from_api_repr(_table_metadata(bq_uri, version))
+
+        column_names = [field.name for field in table.schema]
+        columns = st.multiselect("Columns", column_names, default=column_names)
+        page_size = int(st.number_input("Rows per page", min_value=1, max_value=10000, value=DEFAULT_PAGE_SIZE, step=1))
+        filters = _filter_inputs(table.schema)
+        order_by = st.selectbox("Order by", [None] + column_names,
+                                format_func=lambda name: "(table order)" if name is None else name)
+        page = int(st.number_input("Page", min_value=1, value=1, step=1)) - 1
+
+        if not columns:
+            st.warning("Select at least one column.")
+            return
+        if not filters and table.num_rows is not None:
+            st.caption(f"{table.num_rows} rows, {max(1, -(-table.num_rows // page_size))} pages")
+
+        if st.button("Load Table"):
+            st.info(f"Fetching page {page + 1} of: {bq_uri}")
+            # Repeat views of an unchanged table are served from the cache without touching BigQuery
+            modified = table.modified.isoformat() if table.modified else None
+            df = _cached_page(bq_uri, tuple(columns), tuple(filters), page, page_size, order_by, modified, version)
+
+            st.success(f"Successfully loaded {len(df)} rows of table: {bq_uri}")
             st.dataframe(df)
+            if len(df) < page_size:
+                st.caption("This is the last page.")
 
-        except Forbidden:
-            st.error(f"Permission denied for table: {bq_uri}. Ensure you have the necessary BigQuery permissions (e.g., BigQuery Data Viewer role).")
-        except NotFound:
-            st.error(f"Table not found: {bq_uri}. Please check the Project ID, Dataset ID, and Table ID.")
-        except Exception as e:
-            st.error(f"An error occurred: {e}")
-    elif load_button and not bq_uri:
-        st.warning("Please enter a BigQuery Table URI.")
+    except Forbidden:
+        st.error(f"Permission denied for table: {bq_uri}. Ensure you have the necessary BigQuery permissions (e.g., BigQuery Data Viewer role).")
+    except NotFound:
+        st.error(f"Table not found: {bq_uri}. Please check the Project ID, Dataset ID, and Table ID.")
+    except ValueError as e:
+        st.error(f"Invalid filter: {e}")
+    except Exception as e:
+        st.error(f"An error occurred: {e}")
 
 if __name__ == "__main__":
     # This allows the page to be run independently for testing if needed,
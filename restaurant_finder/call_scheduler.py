@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import Counter
+
+from restaurant_finder.config import DEFAULT_CALLS_PER_MINUTE
+
+# Stages of a crawl, in the order their cells are dispatched when both are waiting.
+# Refining a cell already known to be dense is worth more than a fresh grid point.
+STAGE_REFINEMENT = 'refinement'
+STAGE_GRID = 'grid'
+STAGE_PRIORITIES = {STAGE_REFINEMENT: 0, STAGE_GRID: 1}
+
+
+class CallScheduler:
+    """
+    Gate in front of every billed Places API call.
+
+    Enforces a hard budget on the number of calls in a run and a token-bucket
+    rate limit matching the Places quota, and counts the calls spent per stage.
+    Cache hits never reach the scheduler, so they are free on both counts.
+    The dispatch order between stages is decided by the crawl engine using
+    STAGE_PRIORITIES. A single instance can be shared between threads.
+
+    Runs going on at the same time share the project's quota: give each run its
+    own scheduler, for its own budget and counts, with shared_rate set to one
+    scheduler common to all of them, whose token bucket they all wait on.
+    """
+
+    def __init__(self, max_calls=None, calls_per_minute=DEFAULT_CALLS_PER_MINUTE, burst=None, shared_rate=None):
+        self.max_calls = max_calls if max_calls else None
+        self.shared_rate = shared_rate
+        self.rate = float(calls_per_minute) / 60
+        # By default allow up to one second's worth of calls to go out at once
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+
+        self.calls_by_stage = Counter()
+        self.refused_by_stage = Counter()
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def calls_spent(self):
+        return sum(self.calls_by_stage.values())
+
+    def budget_left(self):
+        if self.max_calls is None:
+            return None
+        return max(0, self.max_calls - self.calls_spent)
+
+    def acquire(self, stage=STAGE_GRID):
+        """
+        Reserves one call from the budget and waits for a rate-limit token.
+
+        Returns:
+            True if the call may go ahead, False if the budget is spent.
+        """
+        with self._lock:
+            if self.max_calls is not None and self.calls_spent >= self.max_calls:
+                self.refused_by_stage[stage] += 1
+                return False
+            self.calls_by_stage[stage] += 1
+        self.wait_for_token()
+        return True
+
+    def wait_for_token(self):
+        """
+        Blocks until the token bucket allows another request. Used directly for
+        retries, which take a rate-limit token but not a budget slot.
+        """
+        if self.shared_rate is not None:
+            self.shared_rate.wait_for_token()
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def report(self):
+        print(f'API calls spent: {self.calls_spent}'
+              + (f' of a budget of {self.max_calls}' if self.max_calls is not None else ''))
+        for stage, calls in sorted(self.calls_by_stage.items()):
+            print(f'  {stage}: {calls} calls')
+        for stage, refused in sorted(self.refused_by_stage.items()):
+            print(f'  {stage}: {refused} calls skipped, budget exhausted')
@@ -0,0 +1,139 @@
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+import fsspec
+
+from restaurant_finder.config import CHECKPOINT_EVERY, CHECKPOINT_LOCATION
+from restaurant_finder.records import Restaurant, records_to_json
+
+
+def new_run_id():
+    return datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+def _cell(values):
+    # Cells saved before they carried a type partition search all included types
+    return tuple(values) + (None,) * (5 - len(values))
+
+
+class CrawlCheckpoint:
+    """
+    Append-only log of one crawl run, so it can be resumed after a crash.
+
+    The log starts with the cells of the grid. Then, for every searched cell,
+    it holds the places harvested from it, whether it was saturated and the
+    child cells it queued. Records are buffered and written out every `every`
+    cells as a new segment under <location>/<run_id>/, so each write costs only
+    the records since the last one. load replays the segments to rebuild the
+    cells still to search (the grid and the children, minus the cells searched),
+    the searched and saturated cells and the restaurants found so far. The
+    location can be a local directory or a gs:// prefix.
+
+    Cells are stored before noise is applied; the noise is seeded by the cell,
+    so a resumed run searches exactly the same coordinates.
+    """
+
+    def __init__(self, run_id, location=CHECKPOINT_LOCATION, every=CHECKPOINT_EVERY):
+        self.run_id = run_id
+        self.location = location
+        self.every = max(1, int(every))
+        self.path = f"{location.rstrip('/')}/{run_id}"
+
+        self.resumed = False
+        self.complete = False
+        self.pending = []
+        self.processed = []
+        self.saturated_list = []
+        self.restaurants = {}
+        self._buffer = []
+        self._segments = 0
+
+    @classmethod
+    def load(cls, run_id, location=CHECKPOINT_LOCATION, every=CHECKPOINT_EVERY):
+        checkpoint = cls(run_id, location=location, every=every)
+        fs, root = fsspec.core.url_to_fs(checkpoint.path)
+        segments = sorted(fs.glob(f"{root}/*.jsonl"))
+        if not segments:
+            raise FileNotFoundError(f"No checkpoint found at {checkpoint.path}")
+
+        pending = Counter()
+        for segment in segments:
+            with fs.open(segment, 'r') as f:
+                for line in f:
+                    checkpoint._replay(json.loads(line), pending)
+        checkpoint._segments = len(segments)
+        checkpoint.resumed = True
+        checkpoint.pending = list(pending.elements())
+        print(f"Resuming run {run_id}: {len(checkpoint.processed)} cells done, "
+              f"{len(checkpoint.pending)} pending, {len(checkpoint.restaurants)} restaurants")
+        return checkpoint
+
+    def _replay(self, record, pending):
+        if 'grid' in record:
+            pending.update(_cell(cell) for cell in record['grid'])
+        elif 'cell' in record:
+            cell = _cell(record['cell'])
+            pending[cell] -= 1
+            if pending[cell] <= 0:
+                del pending[cell]
+            pending.update(_cell(child) for child in record['children'])
+            self.processed.append(cell)
+            if record['saturated'] is not None:
+                self.saturated_list.append(tuple(record['saturated']))
+            for restaurant_id, restaurant_data in record['places'].items():
+                self.restaurants[restaurant_id] = Restaurant.from_dict(restaurant_data)
+        elif 'complete' in record:
+            self.complete = record['complete']
+
+    def start(self, cells):
+        """
+        Logs the cells of the grid a new run starts from.
+        """
+        self._buffer.append({'grid': list(cells)})
+        self.save()
+
+    def record_cell(self, cell, places, saturated=None, children=()):
+        """
+        Logs one searched cell and writes the buffer out every `every` cells.
+
+        Args:
+            cell: The cell as planned, (lat, long, radius, depth, partition).
+            places: Dict of the Restaurant records harvested from the cell's response.
+            saturated: The (lat, long, radius) searched if the response was saturated, else None.
+            children: Cells queued to refine this one.
+        """
+        self.processed.append(cell)
+        if saturated is not None:
+            self.saturated_list.append(saturated)
+        self._buffer.append({'cell': cell, 'places': places, 'saturated': saturated, 'children': list(children)})
+        if len(self._buffer) >= self.every:
+            self.save()
+
+    def finish(self, complete):
+        """
+        Logs the end of a run; complete is False when cells were left unsearched.
+        """
+        self.complete = complete
+        self._buffer.append({'complete': complete, 'updated_at': datetime.now().isoformat()})
+        self.save()
+
+    def save(self):
+        if not self._buffer:
+            return
+        lines = ''.join(json.dumps(record, default=records_to_json) + '\n' for record in self._buffer)
+        segment_path = f"{self.path}/{self._segments:08d}.jsonl"
+        if '://' in self.location:
+            # Object uploads replace the blob in one go
+            with fsspec.open(segment_path, 'w') as f:
+                f.write(lines)
+        else:
+            # Write next to the target and rename, so a crash never leaves a truncated segment
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = segment_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(lines)
+            os.replace(tmp_path, segment_path)
+        self._segments += 1
+        self._buffer = []
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from google.cloud import bigquery
+from google.cloud import secretmanager
+from google.cloud import storage
+
+from restaurant_finder.config import SECRET_CACHE_TTL_SECONDS
+
+# Process-wide registry of Google Cloud clients and secret values.
+# Clients are created on first use and then shared by every module; in the
+# Streamlit app they survive reruns because this module is imported only once.
+_lock = threading.Lock()
+_clients = {}
+_secrets = {}
+_table_versions = {}
+
+
+def _get_client(key, factory):
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+
+def get_secret_manager_client():
+    return _get_client(('secretmanager',), secretmanager.SecretManagerServiceClient)
+
+
+def get_storage_client():
+    return _get_client(('storage',), storage.Client)
+
+
+def get_bigquery_client(project_id=None):
+    return _get_client(('bigquery', project_id), lambda: bigquery.Client(project=project_id))
+
+
+def get_secret(project_id, secret_id, version_id="latest", ttl_seconds=SECRET_CACHE_TTL_SECONDS):
+    """
+    Returns a secret value, served from memory for ttl_seconds after it was fetched.
+
+    Args:
+        project_id: The Google Cloud project ID.
+        secret_id: The Secret Manager secret ID.
+        version_id: The Secret Manager secret version ID.
+        ttl_seconds: How long a fetched value is reused.
+
+    Returns:
+        The decoded secret value.
+    """
+    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
+
+    cached = _secrets.get(name)
+    if cached is not None and time.monotonic() - cached[0] < ttl_seconds:
+        return cached[1]
+
+    response = get_secret_manager_client().access_secret_version(request={"name": name})
+    value = response.payload.data.decode("UTF-8")
+    with _lock:
+        _secrets[name] = (time.monotonic(), value)
+    return value
+
+
+def get_table_version(table_id):
+    """
+    Number of times this process has written the BigQuery table, used to key caches of its contents.
+    """
+    return _table_versions.get(table_id, 0)
+
+
+def bump_table_version(table_id):
+    """
+    Marks a BigQuery table as written, so cached reads of it are not served again.
+    Writers call this after each write; the table's modified time covers writes from other processes.
+    """
+    with _lock:
+        _table_versions[table_id] = _table_versions.get(table_id, 0) + 1
+
+
+def clear_cache():
+    """
+    Drops every cached client and secret, e.g. after credentials change or between tests.
+    """
+    with _lock:
+        _clients.clear()
+        _secrets.clear()
@@ -1,3 +1,5 @@
+import os
+
     # "includedPrimaryTypes": ["afghani_restaurant", "african_restaurant", "american_restaurant", "asian_restaurant",
     #     "barbecue_restaurant", "brazilian_restaurant", "buffet_restaurant", "chinese_restaurant", "french_restaurant",
     #     "greek_restaurant", "hamburger_restaurant", "indian_restaurant", "indonesian_restaurant", "italian_restaurant",
@@ -25,6 +27,21 @@ INCLUDED_PRIMARY_TYPES = ["afghani_restaurant", "african_restaurant", "american_
         "spanish_restaurant", "steak_house", "sushi_restaurant", "thai_restaurant", 
         "turkish_restaurant", "vegetarian_restaurant", "vietnamese_restaurant"]
 
+# Disjoint groups of INCLUDED_PRIMARY_TYPES. A saturated circle can be searched again once per
+# group instead of being split into smaller circles.
+PRIMARY_TYPE_PARTITIONS = {
+    "asian": ["asian_restaurant", "chinese_restaurant", "indian_restaurant", "indonesian_restaurant",
+        "japanese_restaurant", "korean_restaurant", "ramen_restaurant", "sushi_restaurant", "thai_restaurant",
+        "vietnamese_restaurant"],
+    "european": ["french_restaurant", "greek_restaurant", "italian_restaurant", "mediterranean_restaurant",
+        "pizza_restaurant", "spanish_restaurant"],
+    "americas": ["american_restaurant", "barbecue_restaurant", "brazilian_restaurant", "hamburger_restaurant",
+        "mexican_restaurant", "steak_house"],
+    "middle_eastern_and_african": ["afghani_restaurant", "african_restaurant", "lebanese_restaurant",
+        "middle_eastern_restaurant", "turkish_restaurant"],
+    "other": ["buffet_restaurant", "restaurant", "seafood_restaurant", "vegetarian_restaurant"],
+}
+
 EXCLUDED_PRIMARY_TYPES = ["acai_shop", "bagel_shop", "bakery", "bar", "bar_and_grill", "breakfast_restaurant",
         "brunch_restaurant", "cafe", "cafeteria", "candy_store", "cat_cafe", "chocolate_factory", "chocolate_shop", "coffee_shop",
         "confectionery", "deli", "dessert_restaurant", "dessert_shop", "dog_cafe", "donut_shop", "fast_food_restaurant",
@@ -38,9 +55,91 @@ EXCLUDED_TYPES = ["acai_shop", "bagel_shop", "bakery", "bar", "candy_store", "ca
 
 BIGQUERY_DATASET_ID = "restaurants_dataset"
 BIGQUERY_TABLE_ID = "restaurants_table"
+BIGQUERY_STAGING_TABLE_ID = "restaurants_table_staging"
+# Where a restaurants table from before partitioning is rebuilt, before it is swapped in
+BIGQUERY_LAYOUT_TABLE_ID = "restaurants_table_partitioned"
+# The restaurants table is partitioned by day on first_seen and clustered on these columns,
+# so queries for recent openings read only the recent partitions
+BIGQUERY_PARTITION_FIELD = "first_seen"
+BIGQUERY_CLUSTERING_FIELDS = ["primary_type", "user_rating_count"]
+# View of the restaurants first seen in the last NEW_RESTAURANTS_DAYS days, queried by the Streamlit app
+BIGQUERY_NEW_RESTAURANTS_VIEW_ID = "new_restaurants_view"
+NEW_RESTAURANTS_DAYS = 60
+# "incremental" merges only new and changed rows; "full" drops and reloads the table
+BQ_SYNC_MODE = "incremental"
+# Rows per BigQuery load job when writing the restaurants table
+BQ_LOAD_CHUNK_ROWS = 50000
 
 # Secret Manager Secret IDs
 MAPS_API_KEY_SECRET_ID = "maps-key"
 RESTAURANT_BUCKET_NAME_SECRET_ID = "restaurant_bucket_name"
 COORDINATES_TOP_LEFT_SUFFIX = "_top_left"
 COORDINATES_BOTTOM_RIGHT_SUFFIX = "_bottom_right"
+
+# Number of Places API calls allowed in flight at once during a crawl
+DEFAULT_MAX_WORKERS = 8
+
+# Saturated cells are subdivided until their children would be smaller than this (meters)
+DEFAULT_MIN_RADIUS = 50
+
+# Starting circles with at least this share of their area inside other starting circles are dropped
+DEFAULT_OVERLAP_THRESHOLD = 0.8
+
+# Local cache of Places API responses
+PLACES_CACHE_PATH = os.environ.get(
+    'PLACES_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'restaurant_finder', 'places_cache.sqlite'))
+DEFAULT_CACHE_TTL_HOURS = 24 * 7
+DEFAULT_CACHE_MAX_ENTRIES = 200000
+# Decimal places kept from lat/long when building cache keys (5 is roughly 1 meter)
+CACHE_LATLONG_RESOLUTION = 5
+
+# Rows read at a time from grid CSV files
+GRID_CSV_CHUNKSIZE = 500000
+
+# Secret values are re-fetched from Secret Manager after this many seconds
+SECRET_CACHE_TTL_SECONDS = 600
+
+# BigQuery Table Viewer caches: table metadata is re-read after a minute, so a
+# table changed elsewhere shows up quickly; pages are kept for an hour, at most
+# VIEWER_CACHE_MAX_ENTRIES of them
+VIEWER_METADATA_TTL_SECONDS = 60
+VIEWER_CACHE_TTL_SECONDS = 3600
+VIEWER_CACHE_MAX_ENTRIES = 50
+
+# Places API quota: calls per minute allowed for searchNearby
+DEFAULT_CALLS_PER_MINUTE = 600
+# Retries for calls rejected with HTTP 429 (quota exceeded)
+MAX_RATE_LIMIT_RETRIES = 3
+
+# Where crawl checkpoints are written: a local directory or a gs:// prefix
+CHECKPOINT_LOCATION = os.environ.get('CHECKPOINT_LOCATION', '.crawl_checkpoints')
+# Completed calls between two checkpoint writes
+CHECKPOINT_EVERY = 50
+
+# Background crawl jobs started from the Streamlit app: how many run at once,
+# where their state and results are kept (a local directory or a gs:// prefix),
+# how often running jobs write their progress there, and how often the app polls them
+JOB_WORKERS = 2
+JOB_LOCATION = os.environ.get('JOB_LOCATION', '.crawl_jobs')
+JOB_PROGRESS_SAVE_SECONDS = 30
+JOB_POLL_SECONDS = 2
+
+# Master store of every restaurant seen, in the restaurant bucket: base snapshots plus per-run deltas
+RESTAURANT_STORE_PREFIX = "restaurant_store"
+# Single-file stores from earlier versions, migrated into the first base snapshot
+LEGACY_RESTAURANT_STORE_PARQUET_BLOB = "restaurants.parquet"
+LEGACY_RESTAURANT_STORE_BLOB = "restaurants.json"
+# A new base snapshot is written once this many deltas have been appended since the last one
+STORE_COMPACT_AFTER_DELTAS = 20
+
+# Density map of known places per geohash cell, kept next to the master store
+DENSITY_MAP_BLOB = f"{RESTAURANT_STORE_PREFIX}/density_map.parquet"
+# Geohash length of a density map cell (6 is roughly 1.2 km x 0.6 km)
+DENSITY_GEOHASH_PRECISION = 6
+# Places a starting circle is planned to hold, below the 20 that saturate a search
+DENSITY_TARGET_PLACES = 15
+# Largest radius the Places API accepts for a search circle, in meters
+MAX_SEARCH_RADIUS = 50000
+# Most places a searchNearby call returns; a call that returns this many is saturated
+MAX_RESULTS_PER_SEARCH = 20
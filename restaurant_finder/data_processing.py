@@ -1,202 +1,1007 @@
+import heapq
+import io
+import itertools
 import json
+import sys
+import tempfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+import numpy as np
 import pandas as pd
-from google.cloud import storage
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
 
 from restaurant_finder.aux_functions import access_secret_version
-from restaurant_finder.maps_call import send_request
+from restaurant_finder.call_scheduler import STAGE_GRID, STAGE_PRIORITIES, STAGE_REFINEMENT
+from restaurant_finder.clients import bump_table_version, get_bigquery_client, get_storage_client
+from restaurant_finder.geo_functions import haversine_distance
+from restaurant_finder.maps_call import PlacesClient
+from restaurant_finder.records import Restaurant, intern_value
 from restaurant_finder.config import (
+    BIGQUERY_CLUSTERING_FIELDS,
     BIGQUERY_DATASET_ID,
+    BIGQUERY_LAYOUT_TABLE_ID,
+    BIGQUERY_NEW_RESTAURANTS_VIEW_ID,
+    BIGQUERY_PARTITION_FIELD,
+    BIGQUERY_STAGING_TABLE_ID,
     BIGQUERY_TABLE_ID,
+    BQ_LOAD_CHUNK_ROWS,
+    BQ_SYNC_MODE,
+    LEGACY_RESTAURANT_STORE_BLOB,
+    LEGACY_RESTAURANT_STORE_PARQUET_BLOB,
+    RESTAURANT_STORE_PREFIX,
+    STORE_COMPACT_AFTER_DELTAS,
     MAPS_API_KEY_SECRET_ID,
+    MAX_RESULTS_PER_SEARCH,
+    NEW_RESTAURANTS_DAYS,
+    PRIMARY_TYPE_PARTITIONS,
 )
 
 
 
-def iterate_over_calls(lat_long_pairs, restaurants, project_id, amount_of_noise):
-    import numpy as np
+def cell_noise(lat, long, amount_of_noise):
+    """
+    Returns the (lat, long) jitter for a grid point.
 
+    The noise is drawn from a generator seeded by the point itself, so a grid point
+    is always searched at the same place and re-runs can be served from the cache.
+    """
+    seed = zlib.crc32(f'{lat:.6f},{long:.6f}'.encode('utf-8'))
+    lat_noise, long_noise = np.random.default_rng(seed).normal(0, amount_of_noise, size=2)
+    return float(lat_noise), float(long_noise)
+
+
+def jitter_grid(lat_long_pairs, amount_of_noise):
+    """
+    Applies cell_noise to every (lat, long, radius) grid point up front, so the
+    circles can be planned around the places that will actually be searched.
+    """
+    if not amount_of_noise:
+        return list(lat_long_pairs)
+    jittered = []
+    for lat, long, radius in lat_long_pairs:
+        lat_noise, long_noise = cell_noise(lat, long, amount_of_noise)
+        jittered.append((lat + lat_noise, long + long_noise, radius))
+    return jittered
+
+
+def covered_radius(lat, long, radius, places):
+    """
+    Radius of the disc around a searched point that a saturated response fully covers.
+
+    Results are ranked by DISTANCE, so no place is closer than the 20th result
+    without being among the 20. Returns 0 when the results carry no location.
+    """
+    location = places[-1].get('location')
+    if not location:
+        return 0.0
+    distance = haversine_distance(lat, long, location['latitude'], location['longitude'])
+    return float(min(distance, radius))
+
+
+def iterate_over_calls(lat_long_pairs, restaurants, project_id, amount_of_noise,
+                       max_workers=1, expand_saturated=None, cache=None, scheduler=None,
+                       checkpoint=None, progress=None):
+    """
+    Calls the Places API for every (lat, long, radius) cell and merges the results.
+
+    Up to max_workers requests are in flight at once. Responses are merged on the
+    calling thread, so restaurants and saturated_list need no locking. Waiting
+    refinement cells are dispatched before waiting grid cells, deepest first.
+
+    Args:
+        lat_long_pairs: An iterable of (latitude, longitude, radius) tuples.
+        restaurants: The dict of Restaurant records to merge results into (keyed by place id).
+        project_id: The Google Cloud project ID.
+        amount_of_noise: Standard deviation of the noise added to each coordinate.
+        max_workers: Maximum number of concurrent API calls.
+        expand_saturated: Optional callable taking (lat, long, radius, depth, new_place_count,
+            proven_radius, partition, primary_types) of a saturated cell and returning new
+            cells to search, as (lat, long, radius) tuples that keep the cell's partition or
+            (lat, long, radius, partition) tuples. They are queued as soon as the saturated
+            cell is found, one level deeper. new_place_count is the number of place ids in
+            the response not found before, proven_radius is the radius of the disc around
+            the cell's centre known to hold no other places (see covered_radius), partition
+            is the PRIMARY_TYPE_PARTITIONS group the cell was searched for (None for all
+            INCLUDED_PRIMARY_TYPES) and primary_types are those of the places returned.
+        cache: Optional ResponseCache for Places API responses.
+        scheduler: Optional CallScheduler enforcing a call budget and rate limit.
+        checkpoint: Optional CrawlCheckpoint each searched cell is logged to as it goes.
+            If it was loaded from an earlier run, the crawl continues from its
+            pending cells and lat_long_pairs is ignored.
+        progress: Optional callable taking a dict of counts (cells_done, cells_pending,
+            places_found, saturated_cells, calls_spent), called on the calling thread
+            after each cell is searched.
+
+    Returns:
+        A tuple (restaurants, saturated_list).
+    """
     API_KEY = access_secret_version(project_id=project_id, secret_id=MAPS_API_KEY_SECRET_ID)
 
     saturated_list = []
+    processed = []
+    # Cells refused because the call budget ran out, or whose call failed; a resumed run picks them up again
+    skipped = []
+    failed = 0
     
     today = datetime.today()
-    formatted_date = today.strftime("%Y-%m-%d")
+    # One shared date string for every record of the run
+    formatted_date = sys.intern(today.strftime("%Y-%m-%d"))
 
     rank = "DISTANCE"  # Rank is always "DISTANCE", so set it directly
     print(f'starting the {rank} based analysis')
 
-    for lat, long, radius in lat_long_pairs:
-        lat_noise = np.random.normal(0, amount_of_noise)
-        lat = lat + lat_noise
-        long_noise = np.random.normal(0, amount_of_noise)
-        long = long + long_noise
-
-
-        response_json = send_request(lat, long, radius, rank, API_KEY)
-        if 'places' not in response_json:
-            print(str(lat) + str(long) +' had no results')
-        
-        else:
-            if len(response_json['places']) == 20:
-                print(str(lat) + str(long) +' had 20 results')
-
-                saturated_list.append((lat, long, radius))
-            else:
-                print(str(lat) + str(long) +' had 1-19 results')
-                for place in response_json['places']:
-                    restaurants[place['id']] = {
-                        'displayName': place['displayName']['text'],
-                        'shortFormattedAddress': place.get('shortFormattedAddress', 'NA'),
-                        'rating': place.get('rating', 0),
-                        'priceLevel': place.get('priceLevel', 'NA'),
-                        'last_seen': formatted_date,
-                        'primary_type': place.get('primaryType', 'NA'),
-                        'user_rating_count': place.get('userRatingCount', 0),
-                        'types': place.get('types', [])
-                    }
+    max_workers = max(1, int(max_workers))
+    # Each pending cell carries its expansion depth: 0 for the input grid, +1 per refinement,
+    # and the group of types it is searched for: None for all INCLUDED_PRIMARY_TYPES.
+    # The heap is ordered by (stage priority, -depth, insertion order).
+    pending = []
+    sequence = itertools.count()
+
+    def push(lat, long, radius, depth, partition=None):
+        stage = STAGE_GRID if depth == 0 else STAGE_REFINEMENT
+        heapq.heappush(pending, (STAGE_PRIORITIES[stage], -depth, next(sequence),
+                                 (lat, long, radius, depth, partition)))
+
+    if checkpoint is not None and checkpoint.resumed:
+        restaurants.update(checkpoint.restaurants)
+        saturated_list.extend(checkpoint.saturated_list)
+        processed.extend(checkpoint.processed)
+        for cell in checkpoint.pending:
+            push(*cell)
+    else:
+        for lat, long, radius in lat_long_pairs:
+            push(lat, long, radius, 0)
+        if checkpoint is not None:
+            checkpoint.start(entry[-1] for entry in pending)
+    # Maps each future to (cell as planned, searched lat, searched long)
+    in_flight = {}
+
+    def report_progress():
+        if progress is not None:
+            progress({'cells_done': len(processed),
+                      'cells_pending': len(pending) + len(in_flight),
+                      'places_found': len(restaurants),
+                      'saturated_cells': len(saturated_list),
+                      'calls_spent': scheduler.calls_spent if scheduler is not None else None})
+
+    with PlacesClient(API_KEY, pool_size=max_workers, cache=cache, scheduler=scheduler) as places_client, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or in_flight:
+            while pending and len(in_flight) < max_workers:
+                cell = heapq.heappop(pending)[-1]
+                lat, long, radius, depth, partition = cell
+                # Only the input grid is jittered; refined cells must stay where they tile their parent
+                if depth == 0:
+                    lat_noise, long_noise = cell_noise(lat, long, amount_of_noise)
+                    lat = lat + lat_noise
+                    long = long + long_noise
+
+                stage = STAGE_GRID if depth == 0 else STAGE_REFINEMENT
+                included_types = PRIMARY_TYPE_PARTITIONS[partition] if partition is not None else None
+                future = executor.submit(places_client.search_nearby, lat, long, radius, rank, stage,
+                                         included_types=included_types)
+                in_flight[future] = (cell, lat, long)
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                cell, lat, long = in_flight.pop(future)
+                _, _, radius, depth, partition = cell
+                response_json = future.result()
+
+                if response_json.get('budget_exhausted'):
+                    skipped.append(cell)
+                    continue
+                if 'error' in response_json:
+                    # Not a search: not logged as done, so it stays pending for --resume
+                    print(f"{lat}{long} failed: {response_json['error']}")
+                    skipped.append(cell)
+                    failed += 1
+                    continue
+
+                # Places and cells this response added, for the checkpoint log
+                harvested = {}
+                saturated = None
+                queued = []
+
+                if 'places' not in response_json:
+                    print(str(lat) + str(long) +' had no results')
+
+                elif len(response_json['places']) == MAX_RESULTS_PER_SEARCH:
+                    print(str(lat) + str(long) +' had 20 results' + (f' for {partition}' if partition else ''))
+                    places = response_json['places']
+                    saturated = (lat, long, radius)
+                    saturated_list.append(saturated)
+                    new_place_count = sum(1 for place in places if place['id'] not in restaurants)
+                    # The places of a saturated call are kept too; they were paid for like any other
+                    for place in places:
+                        harvested[place['id']] = Restaurant.from_place(place, formatted_date)
+                    if expand_saturated is not None:
+                        proven_radius = covered_radius(lat, long, radius, places)
+                        primary_types = [place.get('primaryType') for place in places]
+                        children = expand_saturated(lat, long, radius, depth, new_place_count, proven_radius,
+                                                    partition, primary_types)
+                        for child in children:
+                            queued.append((*child[:3], depth + 1, child[3] if len(child) > 3 else partition))
+                            push(*queued[-1])
+
+                else:
+                    print(str(lat) + str(long) +' had 1-19 results')
+                    for place in response_json['places']:
+                        harvested[place['id']] = Restaurant.from_place(place, formatted_date)
+
+                restaurants.update(harvested)
+                processed.append(cell)
+                if checkpoint is not None:
+                    checkpoint.record_cell(cell, harvested, saturated=saturated, children=queued)
+                report_progress()
+
+    if cache is not None:
+        print(f'Response cache: {cache.hits} hits, {cache.misses} misses')
+    if len(skipped) > failed:
+        print(f'{len(skipped) - failed} cells were skipped because the API call budget ran out')
+    if failed:
+        print(f'{failed} cells were not searched because their API call failed')
+    if checkpoint is not None:
+        # Skipped and failed cells stay pending in the log, so a resumed run searches them
+        checkpoint.finish(complete=not skipped)
+    report_progress()
 
     return restaurants, saturated_list
 
 
 
 
-def read_old_restaurants(bucket_name):
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob('restaurants.json')
-    json_string = blob.download_as_string().decode('utf-8')
-    data = json.loads(json_string)
-    return data
-
+# Columnar layout of the master store. Low-cardinality strings are dictionary
+# encoded and dates are stored as dates rather than strings.
+RESTAURANT_STORE_SCHEMA = pa.schema([
+    ('restaurant_id', pa.string()),
+    ('displayName', pa.string()),
+    ('shortFormattedAddress', pa.string()),
+    ('rating', pa.float64()),
+    ('priceLevel', pa.dictionary(pa.int32(), pa.string())),
+    ('last_seen', pa.date32()),
+    ('first_seen', pa.date32()),
+    ('primary_type', pa.dictionary(pa.int32(), pa.string())),
+    ('user_rating_count', pa.int64()),
+    ('types', pa.list_(pa.dictionary(pa.int32(), pa.string()))),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+])
+DATE_COLUMNS = ('last_seen', 'first_seen')
+
+
+def restaurants_to_table(restaurants):
+    """
+    Converts a dict of Restaurant records keyed by id into an Arrow table of RESTAURANT_STORE_SCHEMA.
+    """
+    columns = {'restaurant_id': list(restaurants.keys())}
+    values = list(restaurants.values())
+    for field in RESTAURANT_STORE_SCHEMA:
+        if field.name == 'restaurant_id':
+            continue
+        column = [getattr(restaurant, field.name) for restaurant in values]
+        if field.name in DATE_COLUMNS:
+            # Dates are kept as 'YYYY-MM-DD' strings in memory
+            columns[field.name] = pa.array(column, type=pa.string()).cast(pa.date32())
+        else:
+            columns[field.name] = pa.array(column, type=field.type)
+    return pa.table(columns, schema=RESTAURANT_STORE_SCHEMA)
+
+
+def _column_values(column):
+    """
+    Python values of an Arrow column. Dictionary values are converted once and
+    shared between rows, so repeated strings are stored only once in memory.
+    """
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    if pa.types.is_dictionary(column.type):
+        dictionary = [intern_value(value) for value in column.dictionary.to_pylist()]
+        return [None if index is None else dictionary[index] for index in column.indices.to_pylist()]
+    if pa.types.is_list(column.type) and pa.types.is_dictionary(column.type.value_type):
+        values = _column_values(column.values)
+        offsets = column.offsets.to_pylist()
+        valid = column.is_valid().to_pylist()
+        return [values[offsets[i]:offsets[i + 1]] if valid[i] else [] for i in range(len(column))]
+    return column.to_pylist()
+
+
+def table_to_restaurants(table):
+    """
+    Converts an Arrow table of RESTAURANT_STORE_SCHEMA back into a dict of Restaurant records keyed by id.
+    """
+    columns = {}
+    for name in RESTAURANT_STORE_SCHEMA.names:
+        column = table.column(name)
+        if name in DATE_COLUMNS:
+            column = column.cast(pa.string()).dictionary_encode()
+        columns[name] = _column_values(column)
+
+    restaurant_ids = columns.pop('restaurant_id')
+    return {restaurant_id: Restaurant(**dict(zip(columns.keys(), restaurant_values)))
+            for restaurant_id, restaurant_values in zip(restaurant_ids, zip(*columns.values()))}
+
+
+# The master store is an append-only log in the restaurant bucket:
+#   <RESTAURANT_STORE_PREFIX>/base/<run key>.parquet    compacted snapshots of every restaurant
+#   <RESTAURANT_STORE_PREFIX>/deltas/<run key>.parquet  restaurants new or updated in one run
+# Run keys are '%Y%m%d_%H%M%S_%f' timestamps, so they sort in time order, and runs
+# finishing in the same second still write separate deltas (keys written before the
+# microseconds were added sort just before the keys of the same second). A view of the
+# store at any time is the latest base before it plus the deltas written after that base.
+RUN_KEY_FORMAT = "%Y%m%d_%H%M%S_%f"
+DELTA_EXTRA_FIELDS = [
+    ('change', pa.dictionary(pa.int32(), pa.string())),
+    ('run_at', pa.timestamp('s')),
+]
+CHANGE_NEW = 'new'
+CHANGE_UPDATED = 'updated'
+
+
+def _run_key(moment):
+    if isinstance(moment, str):
+        return moment
+    return moment.strftime(RUN_KEY_FORMAT)
+
+
+def _list_store_blobs(bucket_name, kind):
+    """
+    Returns [(run_key, blob)] for the base snapshots or deltas, oldest first.
+    """
+    prefix = f"{RESTAURANT_STORE_PREFIX}/{kind}/"
+    blobs = get_storage_client().bucket(bucket_name).list_blobs(prefix=prefix)
+    entries = [(blob.name[len(prefix):-len('.parquet')], blob)
+               for blob in blobs if blob.name.endswith('.parquet')]
+    return sorted(entries, key=lambda entry: entry[0])
+
+
+def _upload_table(bucket_name, blob_name, table):
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression='zstd')
+    blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+    blob.upload_from_string(buffer.getvalue(), content_type='application/vnd.apache.parquet')
+
+
+def _download_table(blob):
+    return conform_to_store_schema(pq.read_table(io.BytesIO(blob.download_as_bytes())))
+
+
+def conform_to_store_schema(table):
+    """
+    Adds the store columns missing from tables written by older versions, filled with nulls.
+    """
+    for field in RESTAURANT_STORE_SCHEMA:
+        if field.name not in table.column_names:
+            table = table.append_column(field, pa.nulls(table.num_rows, type=field.type))
+    # Store columns first, then any extra columns such as those of a delta
+    extra_columns = [name for name in table.column_names if name not in RESTAURANT_STORE_SCHEMA.names]
+    return table.select(RESTAURANT_STORE_SCHEMA.names + extra_columns)
+
+
+def latest_per_restaurant(table):
+    """
+    Keeps only the last row of each restaurant_id, in table order.
+    """
+    if table.num_rows == 0:
+        return table
+    table = table.unify_dictionaries().combine_chunks()
+    order = pa.array(np.arange(table.num_rows))
+    last_rows = (table.select(['restaurant_id'])
+                 .append_column('_row', order)
+                 .group_by('restaurant_id')
+                 .aggregate([('_row', 'max')])
+                 .column('_row_max'))
+    return table.take(pc.take(last_rows, pc.sort_indices(last_rows)))
+
+
+def write_restaurant_store(bucket_name, restaurants, as_of=None):
+    """
+    Writes a full base snapshot of the store, keyed by as_of (default: now).
+    """
+    run_key = _run_key(as_of or datetime.now())
+    _upload_table(bucket_name, f"{RESTAURANT_STORE_PREFIX}/base/{run_key}.parquet",
+                  restaurants_to_table(restaurants))
+    return run_key
+
+
+def write_restaurant_delta(bucket_name, new_restaurants, updated_restaurants, run_at=None):
+    """
+    Appends one run's new and updated restaurants to the log.
+
+    Restaurants that were not seen in the run are not written: their last_seen
+    simply stays older than the run, so a delta is proportional to the churn.
+
+    Args:
+        bucket_name: The restaurant bucket.
+        new_restaurants: Arrow table of the restaurants found for the first time.
+        updated_restaurants: Arrow table of the known restaurants seen again.
+        run_at: Optional datetime of the run, defaults to now.
+    """
+    run_at = run_at or datetime.now()
+    run_key = _run_key(run_at)
+
+    table = pa.concat_tables([updated_restaurants.select(RESTAURANT_STORE_SCHEMA.names),
+                              new_restaurants.select(RESTAURANT_STORE_SCHEMA.names)]).unify_dictionaries()
+    change_codes = np.repeat(np.array([0, 1], dtype=np.int32),
+                             [updated_restaurants.num_rows, new_restaurants.num_rows])
+    changes = pa.DictionaryArray.from_arrays(pa.array(change_codes), pa.array([CHANGE_UPDATED, CHANGE_NEW]))
+    table = table.append_column(pa.field(*DELTA_EXTRA_FIELDS[0]), changes)
+    table = table.append_column(pa.field(*DELTA_EXTRA_FIELDS[1]),
+                                pa.repeat(pa.scalar(run_at.replace(microsecond=0), type=pa.timestamp('s')),
+                                          table.num_rows))
+
+    _upload_table(bucket_name, f"{RESTAURANT_STORE_PREFIX}/deltas/{run_key}.parquet", table)
+    print(f"Wrote delta {run_key}: {new_restaurants.num_rows} new, {updated_restaurants.num_rows} updated restaurants")
+    return run_key
+
+
+def migrate_json_store(bucket_name, force=False):
+    """
+    One-time migration of a legacy single-file master store into the first base snapshot.
+
+    restaurants.parquet is used if present, otherwise restaurants.json. The legacy
+    file is left in place as a backup.
+
+    Args:
+        bucket_name: The restaurant bucket.
+        force: Migrate even if the store already has a base snapshot. The legacy
+            file then becomes the latest base, hiding every delta written before it.
+
+    Returns:
+        The migrated store as an Arrow table (empty if there was nothing to migrate).
+
+    Raises:
+        ValueError: If the store already has a base snapshot and force is False.
+    """
+    bases = _list_store_blobs(bucket_name, 'base')
+    if bases and not force:
+        raise ValueError(f"The restaurant store already has base snapshot {bases[-1][0]}; "
+                         f"migrating again would hide every run since. Pass force=True (--force) to migrate anyway.")
+    bucket = get_storage_client().bucket(bucket_name)
+
+    parquet_blob = bucket.blob(LEGACY_RESTAURANT_STORE_PARQUET_BLOB)
+    json_blob = bucket.blob(LEGACY_RESTAURANT_STORE_BLOB)
+    if parquet_blob.exists():
+        source = LEGACY_RESTAURANT_STORE_PARQUET_BLOB
+        table = _download_table(parquet_blob)
+    elif json_blob.exists():
+        source = LEGACY_RESTAURANT_STORE_BLOB
+        json_string = json_blob.download_as_string().decode('utf-8')
+        restaurants = {restaurant_id: Restaurant.from_dict(restaurant_data)
+                       for restaurant_id, restaurant_data in json.loads(json_string).items()}
+        table = restaurants_to_table(restaurants)
+    else:
+        print("No restaurant store found; starting an empty one.")
+        return RESTAURANT_STORE_SCHEMA.empty_table()
+
+    run_key = _run_key(datetime.now())
+    _upload_table(bucket_name, f"{RESTAURANT_STORE_PREFIX}/base/{run_key}.parquet", table)
+    print(f"Migrated {table.num_rows} restaurants from {source} to base snapshot {run_key}")
+    return table
+
+
+def read_restaurant_store(bucket_name, as_of=None):
+    """
+    Returns the merged view of the store as an Arrow table of RESTAURANT_STORE_SCHEMA.
+
+    Args:
+        bucket_name: The restaurant bucket.
+        as_of: Optional datetime or run key; only snapshots and deltas written
+            up to that moment are included. Defaults to the latest state.
+    """
+    as_of_key = _run_key(as_of) if as_of is not None else None
+    bases = [(key, blob) for key, blob in _list_store_blobs(bucket_name, 'base')
+             if as_of_key is None or key <= as_of_key]
+
+    if bases:
+        base_key, base_blob = bases[-1]
+        base = _download_table(base_blob)
+    elif as_of_key is None:
+        base_key, base = '', migrate_json_store(bucket_name)
+    else:
+        base_key, base = '', RESTAURANT_STORE_SCHEMA.empty_table()
+
+    deltas = [_download_table(blob).select(RESTAURANT_STORE_SCHEMA.names)
+              for key, blob in _list_store_blobs(bucket_name, 'deltas')
+              if key > base_key and (as_of_key is None or key <= as_of_key)]
+    if not deltas:
+        return base
+    return latest_per_restaurant(pa.concat_tables([base] + deltas))
+
+
+def read_restaurant_changes(bucket_name, since, until=None, change=None):
+    """
+    Scans only the deltas written between since and until.
+
+    Args:
+        bucket_name: The restaurant bucket.
+        since: datetime or run key; deltas written from then on are read.
+        until: Optional datetime or run key bounding the scan.
+        change: Optional 'new' or 'updated' to keep only that kind of change.
+
+    Returns:
+        An Arrow table of the matching delta rows, with their change and run_at columns.
+    """
+    since_key = _run_key(since)
+    until_key = _run_key(until) if until is not None else None
+    tables = [_download_table(blob) for key, blob in _list_store_blobs(bucket_name, 'deltas')
+              if key >= since_key and (until_key is None or key <= until_key)]
+    if not tables:
+        return pa.schema(list(RESTAURANT_STORE_SCHEMA) + [pa.field(*field) for field in DELTA_EXTRA_FIELDS]).empty_table()
+
+    table = pa.concat_tables(tables).unify_dictionaries()
+    if change is not None:
+        table = table.filter(pc.equal(table.column('change').cast(pa.string()), change))
+    return table
+
+
+def compact_restaurant_store(bucket_name):
+    """
+    Folds every delta written since the latest base into a new base snapshot.
+
+    Deltas are kept, so point-in-time reads and change scans still work after compaction.
+    """
+    deltas = _list_store_blobs(bucket_name, 'deltas')
+    bases = _list_store_blobs(bucket_name, 'base')
+    if not deltas or (bases and deltas[-1][0] <= bases[-1][0]):
+        print("Restaurant store is already compacted.")
+        return
+
+    table = read_restaurant_store(bucket_name)
+    run_key = deltas[-1][0]
+    _upload_table(bucket_name, f"{RESTAURANT_STORE_PREFIX}/base/{run_key}.parquet", table)
+    print(f"Compacted restaurant store into base snapshot {run_key} ({table.num_rows} restaurants)")
+
+
+def deltas_since_last_base(bucket_name):
+    bases = _list_store_blobs(bucket_name, 'base')
+    base_key = bases[-1][0] if bases else ''
+    return sum(1 for key, _ in _list_store_blobs(bucket_name, 'deltas') if key > base_key)
 
 
-def upload_restaurants_to_bigquery(concatenated_dict, project_id):
-    client = bigquery.Client(project=project_id)
+def read_old_restaurants(bucket_name):
+    return table_to_restaurants(read_restaurant_store(bucket_name))
+
+
+
+RESTAURANTS_SCHEMA = [
+    bigquery.SchemaField("restaurant_id", "STRING", mode="REQUIRED", description="Unique identifier for the restaurant"),
+    bigquery.SchemaField("displayName", "STRING", mode="NULLABLE", description="Name of the restaurant"),
+    bigquery.SchemaField("shortFormattedAddress", "STRING", mode="NULLABLE", description= "Address of the restaurant"),
+    bigquery.SchemaField("rating", "FLOAT", mode="NULLABLE", description="Average rating of the restaurant"),
+    bigquery.SchemaField("priceLevel", "STRING", mode="NULLABLE", description="Price level of the restaurant - categorical variable"),
+    bigquery.SchemaField("last_seen", "DATE", mode="NULLABLE", description="Date when the restaurant was last seen active"),
+    bigquery.SchemaField("first_seen", "DATE", mode="NULLABLE", description="Date when the restaurant was first seen active"),
+    bigquery.SchemaField("primary_type", "STRING", mode="NULLABLE", description="Primary type of the restaurant (for example, restaurant, or italian_restaurant)"),
+    bigquery.SchemaField("user_rating_count", "INTEGER", mode="NULLABLE", description="Number of users who rated the restaurant"),
+    bigquery.SchemaField("types", "STRING", mode="REPEATED", description="A list of types associated with the restaurant - for example italian_restaurant or indonesian_restaurant - each restaurant can have multiple types"),
+    # Added after the first version of the table; new fields go last so MERGE ... INSERT ROW lines up
+    bigquery.SchemaField("latitude", "FLOAT", mode="NULLABLE", description="Latitude of the restaurant"),
+    bigquery.SchemaField("longitude", "FLOAT", mode="NULLABLE", description="Longitude of the restaurant")
+]
+
+
+def restaurants_table_layout():
+    """
+    Partitioning and clustering of the restaurants table, as (TimePartitioning, clustering fields).
+    """
+    return (bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field=BIGQUERY_PARTITION_FIELD),
+            list(BIGQUERY_CLUSTERING_FIELDS))
+
+
+def has_restaurants_table_layout(table):
+    partitioning, clustering_fields = restaurants_table_layout()
+    return (table.time_partitioning is not None
+            and table.time_partitioning.field == partitioning.field
+            and table.time_partitioning.type_ == partitioning.type_
+            and list(table.clustering_fields or []) == clustering_fields)
+
+
+def ensure_restaurants_table_layout(client, table):
+    """
+    Rebuilds a restaurants table created before it was partitioned and clustered.
+
+    BigQuery cannot change the partitioning of an existing table, so the rows are
+    copied into a new table, BIGQUERY_LAYOUT_TABLE_ID, created with RESTAURANTS_SCHEMA
+    (descriptions included) and the layout of restaurants_table_layout. The old
+    table is then dropped and the new one copied in its place. The table is missing
+    only between the drop and the copy; if a run stops there, the next sync finds
+    no table and rebuilds it from the store. Callers hold the store lock (see
+    main.find_restaurants_in_batches), so no other run writes the table meanwhile.
+    Does nothing if the layout is already right.
+
+    Args:
+        client: A BigQuery client.
+        table: The restaurants table, as returned by get_table.
+
+    Returns:
+        True if the table was rebuilt.
+    """
+    if has_restaurants_table_layout(table):
+        return False
+    table_ref = f"{table.project}.{table.dataset_id}.{table.table_id}"
+    layout_ref = f"{table.project}.{table.dataset_id}.{BIGQUERY_LAYOUT_TABLE_ID}"
+    partitioning, clustering_fields = restaurants_table_layout()
+
+    # Left over by a rebuild that stopped half way
+    client.delete_table(layout_ref, not_found_ok=True)
+    layout_table = bigquery.Table(layout_ref, schema=RESTAURANTS_SCHEMA)
+    layout_table.time_partitioning = partitioning
+    layout_table.clustering_fields = clustering_fields
+    client.create_table(layout_table)
+    # Columns the old table does not have yet are left null
+    existing_columns = {field.name for field in table.schema}
+    columns = ', '.join(field.name for field in RESTAURANTS_SCHEMA if field.name in existing_columns)
+    client.query(f"INSERT INTO `{layout_ref}` ({columns}) SELECT {columns} FROM `{table_ref}`").result()
+
+    client.delete_table(table_ref)
+    client.copy_table(layout_ref, table_ref).result()
+    # Kept until the copy is done, so a failed copy leaves the rebuilt rows behind
+    client.delete_table(layout_ref, not_found_ok=True)
+    bump_table_version(table_ref)
+    print(f"Partitioned {table.table_id} on {BIGQUERY_PARTITION_FIELD} and clustered it on {clustering_fields}")
+    return True
+
+
+def new_restaurants_view_query(table_ref, days=NEW_RESTAURANTS_DAYS):
+    # Compares first_seen itself to a constant date, so only the recent partitions are read
+    return f"""
+        SELECT restaurant_id, displayName, shortFormattedAddress, rating, priceLevel, primary_type,
+               user_rating_count, types, first_seen, last_seen, latitude, longitude
+        FROM `{table_ref}`
+        WHERE first_seen >= DATE_SUB(CURRENT_DATE(), INTERVAL {int(days)} DAY)
+    """
+
+
+def ensure_new_restaurants_view(client, project_id):
+    """
+    Creates or updates the view of the restaurants first seen in the last NEW_RESTAURANTS_DAYS days.
+
+    It is a logical view rather than a materialized one, because materialized views
+    cannot depend on CURRENT_DATE. Each query of it reads only the partitions of its
+    window, which a materialized view would not improve on.
+    """
     table_ref = f"{project_id}.{BIGQUERY_DATASET_ID}.{BIGQUERY_TABLE_ID}"
-
-    # Note: This function implements a destructive update strategy.
-    # The existing table (if any) is deleted and recreated on each run.
-    # This is suitable if the table is intended to be a snapshot of the latest data.
-    # For data retention or incremental updates, a different approach would be needed.
+    view_ref = f"{project_id}.{BIGQUERY_DATASET_ID}.{BIGQUERY_NEW_RESTAURANTS_VIEW_ID}"
+    view_query = new_restaurants_view_query(table_ref)
     try:
-        dataset_ref = client.dataset(BIGQUERY_DATASET_ID) # Now client is defined before this line
-        client.delete_table(table_ref)
-        print(f"Table {BIGQUERY_TABLE_ID} deleted successfully.")
-    except Exception as e:
-        print(f"Table {BIGQUERY_TABLE_ID} does not exist. Creating a new table.")
-
-    schema = [
-        bigquery.SchemaField("restaurant_id", "STRING", mode="REQUIRED", description="Unique identifier for the restaurant"),
-        bigquery.SchemaField("displayName", "STRING", mode="NULLABLE", description="Name of the restaurant"),
-        bigquery.SchemaField("shortFormattedAddress", "STRING", mode="NULLABLE", description= "Address of the restaurant"),
-        bigquery.SchemaField("rating", "FLOAT", mode="NULLABLE", description="Average rating of the restaurant"),
-        bigquery.SchemaField("priceLevel", "STRING", mode="NULLABLE", description="Price level of the restaurant - categorical variable"),
-        bigquery.SchemaField("last_seen", "DATE", mode="NULLABLE", description="Date when the restaurant was last seen active"),
-        bigquery.SchemaField("first_seen", "DATE", mode="NULLABLE", description="Date when the restaurant was first seen active"),
-        bigquery.SchemaField("primary_type", "STRING", mode="NULLABLE", description="Primary type of the restaurant (for example, restaurant, or italian_restaurant)"),
-        bigquery.SchemaField("user_rating_count", "INTEGER", mode="NULLABLE", description="Number of users who rated the restaurant"),
-        bigquery.SchemaField("types", "STRING", mode="REPEATED", description="A list of types associated with the restaurant - for example italian_restaurant or indonesian_restaurant - each restaurant can have multiple types")
-    ]
-    
-    # The client is already created, no need to create it again.
-    dataset_ref = client.dataset(BIGQUERY_DATASET_ID)
-    table = bigquery.Table(table_ref, schema=schema)
-    # Try to create the table. If it already exists, this might raise an error,
-    # which should be fine if the deletion logic failed silently or if the table
-    # truly didn't exist before. Consider adding exists_ok=True if appropriate for the API version.
+        if client.get_table(view_ref).view_query == view_query:
+            return
+    except NotFound:
+        pass
+    client.query(f"CREATE OR REPLACE VIEW `{view_ref}` AS {view_query}").result()
+    print(f"Created view {BIGQUERY_NEW_RESTAURANTS_VIEW_ID}")
+
+
+def query_new_restaurants(project_id, days, min_rating, min_reviews, max_reviews):
+    """
+    Reads the recent openings from the new restaurants view, best rated first.
+
+    Args:
+        project_id: The Google Cloud project ID.
+        days: Only restaurants first seen in the last days days, at most NEW_RESTAURANTS_DAYS.
+        min_rating: Restaurants must be rated above this.
+        min_reviews: Smallest number of reviews.
+        max_reviews: Largest number of reviews.
+
+    Returns:
+        A pandas DataFrame.
+    """
+    client = get_bigquery_client(project_id)
+    view_ref = f"{project_id}.{BIGQUERY_DATASET_ID}.{BIGQUERY_NEW_RESTAURANTS_VIEW_ID}"
+    query = f"""
+        SELECT *
+        FROM `{view_ref}`
+        WHERE first_seen >= DATE_SUB(CURRENT_DATE(), INTERVAL @days DAY)
+          AND user_rating_count BETWEEN @min_reviews AND @max_reviews
+          AND rating > @min_rating
+        ORDER BY rating DESC
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("days", "INT64", min(int(days), NEW_RESTAURANTS_DAYS)),
+        bigquery.ScalarQueryParameter("min_reviews", "INT64", int(min_reviews)),
+        bigquery.ScalarQueryParameter("max_reviews", "INT64", int(max_reviews)),
+        bigquery.ScalarQueryParameter("min_rating", "FLOAT64", float(min_rating)),
+    ])
+    return client.query(query, job_config=job_config).result().to_dataframe(create_bqstorage_client=True)
+
+
+def table_to_rows(table, batch_rows=BQ_LOAD_CHUNK_ROWS):
+    """
+    Yields the rows of a RESTAURANT_STORE_SCHEMA table as dicts of RESTAURANTS_SCHEMA,
+    converting one batch of batch_rows rows at a time.
+    """
+    for name in DATE_COLUMNS:
+        table = table.set_column(table.schema.get_field_index(name), name, table.column(name).cast(pa.string()))
+    table = table.select([field.name for field in RESTAURANTS_SCHEMA])
+    for batch in table.to_batches(max_chunksize=batch_rows):
+        yield from batch.to_pylist()
+
+
+
+def load_rows_to_bigquery(rows, destination_ref, project_id, chunk_rows=BQ_LOAD_CHUNK_ROWS):
+    """
+    Writes rows to a BigQuery table with batch load jobs instead of streaming inserts.
+
+    Rows are streamed into newline-delimited JSON files of chunk_rows rows each,
+    and every file is submitted as one load job. The first chunk replaces the
+    table contents and the following chunks append to it. Load jobs have no
+    request-size limit, are not billed like streaming inserts, and their rows
+    are available to DML straight away.
+
+    Args:
+        rows: An iterable of row dicts matching RESTAURANTS_SCHEMA.
+        destination_ref: Fully qualified table id to load into.
+        project_id: The Google Cloud project ID.
+        chunk_rows: Number of rows per load job.
+
+    Returns:
+        A tuple (rows_loaded, failed_chunks), where failed_chunks is a list of
+        (chunk_index, error) for the chunks that could not be loaded.
+    """
+    client = get_bigquery_client(project_id)
+    rows_loaded = 0
+    failed_chunks = []
+
+    def submit(chunk_file, chunk_index, chunk_size):
+        disposition = (bigquery.WriteDisposition.WRITE_TRUNCATE if chunk_index == 0
+                       else bigquery.WriteDisposition.WRITE_APPEND)
+        partitioning, clustering_fields = restaurants_table_layout()
+        job_config = bigquery.LoadJobConfig(schema=RESTAURANTS_SCHEMA,
+                                            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+                                            write_disposition=disposition,
+                                            time_partitioning=partitioning,
+                                            clustering_fields=clustering_fields)
+        chunk_file.seek(0)
+        try:
+            client.load_table_from_file(chunk_file, destination_ref, job_config=job_config).result()
+        except Exception as e:
+            print(f"Chunk {chunk_index}: failed to load {chunk_size} rows: {e}")
+            failed_chunks.append((chunk_index, str(e)))
+            return 0
+        print(f"Chunk {chunk_index}: loaded {chunk_size} rows ({rows_loaded + chunk_size} so far)")
+        return chunk_size
+
+    chunk_index = 0
+    chunk_size = 0
+    chunk_file = tempfile.TemporaryFile()
     try:
-        table = client.create_table(table)  # Make an API request.
-        print(f"Created table {table.project}.{table.dataset_id}.{table.table_id}")
-    except Exception as e: # Catch exception if table already exists
-        print(f"Table {table_ref} might already exist or another error occurred: {e}")
-        # If the table is needed for subsequent operations, ensure it's referenced correctly
-        # This assumes that if creation fails because it exists, we can still use it.
-        table = client.get_table(table_ref) # Ensure table object is valid for next step
-
-    # table_ref is already correctly defined.
-    # table_ref = dataset_ref.table(BIGQUERY_TABLE_ID) # This line is redundant
-
-    rows_to_insert = []
-    for restaurant_id, restaurant_data in concatenated_dict.items():
-        row = {
-            'restaurant_id': restaurant_id,
-            'displayName': restaurant_data.get('displayName', 'NA'),
-            'shortFormattedAddress': restaurant_data.get('shortFormattedAddress', 'NA'),
-            'rating': restaurant_data.get('rating', 0),
-            'priceLevel': restaurant_data.get('priceLevel', 'NA'),
-            'last_seen': restaurant_data.get('last_seen', None),
-            'first_seen': restaurant_data.get('first_seen', None),
-            'primary_type': restaurant_data.get('primary_type', None),
-            'user_rating_count': restaurant_data.get('user_rating_count', 0),
-            'types': restaurant_data.get('types', [''])
-        }
-        rows_to_insert.append(row)
+        for row in rows:
+            chunk_file.write(json.dumps(row).encode('utf-8') + b'\n')
+            chunk_size += 1
+            if chunk_size == chunk_rows:
+                rows_loaded += submit(chunk_file, chunk_index, chunk_size)
+                chunk_file.close()
+                chunk_file = tempfile.TemporaryFile()
+                chunk_index += 1
+                chunk_size = 0
+        if chunk_size or chunk_index == 0:
+            # The last partial chunk; an empty first chunk still truncates the table
+            rows_loaded += submit(chunk_file, chunk_index, chunk_size)
+    finally:
+        chunk_file.close()
+
+    return rows_loaded, failed_chunks
+
+
+
+def staging_table_ref(project_id, run_key=None):
+    """
+    The staging table of one run, suffixed with its run key (default: now).
+
+    Each run stages into its own table, so runs syncing at the same time never
+    load into, merge from or delete each other's staging table.
+    """
+    return f"{project_id}.{BIGQUERY_DATASET_ID}.{BIGQUERY_STAGING_TABLE_ID}_{_run_key(run_key or datetime.now())}"
+
+
+def upload_restaurants_to_bigquery(all_restaurants, project_id, run_key=None):
+    """
+    Replaces the contents of the BigQuery table with every restaurant in the store.
+
+    Rows are loaded in chunks into a staging table first. The staging table is
+    copied over the restaurants table only if every chunk loaded, so readers see
+    either the old or the new contents, never a missing or half-written table.
+    The staging table is partitioned and clustered like the restaurants table
+    (see restaurants_table_layout), and an existing table without that layout is
+    converted before the copy.
+
+    Args:
+        all_restaurants: Arrow table of RESTAURANT_STORE_SCHEMA with the whole store.
+        project_id: The Google Cloud project ID.
+        run_key: Key of the run, naming its staging table (see staging_table_ref).
+    """
+    client = get_bigquery_client(project_id)
+    table_ref = f"{project_id}.{BIGQUERY_DATASET_ID}.{BIGQUERY_TABLE_ID}"
+    staging_ref = staging_table_ref(project_id, run_key)
 
+    rows = table_to_rows(all_restaurants)
     try:
-        errors = client.insert_rows_json(table_ref, rows_to_insert)
-        if errors == []:
-            print("New rows have been added.")
-        else:
-            print(f"Encountered errors while inserting rows: {errors}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-
-
-
-def update_json_and_save(new_data, bucket_name, project_id):
-    json_old = read_old_restaurants(bucket_name)
-    
-    new_restaurants = {}
-    for restaurant_id, restaurant_data in new_data.items():
-        
-        #case one, the restaurant is new
-        if restaurant_id not in json_old:
-            new_restaurants[restaurant_id] = restaurant_data
-            new_restaurants[restaurant_id]['first_seen'] = new_restaurants[restaurant_id]['last_seen']
-
-        #case two, the restaurant has been seen before
-        else:
-            # update the rating
-            json_old[restaurant_id]['rating'] = restaurant_data['rating']
-            # update the address
-            json_old[restaurant_id]['shortFormattedAddress'] = restaurant_data['shortFormattedAddress']
-            # update the price level
-            json_old[restaurant_id]['priceLevel'] = restaurant_data['priceLevel']
-            # update the last_seen
-            json_old[restaurant_id]['last_seen'] = restaurant_data['last_seen']
-            # update the primary_type
-            json_old[restaurant_id]['primary_type'] = restaurant_data['primary_type']
-            # update the user_rating_count
-            json_old[restaurant_id]['user_rating_count'] = restaurant_data['user_rating_count']
-            # update the types
-            json_old[restaurant_id]['types'] = restaurant_data['types']
-
-      
-
-    print("** new restaurants **")
-    print(new_restaurants)
-
-
-    # Create a new dictionary to store the concatenated results
-    concatenated_dict = json_old.copy()
-
-    # Update the concatenated dictionary with values from dict2
-    concatenated_dict.update(new_restaurants)
-
-
-    # write json_old and new_restaurants into cloud storage:
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-
-    blob = bucket.blob(f'restaurants_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
-    blob.upload_from_string(json.dumps(new_restaurants), content_type='application/json')
+        rows_loaded, failed_chunks = load_rows_to_bigquery(rows, staging_ref, project_id)
+        if failed_chunks:
+            print(f"{len(failed_chunks)} chunks failed to load; {BIGQUERY_TABLE_ID} was left unchanged.")
+            return
+
+        try:
+            ensure_restaurants_table_layout(client, client.get_table(table_ref))
+        except NotFound:
+            pass
+        job_config = bigquery.CopyJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+        client.copy_table(staging_ref, table_ref, job_config=job_config).result()
+        bump_table_version(table_ref)
+        print(f"Replaced the contents of {BIGQUERY_TABLE_ID} with {rows_loaded} rows.")
+        ensure_new_restaurants_view(client, project_id)
+    finally:
+        client.delete_table(staging_ref, not_found_ok=True)
+
+
+
+def sync_restaurants_to_bigquery(changed_restaurants, all_restaurants, project_id, run_key=None):
+    """
+    Applies only the new and changed restaurants to the BigQuery table.
+
+    The changed rows are written to a staging table with a load job, then merged
+    into the restaurants table with a single MERGE on restaurant_id. The table
+    stays in place, so readers never see it missing, and the cost follows the
+    size of the change instead of the size of the history. As with a full
+    upload, nothing is merged unless every chunk was staged.
+
+    If the restaurants table does not exist yet, it is built from all_restaurants
+    with upload_restaurants_to_bigquery instead.
+
+    Args:
+        changed_restaurants: Arrow table of the restaurants that are new or were seen again in this run.
+        all_restaurants: Arrow table of the full merged store, used only to build a missing table.
+        project_id: The Google Cloud project ID.
+        run_key: Key of the run, naming its staging table (see staging_table_ref).
+    """
+    client = get_bigquery_client(project_id)
+    table_ref = f"{project_id}.{BIGQUERY_DATASET_ID}.{BIGQUERY_TABLE_ID}"
+    staging_ref = staging_table_ref(project_id, run_key)
 
-    blob = bucket.blob(f'restaurants.json')
-    blob.upload_from_string(json.dumps(concatenated_dict), content_type='application/json')
-    upload_restaurants_to_bigquery(concatenated_dict, project_id)
+    try:
+        table = client.get_table(table_ref)
+    except NotFound:
+        print(f"Table {BIGQUERY_TABLE_ID} does not exist. Building it from the full store.")
+        upload_restaurants_to_bigquery(all_restaurants, project_id, run_key=run_key)
+        return
+
+    # Tables created before a field was added to RESTAURANTS_SCHEMA get it as a nullable column
+    existing_columns = {field.name for field in table.schema}
+    missing_fields = [field for field in RESTAURANTS_SCHEMA if field.name not in existing_columns]
+    if missing_fields:
+        table.schema = list(table.schema) + missing_fields
+        client.update_table(table, ['schema'])
+        bump_table_version(table_ref)
+        print(f"Added columns {[field.name for field in missing_fields]} to {BIGQUERY_TABLE_ID}")
+    ensure_restaurants_table_layout(client, table)
+    ensure_new_restaurants_view(client, project_id)
+
+    if changed_restaurants.num_rows == 0:
+        print("No new or changed restaurants to sync.")
+        return
+
+    rows = table_to_rows(changed_restaurants)
+
+    update_columns = [field.name for field in RESTAURANTS_SCHEMA if field.name != 'restaurant_id']
+    merge_query = f"""
+        MERGE `{table_ref}` AS target
+        USING `{staging_ref}` AS source
+        ON target.restaurant_id = source.restaurant_id
+        WHEN MATCHED THEN
+          UPDATE SET {', '.join(f'{column} = source.{column}' for column in update_columns)}
+        WHEN NOT MATCHED THEN
+          INSERT ROW
+    """
+    try:
+        rows_loaded, failed_chunks = load_rows_to_bigquery(rows, staging_ref, project_id)
+        print(f"Staged {rows_loaded} new or changed restaurants in {staging_ref}")
+        if failed_chunks:
+            # Merging only part of the run would leave the table out of step with the store
+            print(f"{len(failed_chunks)} chunks failed to stage; {BIGQUERY_TABLE_ID} was left unchanged. "
+                  f"Run with --bq_sync full to bring it up to date with the store.")
+            return
+
+        merge_job = client.query(merge_query)
+        merge_job.result()
+        bump_table_version(table_ref)
+        print(f"Merged {merge_job.num_dml_affected_rows} rows into {BIGQUERY_TABLE_ID}")
+    finally:
+        client.delete_table(staging_ref, not_found_ok=True)
+
+
+
+
+# Fields taken from the latest crawl when a known restaurant is seen again;
+# displayName and first_seen keep their stored values
+REFRESHED_FIELDS = ('shortFormattedAddress', 'rating', 'priceLevel', 'last_seen',
+                    'primary_type', 'user_rating_count', 'types', 'latitude', 'longitude')
+
+
+def merge_restaurant_tables(old_table, new_table):
+    """
+    Joins a fresh crawl with the store on restaurant_id in one columnar pass.
+
+    Args:
+        old_table: Arrow table of RESTAURANT_STORE_SCHEMA with the current store.
+        new_table: Arrow table of RESTAURANT_STORE_SCHEMA with the crawl results.
+
+    Returns:
+        A tuple of Arrow tables (new, updated, unchanged):
+        new holds the restaurants not in the store, with first_seen set to last_seen;
+        updated holds the known restaurants seen again, with the REFRESHED_FIELDS of
+        the crawl and the rest of the stored row; unchanged holds the stored
+        restaurants that were not seen in this crawl.
+    """
+    old_table = old_table.select(RESTAURANT_STORE_SCHEMA.names)
+    new_table = new_table.select(RESTAURANT_STORE_SCHEMA.names)
+    old_ids = old_table.column('restaurant_id').combine_chunks()
+    new_ids = new_table.column('restaurant_id').combine_chunks()
+
+    # Row of each crawled restaurant in the store, null for restaurants never seen before
+    old_rows = pc.index_in(new_ids, value_set=old_ids)
+    known = pc.is_valid(old_rows)
+
+    new = new_table.filter(pc.invert(known))
+    new = new.set_column(new.schema.get_field_index('first_seen'),
+                         RESTAURANT_STORE_SCHEMA.field('first_seen'), new.column('last_seen'))
+
+    updated = new_table.filter(known)
+    seen_rows = pc.drop_null(old_rows)
+    previous = old_table.take(seen_rows)
+    for name in RESTAURANT_STORE_SCHEMA.names:
+        if name not in REFRESHED_FIELDS:
+            updated = updated.set_column(updated.schema.get_field_index(name),
+                                         RESTAURANT_STORE_SCHEMA.field(name), previous.column(name))
+
+    # The stored rows not hit by the crawl, found from the same lookup instead of a second hash pass
+    not_seen = np.ones(old_table.num_rows, dtype=bool)
+    not_seen[seen_rows.to_numpy()] = False
+    unchanged = old_table.filter(pa.array(not_seen))
+    return new, updated, unchanged
+
+
+def update_json_and_save(new_data, bucket_name, project_id, bq_sync_mode=BQ_SYNC_MODE):
+    """
+    Merges a crawl into the master store and syncs BigQuery.
+
+    Args:
+        new_data: Dict of Restaurant records found by the crawl, keyed by place id.
+        bucket_name: The restaurant bucket.
+        project_id: The Google Cloud project ID.
+        bq_sync_mode: 'incremental' to MERGE only the changes, 'full' to reload the table.
+
+    Returns:
+        A tuple (all_restaurants, crawled): the merged store as an Arrow table of
+        RESTAURANT_STORE_SCHEMA, and the crawl's restaurants as they now stand in
+        the store, a dict of Restaurant records keyed by place id with first_seen set.
+    """
+    old_table = read_restaurant_store(bucket_name)
+    new_restaurants, updated_restaurants, unchanged_restaurants = merge_restaurant_tables(
+        old_table, restaurants_to_table(new_data))
+
+    print(f"** {new_restaurants.num_rows} new restaurants, {updated_restaurants.num_rows} seen again, "
+          f"{unchanged_restaurants.num_rows} not seen in this run **")
+    print(new_restaurants.column('displayName').to_pylist())
+
+    # Append this run's changes to the store, compacting once enough deltas have piled up
+    run_key = write_restaurant_delta(bucket_name, new_restaurants, updated_restaurants)
+    if deltas_since_last_base(bucket_name) >= STORE_COMPACT_AFTER_DELTAS:
+        compact_restaurant_store(bucket_name)
+
+    # Concatenating Arrow tables only links their chunks, nothing is copied
+    all_restaurants = pa.concat_tables([unchanged_restaurants, updated_restaurants, new_restaurants]).unify_dictionaries()
+    changed_restaurants = pa.concat_tables([updated_restaurants, new_restaurants]).unify_dictionaries()
+    if bq_sync_mode == 'incremental':
+        sync_restaurants_to_bigquery(changed_restaurants, all_restaurants, project_id, run_key=run_key)
+    else:
+        upload_restaurants_to_bigquery(all_restaurants, project_id, run_key=run_key)
+
+    return all_restaurants, table_to_restaurants(changed_restaurants)
 
 
 
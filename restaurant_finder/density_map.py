@@ -0,0 +1,270 @@
+import functools
+import io
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+
+from restaurant_finder.clients import get_storage_client
+from restaurant_finder.config import (
+    DENSITY_GEOHASH_PRECISION,
+    DENSITY_MAP_BLOB,
+    DENSITY_TARGET_PLACES,
+    MAX_SEARCH_RADIUS,
+)
+from restaurant_finder.geo_functions import EARTH_RADIUS_METERS, haversine_distance, tile_circle
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+DENSITY_MAP_COLUMNS = ['place_count', 'searches', 'saturated']
+
+
+def _geohash_bits(precision):
+    # Bits alternate between longitude and latitude, starting with longitude
+    total_bits = 5 * precision
+    return total_bits // 2, total_bits - total_bits // 2
+
+
+def geohash_encode(lats, longs, precision=DENSITY_GEOHASH_PRECISION):
+    """
+    Geohashes of points, as an array of strings.
+    """
+    lat_bits, long_bits = _geohash_bits(precision)
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+    longs = np.atleast_1d(np.asarray(longs, dtype=np.float64))
+    lat_index = np.clip(((lats + 90) / 180 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    long_index = np.clip(((longs + 180) / 360 * (1 << long_bits)).astype(np.int64), 0, (1 << long_bits) - 1)
+
+    code = np.zeros(lats.shape, dtype=np.int64)
+    for bit in range(5 * precision):
+        if bit % 2 == 0:
+            value = (long_index >> (long_bits - 1 - bit // 2)) & 1
+        else:
+            value = (lat_index >> (lat_bits - 1 - bit // 2)) & 1
+        code = (code << 1) | value
+
+    alphabet = np.array(list(GEOHASH_ALPHABET))
+    characters = [alphabet[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision)]
+    return functools.reduce(np.char.add, characters)
+
+
+def geohash_centres(geohashes, precision=DENSITY_GEOHASH_PRECISION):
+    """
+    Centres of geohash cells, as a tuple of arrays (latitudes, longitudes).
+    """
+    lat_bits, long_bits = _geohash_bits(precision)
+    lookup = {character: value for value, character in enumerate(GEOHASH_ALPHABET)}
+    code = np.array([functools.reduce(lambda acc, c: (acc << 5) | lookup[c], geohash, 0) for geohash in geohashes],
+                    dtype=np.int64)
+
+    lat_index = np.zeros(code.shape, dtype=np.int64)
+    long_index = np.zeros(code.shape, dtype=np.int64)
+    for bit in range(5 * precision):
+        value = (code >> (5 * precision - 1 - bit)) & 1
+        if bit % 2 == 0:
+            long_index = (long_index << 1) | value
+        else:
+            lat_index = (lat_index << 1) | value
+
+    lats = (lat_index + 0.5) * 180 / (1 << lat_bits) - 90
+    longs = (long_index + 0.5) * 360 / (1 << long_bits) - 180
+    return lats, longs
+
+
+class DensityMap:
+    """
+    Known places, searches and saturated searches per geohash cell.
+
+    Built up from every run and used to plan the starting circles of the next
+    one: circles expected to saturate are split before they are searched, and
+    neighbouring circles in sparse areas are merged into one larger circle.
+    Areas the map knows nothing about are searched as planned.
+    """
+
+    def __init__(self, cells=None, precision=DENSITY_GEOHASH_PRECISION):
+        self.precision = precision
+        if cells is None:
+            cells = pd.DataFrame({column: pd.Series(dtype='int64') for column in DENSITY_MAP_COLUMNS},
+                                 index=pd.Index([], name='geohash', dtype=object))
+            cells['updated_at'] = pd.Series(dtype=object)
+        self.cells = cells
+        self._arrays = None
+
+        lat_bits, long_bits = _geohash_bits(precision)
+        self.cell_height = np.radians(180 / (1 << lat_bits)) * EARTH_RADIUS_METERS
+        self.cell_width_degrees = 360 / (1 << long_bits)
+
+    @classmethod
+    def load(cls, bucket_name):
+        blob = get_storage_client().bucket(bucket_name).blob(DENSITY_MAP_BLOB)
+        if not blob.exists():
+            print("No density map found; starting circles are searched as planned.")
+            return cls()
+        cells = pd.read_parquet(io.BytesIO(blob.download_as_bytes()))
+        print(f"Loaded the density map: {len(cells)} cells")
+        return cls(cells)
+
+    def save(self, bucket_name):
+        buffer = io.BytesIO()
+        self.cells.to_parquet(buffer, compression='zstd')
+        blob = get_storage_client().bucket(bucket_name).blob(DENSITY_MAP_BLOB)
+        blob.upload_from_string(buffer.getvalue(), content_type='application/vnd.apache.parquet')
+        print(f"Saved the density map: {len(self.cells)} cells")
+
+    def update(self, restaurants, searched_cells, saturated_cells, today=None):
+        """
+        Folds a run into the map.
+
+        Args:
+            restaurants: Arrow table of RESTAURANT_STORE_SCHEMA with the whole store.
+                Place counts are taken from the restaurants that have a location.
+            searched_cells: (lat, long, ...) tuples of the circles searched in the run.
+            saturated_cells: (lat, long, ...) tuples of the circles that returned 20 places.
+            today: Date recorded as updated_at for the cells touched, defaults to today.
+        """
+        located = restaurants.filter(pc.is_valid(restaurants.column('latitude')))
+        place_counts = self._count(located.column('latitude').to_numpy(), located.column('longitude').to_numpy())
+        searches = self._count(*self._centres(searched_cells))
+        saturated = self._count(*self._centres(saturated_cells))
+
+        index = self.cells.index.union(place_counts.index).union(searches.index)
+        cells = self.cells.reindex(index)
+        cells[DENSITY_MAP_COLUMNS] = cells[DENSITY_MAP_COLUMNS].fillna(0).astype('int64')
+        # The store only grows, so the count never drops when a run covers part of a cell
+        cells['place_count'] = np.maximum(cells['place_count'], place_counts.reindex(index, fill_value=0))
+        cells['searches'] += searches.reindex(index, fill_value=0)
+        cells['saturated'] += saturated.reindex(index, fill_value=0)
+        touched = place_counts.index.union(searches.index)
+        cells.loc[touched, 'updated_at'] = (today or date.today()).isoformat()
+
+        self.cells = cells
+        self._arrays = None
+
+    def _centres(self, cells):
+        if not cells:
+            return np.array([]), np.array([])
+        lats, longs = zip(*((cell[0], cell[1]) for cell in cells))
+        return np.array(lats), np.array(longs)
+
+    def _count(self, lats, longs):
+        if len(lats) == 0:
+            return pd.Series(dtype='int64')
+        return pd.Series(geohash_encode(lats, longs, self.precision)).value_counts()
+
+    def _cell_arrays(self):
+        # Cell centres and place counts, sorted by latitude for window lookups
+        if self._arrays is None:
+            lats, longs = geohash_centres(self.cells.index, self.precision)
+            order = np.argsort(lats)
+            self._arrays = (lats[order], longs[order], self.cells['place_count'].to_numpy()[order])
+        return self._arrays
+
+    def expected_places(self, lat, long, radius):
+        """
+        Estimated number of places inside a circle, or None if the map has no cells there.
+
+        The density is averaged over the known cells whose centres fall in the circle,
+        or taken from the cell holding the centre for circles smaller than a cell.
+        """
+        lats, longs, counts = self._cell_arrays()
+        if len(lats) == 0:
+            return None
+
+        cell_width = np.radians(self.cell_width_degrees) * EARTH_RADIUS_METERS * np.cos(np.radians(lat))
+        reach = max(radius, self.cell_height, cell_width)
+        window = np.degrees(reach / EARTH_RADIUS_METERS)
+        low, high = np.searchsorted(lats, [lat - window, lat + window])
+        distances = haversine_distance(lat, long, lats[low:high], longs[low:high])
+
+        inside = distances <= radius
+        if not inside.any():
+            # Smaller than a cell: use the cell the centre lies in
+            inside = distances <= np.hypot(self.cell_height, cell_width) / 2
+            if not inside.any():
+                return None
+            inside = distances == distances[inside].min()
+
+        density = counts[low:high][inside].mean() / (self.cell_height * cell_width)
+        return float(density * np.pi * radius ** 2)
+
+    def plan(self, cells, min_radius, target=DENSITY_TARGET_PLACES):
+        """
+        Chooses the starting circles of a run from the planned grid.
+
+        Circles expected to hold more than target places are split with tile_circle
+        until they are not, or would go below min_radius. Circles expected to stay
+        under target even when merged with their neighbours are merged into one
+        circle that contains them all. Other circles are kept.
+
+        Args:
+            cells: List of (latitude, longitude, radius) tuples.
+            min_radius: Smallest radius a circle is split down to, in meters.
+            target: Number of places a circle is planned to hold.
+
+        Returns:
+            List of (latitude, longitude, radius) tuples.
+        """
+        planned = []
+        sparse = []
+        for lat, long, radius in cells:
+            expected = self.expected_places(lat, long, radius)
+            if expected is None:
+                planned.append((lat, long, radius))
+            elif expected > target:
+                planned.extend(self._split(lat, long, radius, min_radius, target))
+            elif expected * 4 <= target:
+                # Would still be under target at twice the radius
+                sparse.append((lat, long, radius))
+            else:
+                planned.append((lat, long, radius))
+
+        merged = self._merge(sparse, target)
+        print(f"Density map plan: {len(cells)} circles became {len(planned) + len(merged)} "
+              f"({len(sparse)} sparse circles merged into {len(merged)})")
+        return planned + merged
+
+    def _split(self, lat, long, radius, min_radius, target):
+        if radius / 2 < min_radius:
+            return [(lat, long, radius)]
+        children = []
+        for child_lat, child_long, child_radius in tile_circle(lat, long, radius):
+            expected = self.expected_places(child_lat, child_long, child_radius)
+            if expected is not None and expected > target:
+                children.extend(self._split(child_lat, child_long, child_radius, min_radius, target))
+            else:
+                children.append((child_lat, child_long, child_radius))
+        return children
+
+    def _merge(self, cells, target):
+        if not cells:
+            return []
+        lats, longs, radii = (np.array(column, dtype=np.float64) for column in zip(*cells))
+        order = np.argsort(lats)
+        lats, longs, radii = lats[order], longs[order], radii[order]
+        absorbed = np.zeros(len(lats), dtype=bool)
+
+        def neighbours(i):
+            # Circles within twice the radius, which fit inside a circle around this one
+            window = np.degrees(2 * radii[i] / EARTH_RADIUS_METERS)
+            low, high = np.searchsorted(lats, [lats[i] - window, lats[i] + window])
+            distances = haversine_distance(lats[i], longs[i], lats[low:high], longs[low:high])
+            return low, high, distances, distances <= 2 * radii[i]
+
+        # Circles with the most neighbours absorb them first
+        neighbour_counts = np.array([neighbours(i)[3].sum() for i in range(len(lats))])
+        merged = []
+        for i in np.argsort(-neighbour_counts, kind='stable'):
+            if absorbed[i]:
+                continue
+            low, high, distances, near = neighbours(i)
+            near &= ~absorbed[low:high]
+            merged_radius = float(np.max(distances[near] + radii[low:high][near]))
+
+            if (near.sum() > 1 and merged_radius <= MAX_SEARCH_RADIUS
+                    and (self.expected_places(lats[i], longs[i], merged_radius) or 0) <= target):
+                absorbed[low:high] |= near
+                merged.append((float(lats[i]), float(longs[i]), merged_radius))
+            else:
+                absorbed[i] = True
+                merged.append((float(lats[i]), float(longs[i]), float(radii[i])))
+        return merged
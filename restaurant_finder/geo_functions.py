@@ -1,9 +1,110 @@
-from geopy.distance import geodesic
-from math import radians, cos, sin, atan2, pi
-import googlemaps
+import heapq
+
+import numpy as np
+
+EARTH_RADIUS_METERS = 6371008.8
 
 # The function check_coordinates_are_close_to_centre was removed as it was identified as dead code.
 
+# All functions below work on a spherical earth and accept scalars or NumPy arrays,
+# broadcasting them against each other, so whole batches of centres are handled at once.
+
+
+def destination_points(lats, longs, distances, bearings):
+    """
+    Computes the points reached by travelling a distance along a bearing.
+
+    Args:
+        lats: Latitudes of the start points in degrees.
+        longs: Longitudes of the start points in degrees.
+        distances: Distances to travel in meters.
+        bearings: Bearings in degrees clockwise from north.
+
+    Returns:
+        Tuple of arrays (latitudes, longitudes) in degrees.
+    """
+    lat1 = np.radians(lats)
+    long1 = np.radians(longs)
+    angular_distance = np.asarray(distances, dtype=np.float64) / EARTH_RADIUS_METERS
+    bearing = np.radians(bearings)
+
+    sin_lat1 = np.sin(lat1)
+    cos_lat1 = np.cos(lat1)
+    sin_distance = np.sin(angular_distance)
+    cos_distance = np.cos(angular_distance)
+
+    sin_lat2 = sin_lat1 * cos_distance + cos_lat1 * sin_distance * np.cos(bearing)
+    lat2 = np.arcsin(np.clip(sin_lat2, -1.0, 1.0))
+    long2 = long1 + np.arctan2(np.sin(bearing) * sin_distance * cos_lat1,
+                               cos_distance - sin_lat1 * sin_lat2)
+    # Normalise longitudes to [-180, 180)
+    long2 = (long2 + 3 * np.pi) % (2 * np.pi) - np.pi
+    return np.degrees(lat2), np.degrees(long2)
+
+
+def haversine_distance(lats1, longs1, lats2, longs2):
+    """
+    Great-circle distance in meters between two sets of points.
+    """
+    lat1 = np.radians(lats1)
+    lat2 = np.radians(lats2)
+    delta_lat = lat2 - lat1
+    delta_long = np.radians(longs2) - np.radians(longs1)
+
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_long / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def bounding_box(lats, longs, radii):
+    """
+    Latitude/longitude bounding boxes of circles.
+
+    Args:
+        lats: Latitudes of the centres in degrees.
+        longs: Longitudes of the centres in degrees.
+        radii: Radii in meters.
+
+    Returns:
+        Tuple of arrays (south, west, north, east) in degrees.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    longs = np.asarray(longs, dtype=np.float64)
+    delta_lat = np.degrees(np.asarray(radii, dtype=np.float64) / EARTH_RADIUS_METERS)
+    # Widest point of the circle in longitude, guarded near the poles
+    delta_long = delta_lat / np.maximum(np.cos(np.radians(lats)), 1e-12)
+    return lats - delta_lat, longs - delta_long, lats + delta_lat, longs + delta_long
+
+
+def circle_overlap(lats1, longs1, radii1, lats2, longs2, radii2):
+    """
+    Area in square meters shared by pairs of circles.
+
+    Circles are treated as flat discs, which is accurate for the radii used for
+    Places searches.
+    """
+    r1 = np.asarray(radii1, dtype=np.float64)
+    r2 = np.asarray(radii2, dtype=np.float64)
+    d = haversine_distance(lats1, longs1, lats2, longs2)
+    r1, r2, d = np.broadcast_arrays(r1, r2, d)
+
+    area = np.zeros(d.shape, dtype=np.float64)
+
+    # One circle inside the other: the overlap is the smaller disc
+    contained = d <= np.abs(r1 - r2)
+    area[contained] = np.pi * np.minimum(r1, r2)[contained] ** 2
+
+    # Partial overlap: area of the lens
+    partial = (d < r1 + r2) & ~contained
+    if np.any(partial):
+        dp, r1p, r2p = d[partial], r1[partial], r2[partial]
+        alpha = np.arccos(np.clip((dp ** 2 + r1p ** 2 - r2p ** 2) / (2 * dp * r1p), -1.0, 1.0))
+        beta = np.arccos(np.clip((dp ** 2 + r2p ** 2 - r1p ** 2) / (2 * dp * r2p), -1.0, 1.0))
+        kite = 0.5 * np.sqrt(np.clip((-dp + r1p + r2p) * (dp + r1p - r2p) * (dp - r1p + r2p) * (dp + r1p + r2p), 0.0, None))
+        area[partial] = r1p ** 2 * alpha + r2p ** 2 * beta - kite
+
+    return area if area.ndim else float(area)
+
+
 def generate_spoke_points(center_lat, center_long, distance, num_points=6):
     """
     Generates points evenly spaced around a center point in a circle.
@@ -11,19 +112,300 @@ def generate_spoke_points(center_lat, center_long, distance, num_points=6):
     Args:
         center_lat: Latitude of the center point.
         center_long: Longitude of the center point.
-        radius_meters: Radius of the circle in meters.
-        num_points: Number of points to generate (default: 8).
+        distance: Distance of the points from the center in meters.
+        num_points: Number of points to generate (default: 6).
 
     Returns:
         List of tuples containing latitude and longitude of the generated points.
     """
+    bearings = np.arange(num_points) * (360 / num_points)
+    lats, longs = destination_points(center_lat, center_long, distance, bearings)
+    return list(zip(lats.tolist(), longs.tolist()))
+
+
+def tile_circle(center_lat, center_long, radius):
+    """
+    Covers a circle with 7 circles of half its radius.
+
+    One child sits on the centre and six sit on a ring at sqrt(3)/2 of the radius,
+    which is the smallest 7-circle covering of a disc, so every point of the parent
+    lies in at least one child.
+
+    Args:
+        center_lat: Latitude of the parent circle.
+        center_long: Longitude of the parent circle.
+        radius: Radius of the parent circle in meters.
+
+    Returns:
+        List of (latitude, longitude, radius) tuples for the children.
+    """
+    child_radius = radius / 2
+    ring_points = generate_spoke_points(center_lat, center_long, radius * np.sqrt(3) / 2)
+    return [(center_lat, center_long, child_radius)] + [(lat, long, child_radius) for lat, long in ring_points]
+
+
+def cover_annulus(center_lat, center_long, radius, inner_radius):
+    """
+    Covers the part of a circle outside an inner disc that is already known.
+
+    The six ring children of tile_circle cover everything outside half the radius.
+    If the inner disc does not reach that far, the centre child would return the
+    same nearest places again, so the band between the inner disc and half the
+    radius is covered the same way at half the scale instead.
+
+    Args:
+        center_lat: Latitude of the circle.
+        center_long: Longitude of the circle.
+        radius: Radius of the circle in meters.
+        inner_radius: Radius in meters of the disc around the same centre that is
+            already fully covered; 0 if nothing is known, which gives tile_circle.
+
+    Returns:
+        List of (latitude, longitude, radius) tuples for the children.
+    """
+    if inner_radius >= radius:
+        return []
+
+    child_radius = radius / 2
+    children = tile_circle(center_lat, center_long, radius)
+    ring, centre = children[1:], children[0]
+    if inner_radius >= child_radius:
+        return ring
+    if inner_radius <= 0:
+        return ring + [centre]
+    return ring + cover_annulus(center_lat, center_long, child_radius, inner_radius)
+
+
+def plan_hex_grid(top_left, bottom_right, radius):
+    """
+    Plans search circles covering a bounding box with a hexagonal packing.
+
+    Centres sit on a triangular lattice: sqrt(3) * radius apart along each row,
+    rows 1.5 * radius apart, and every other row shifted by half a step. This is
+    the thinnest full covering of the plane with equal circles, so the box has no
+    gaps while overlap between neighbouring circles is kept to a minimum.
+
+    Args:
+        top_left: (latitude, longitude) of the north-west corner.
+        bottom_right: (latitude, longitude) of the south-east corner.
+        radius: Radius of each search circle in meters.
+
+    Returns:
+        List of (latitude, longitude, radius) tuples.
+    """
+    north, west = top_left
+    south, east = bottom_right
+    if north < south:
+        north, south = south, north
+    if east < west:
+        west, east = east, west
+
+    row_step = np.degrees(1.5 * radius / EARTH_RADIUS_METERS)
+    # The last row may lie past the southern edge so that the edge itself is covered
+    n_rows = int(np.floor((north - south) / row_step)) + 2
+    row_lats = north - np.arange(n_rows) * row_step
+    col_steps = np.degrees(np.sqrt(3) * radius / EARTH_RADIUS_METERS) / np.cos(np.radians(row_lats))
+    row_starts = west - np.where(np.arange(n_rows) % 2 == 1, col_steps / 2, 0.0)
+
     points = []
-    for i in range(num_points):
-        bearing = i * (360 / num_points) 
-
-        # Calculate new point using geodesic distance and bearing
-        new_point = geodesic(meters=distance).destination(
-            (center_lat, center_long), bearing
-        )
-        points.append((new_point.latitude, new_point.longitude))
+    for lat, start, step in zip(row_lats.tolist(), row_starts.tolist(), col_steps.tolist()):
+        n_cols = int(np.ceil((east + step / 2 - start) / step))
+        longs = start + np.arange(n_cols) * step
+        points.extend((lat, long, radius) for long in longs.tolist())
     return points
+
+
+# Points spread evenly over the unit disc (a sunflower spiral), used to measure how
+# much of a circle other circles cover
+COVERAGE_SAMPLES = 32
+_sample_index = np.arange(COVERAGE_SAMPLES)
+SAMPLE_DISTANCES = np.sqrt((_sample_index + 0.5) / COVERAGE_SAMPLES)
+SAMPLE_BEARINGS = np.degrees(_sample_index * np.pi * (3 - np.sqrt(5))) % 360
+
+
+class GridIndex:
+    """
+    Spatial index of points bucketed into a lat/long grid, so the points inside a
+    circle are found by looking at the few cells around it instead of every point.
+    """
+
+    def __init__(self, lats, longs, cell_meters):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.longs = np.asarray(longs, dtype=np.float64)
+        self.cell_lat = np.degrees(cell_meters / EARTH_RADIUS_METERS)
+        # Sized for the highest latitude, so no cell is narrower than cell_meters
+        widest = np.max(np.abs(self.lats)) if len(self.lats) else 0.0
+        self.cell_long = self.cell_lat / max(np.cos(np.radians(widest)), 1e-12)
+
+        rows = np.floor(self.lats / self.cell_lat).astype(np.int64)
+        cols = np.floor(self.longs / self.cell_long).astype(np.int64)
+        # Sort the points by cell, then cut the sorted order wherever the cell changes
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        starts = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])])
+        ends = np.r_[starts[1:], len(order)]
+        self.buckets = {(row, col): order[start:end]
+                        for row, col, start, end in zip(rows[starts].tolist(), cols[starts].tolist(), starts, ends)}
+
+    def query(self, lat, long, radius):
+        """
+        Indices of the points within radius meters of (lat, long).
+        """
+        south, west, north, east = bounding_box(lat, long, radius)
+        candidates = [self.buckets[(row, col)]
+                      for row in range(int(np.floor(south / self.cell_lat)), int(np.floor(north / self.cell_lat)) + 1)
+                      for col in range(int(np.floor(west / self.cell_long)), int(np.floor(east / self.cell_long)) + 1)
+                      if (row, col) in self.buckets]
+        if not candidates:
+            return np.array([], dtype=np.int64)
+        candidates = np.concatenate(candidates)
+        distances = haversine_distance(lat, long, self.lats[candidates], self.longs[candidates])
+        return candidates[distances <= radius]
+
+
+def _coverage_samples(circles):
+    # COVERAGE_SAMPLES points inside each circle, flattened circle by circle
+    lats, longs, radii = (np.asarray(column, dtype=np.float64) for column in zip(*circles))
+    sample_lats, sample_longs = destination_points(lats[:, None], longs[:, None],
+                                                   radii[:, None] * SAMPLE_DISTANCES[None, :],
+                                                   SAMPLE_BEARINGS[None, :])
+    index = GridIndex(sample_lats.ravel(), sample_longs.ravel(), cell_meters=max(float(np.max(radii)), 1.0))
+    covered_samples = [index.query(lat, long, radius) for lat, long, radius in zip(lats, longs, radii)]
+    return radii, covered_samples
+
+
+class CircleCoverage:
+    """
+    Overlaps and coverage of a list of circles, measured on COVERAGE_SAMPLES
+    points spread over each circle.
+
+    The sample points, and which of them each circle covers, are computed on
+    first use and shared by prune and select, so a grid that is pruned and then
+    cut down to a limit is sampled once. Both work on circle indices, so select
+    can pick from the circles prune kept.
+    """
+
+    def __init__(self, circles):
+        self.circles = list(circles)
+        self._radii = None
+        self._covered_samples = None
+        self._weights = None
+
+    def _samples(self):
+        if self._covered_samples is None:
+            self._radii, self._covered_samples = _coverage_samples(self.circles)
+        return self._radii, self._covered_samples
+
+    def _candidates(self, candidates):
+        return np.arange(len(self.circles)) if candidates is None else np.asarray(candidates, dtype=np.int64)
+
+    def prune(self, overlap_threshold, candidates=None):
+        """
+        Drops circles that are mostly covered by circles already kept.
+
+        Circles are considered largest first. A circle is dropped when more than
+        overlap_threshold of its sample points already lie inside kept circles;
+        a circle with none of its points covered is always kept.
+
+        Args:
+            overlap_threshold: Covered share of a circle, between 0 and 1, above which it is dropped.
+                At 1 only circles covered entirely are dropped.
+            candidates: Indices of the circles to consider, default all of them.
+
+        Returns:
+            The indices of the kept circles, in their original order.
+        """
+        candidates = self._candidates(candidates)
+        if len(candidates) == 0:
+            return candidates
+        radii, covered_samples = self._samples()
+        covered = np.zeros(len(self.circles) * COVERAGE_SAMPLES, dtype=bool)
+        kept = []
+
+        for i in candidates[np.argsort(-radii[candidates], kind='stable')]:
+            own_covered = covered[i * COVERAGE_SAMPLES:(i + 1) * COVERAGE_SAMPLES].mean()
+            if own_covered > 0 and (own_covered > overlap_threshold or own_covered == 1):
+                continue
+            kept.append(i)
+            covered[covered_samples[i]] = True
+
+        return np.sort(np.array(kept, dtype=np.int64))
+
+    def _sample_weights(self):
+        # Sample density at each point is the sum over the circles containing it of
+        # COVERAGE_SAMPLES / area; weighting by its inverse makes the weights add up to area.
+        # Every circle counts, candidate or not, since every circle placed samples.
+        if self._weights is None:
+            radii, covered_samples = self._samples()
+            density = np.zeros(len(self.circles) * COVERAGE_SAMPLES)
+            for samples, radius in zip(covered_samples, radii):
+                density[samples] += COVERAGE_SAMPLES / (np.pi * radius ** 2)
+            self._weights = 1 / density
+        return self._weights
+
+    def select(self, limit, candidates=None):
+        """
+        Chooses limit circles that together cover the largest area.
+
+        Greedy maximum coverage: each step takes the circle adding the most area not
+        yet covered. Every sample point stands for an equal share of the ground,
+        however many circles overlap there, so overlapping circles are not counted twice.
+
+        Args:
+            limit: Number of circles to keep.
+            candidates: Indices of the circles to choose from, default all of them.
+
+        Returns:
+            The indices of the chosen circles, in the order they were chosen.
+        """
+        candidates = self._candidates(candidates)
+        if len(candidates) <= limit:
+            return candidates
+        _, covered_samples = self._samples()
+        weights = self._sample_weights()
+
+        covered = np.zeros(len(weights), dtype=bool)
+        # Lazy greedy: gains only shrink, so a stale gain is an upper bound
+        heap = [(-weights[covered_samples[i]].sum(), i) for i in candidates.tolist()]
+        heapq.heapify(heap)
+        chosen = []
+        while heap and len(chosen) < limit:
+            _, i = heapq.heappop(heap)
+            samples = covered_samples[i]
+            gain = weights[samples[~covered[samples]]].sum()
+            if heap and gain < -heap[0][0]:
+                heapq.heappush(heap, (-gain, i))
+                continue
+            chosen.append(i)
+            covered[samples] = True
+        return np.array(chosen, dtype=np.int64)
+
+
+def prune_overlapping_circles(circles, overlap_threshold):
+    """
+    Drops circles that are mostly covered by circles already kept (see CircleCoverage.prune).
+
+    Args:
+        circles: List of (latitude, longitude, radius) tuples.
+        overlap_threshold: Covered share of a circle, between 0 and 1, above which it is dropped.
+
+    Returns:
+        The kept circles, in their original order.
+    """
+    return [circles[i] for i in CircleCoverage(circles).prune(overlap_threshold)]
+
+
+def select_max_coverage(circles, limit):
+    """
+    Chooses limit circles that together cover the largest area (see CircleCoverage.select).
+
+    Args:
+        circles: List of (latitude, longitude, radius) tuples.
+        limit: Number of circles to keep.
+
+    Returns:
+        The chosen circles, in the order they were chosen.
+    """
+    if len(circles) <= limit:
+        return list(circles)
+    return [circles[i] for i in CircleCoverage(circles).select(limit)]
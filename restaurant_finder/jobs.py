@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import fsspec
+
+from restaurant_finder.call_scheduler import CallScheduler
+from restaurant_finder.checkpoint import new_run_id
+from restaurant_finder.config import JOB_LOCATION, JOB_PROGRESS_SAVE_SECONDS, JOB_WORKERS
+from restaurant_finder.main import find_restaurants_in_batches
+from restaurant_finder.records import Restaurant, records_to_json
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+# Found on disk as queued or running, but no longer running in this process (e.g. after a restart)
+JOB_INTERRUPTED = 'interrupted'
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+
+def new_job_id():
+    # Timestamped like run ids, with a random suffix so jobs submitted in the same second do not collide
+    return f"{new_run_id()}_{uuid.uuid4().hex[:6]}"
+
+
+class CrawlJob:
+    """
+    State of one background crawl: its parameters, status, live counts and timing.
+
+    The job id is also the run id of the crawl's checkpoint, so an interrupted
+    job can be resumed from the command line with --resume <job_id> and the
+    checkpoint_location kept in its params.
+    """
+
+    def __init__(self, job_id, params, status=JOB_QUEUED, progress=None, error=None,
+                 submitted_at=None, started_at=None, finished_at=None):
+        self.job_id = job_id
+        self.params = params
+        self.status = status
+        self.progress = progress or {}
+        self.error = error
+        self.submitted_at = submitted_at or datetime.now().isoformat()
+        self.started_at = started_at
+        self.finished_at = finished_at
+
+    @property
+    def active(self):
+        return self.status in ACTIVE_STATUSES
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_dict(self):
+        return {'job_id': self.job_id, 'params': self.params, 'status': self.status,
+                'progress': dict(self.progress), 'error': self.error, 'submitted_at': self.submitted_at,
+                'started_at': self.started_at, 'finished_at': self.finished_at}
+
+
+class JobManager:
+    """
+    Runs crawls on a pool of background threads and keeps track of them.
+
+    Crawls are submitted with the keyword arguments of find_restaurants_in_batches
+    and identified by a job id. While a crawl runs, its counts are updated after
+    every searched cell and can be polled with get. The state of each job is kept
+    under location/<job_id>/job.json and the restaurants it found under
+    location/<job_id>/restaurants.json, so finished jobs can be reopened after
+    the app restarts. Crawls are checkpointed under location/checkpoints/ unless
+    a checkpoint_location is given, so with a gs:// location an interrupted
+    job can still be resumed after the container is replaced. The location can
+    be a local directory or a gs:// prefix.
+
+    One instance is shared by every session of the app, so crawls started by
+    different people run side by side instead of blocking each other. Their
+    Places API calls all go through one CallScheduler, so together they stay
+    within the project's quota.
+    """
+
+    def __init__(self, location=JOB_LOCATION, max_workers=JOB_WORKERS, crawl=find_restaurants_in_batches,
+                 save_every_seconds=JOB_PROGRESS_SAVE_SECONDS):
+        self.location = location.rstrip('/')
+        self.checkpoint_location = f"{self.location}/checkpoints"
+        self.crawl = crawl
+        self.save_every_seconds = save_every_seconds
+        self.scheduler = CallScheduler()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix='crawl-job')
+        self._lock = threading.Lock()
+        self._jobs = self._load_jobs()
+
+    def _path(self, job_id, name):
+        return f"{self.location}/{job_id}/{name}"
+
+    def _write_json(self, path, data):
+        if '://' in self.location:
+            with fsspec.open(path, 'w') as f:
+                json.dump(data, f, default=records_to_json)
+        else:
+            # Write next to the target and rename, so readers never see a truncated file
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(data, f, default=records_to_json)
+            os.replace(path + '.tmp', path)
+
+    def _load_jobs(self):
+        fs, root = fsspec.core.url_to_fs(self.location)
+        jobs = {}
+        for path in fs.glob(f"{root}/*/job.json"):
+            with fs.open(path, 'r') as f:
+                job = CrawlJob.from_dict(json.load(f))
+            if job.active:
+                job.status = JOB_INTERRUPTED
+            jobs[job.job_id] = job
+        return jobs
+
+    def _save(self, job):
+        with self._lock:
+            state = job.to_dict()
+        self._write_json(self._path(job.job_id, 'job.json'), state)
+
+    def submit(self, **crawl_kwargs):
+        """
+        Queues a crawl and returns its job id straight away.
+
+        Args:
+            **crawl_kwargs: Keyword arguments for find_restaurants_in_batches. run_id,
+                scheduler and progress are set by the manager, and checkpoint_location
+                defaults to the manager's.
+
+        Returns:
+            The job id.
+        """
+        job_id = new_job_id()
+        crawl_kwargs.setdefault('checkpoint_location', self.checkpoint_location)
+        params = {name: value for name, value in crawl_kwargs.items() if name != 'latlong_list_input'}
+        params['n_points'] = len(crawl_kwargs.get('latlong_list_input', []))
+        job = CrawlJob(job_id, params)
+        with self._lock:
+            self._jobs[job_id] = job
+        self._save(job)
+        self._executor.submit(self._run, job, crawl_kwargs)
+        print(f"Submitted crawl job {job_id}")
+        return job_id
+
+    def _run(self, job, crawl_kwargs):
+        last_save = time.monotonic()
+
+        def progress(counts):
+            nonlocal last_save
+            with self._lock:
+                job.progress = counts
+            if time.monotonic() - last_save >= self.save_every_seconds:
+                self._save(job)
+                last_save = time.monotonic()
+
+        with self._lock:
+            job.status = JOB_RUNNING
+            job.started_at = datetime.now().isoformat()
+        self._save(job)
+        try:
+            restaurants = self.crawl(**crawl_kwargs, run_id=job.job_id, scheduler=self.scheduler, progress=progress)
+            self._write_json(self._path(job.job_id, 'restaurants.json'), restaurants)
+            with self._lock:
+                job.status = JOB_DONE
+                job.progress = dict(job.progress, places_found=len(restaurants))
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                job.status = JOB_FAILED
+                job.error = f"{type(e).__name__}: {e}"
+        with self._lock:
+            job.finished_at = datetime.now().isoformat()
+        self._save(job)
+
+    def get(self, job_id):
+        """
+        Returns the CrawlJob with this id, or None if there is no such job.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else CrawlJob.from_dict(job.to_dict())
+
+    def list_jobs(self):
+        """
+        Returns every known job, most recently submitted first.
+        """
+        with self._lock:
+            jobs = [CrawlJob.from_dict(job.to_dict()) for job in self._jobs.values()]
+        return sorted(jobs, key=lambda job: job.submitted_at, reverse=True)
+
+    def load_result(self, job_id):
+        """
+        Reads the restaurants found by a finished job, as a dict of Restaurant records keyed by place id.
+        """
+        with fsspec.open(self._path(job_id, 'restaurants.json'), 'r') as f:
+            return {restaurant_id: Restaurant.from_dict(restaurant_data)
+                    for restaurant_id, restaurant_data in json.load(f).items()}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -1,10 +1,29 @@
-from restaurant_finder.data_processing import iterate_over_calls, update_json_and_save, upload_restaurants_to_bigquery
-from restaurant_finder.aux_functions import get_bucket_name, string_to_tuple, get_latlong_from_bucket
-from restaurant_finder.geo_functions import generate_spoke_points
+from restaurant_finder.data_processing import compact_restaurant_store, iterate_over_calls, jitter_grid, migrate_json_store, update_json_and_save, upload_restaurants_to_bigquery
+from restaurant_finder.aux_functions import get_bucket_name, string_to_tuple, get_latlong_from_bucket, get_latlong_from_zone
+from restaurant_finder.refinement import plan_refinement
+from restaurant_finder.config import (
+    BQ_SYNC_MODE,
+    CHECKPOINT_LOCATION,
+    DEFAULT_CACHE_TTL_HOURS,
+    DEFAULT_CALLS_PER_MINUTE,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_MIN_RADIUS,
+    DEFAULT_OVERLAP_THRESHOLD,
+)
+from restaurant_finder.call_scheduler import CallScheduler
+from restaurant_finder.checkpoint import CrawlCheckpoint, new_run_id
+from restaurant_finder.density_map import DensityMap
+from restaurant_finder.geo_functions import CircleCoverage
+from restaurant_finder.response_cache import ResponseCache
 import argparse
 from datetime import datetime
 import os
-import random # Moved here as it's used in find_restaurants_in_batches
+import threading
+
+# Serialises the end of runs going on in this process (e.g. background jobs of the
+# Streamlit app): the store update, BigQuery sync and density map update each
+# read, then rewrite, state shared by every run
+_store_lock = threading.Lock()
 
 
 def find_restaurants_in_batches(latlong_list_input: list[tuple[float, float, int]],
@@ -12,7 +31,21 @@ def find_restaurants_in_batches(latlong_list_input: list[tuple[float, float, int
                                 radius_input: int, # Although radius is part of latlong_list_input, it's kept for consistency with original args
                                 limit_input: int,
                                 amount_of_noise_input: float,
-                                spoke_generation_radius_meters: int = 100):
+                                min_radius_meters: int = DEFAULT_MIN_RADIUS,
+                                max_workers: int = DEFAULT_MAX_WORKERS,
+                                use_cache: bool = True,
+                                cache_ttl_hours: float = DEFAULT_CACHE_TTL_HOURS,
+                                max_calls: int | None = None,
+                                calls_per_minute: int = DEFAULT_CALLS_PER_MINUTE,
+                                run_id: str | None = None,
+                                resume: bool = False,
+                                checkpoint_location: str = CHECKPOINT_LOCATION,
+                                bq_sync_mode: str = BQ_SYNC_MODE,
+                                use_density_map: bool = True,
+                                overlap_threshold: float = DEFAULT_OVERLAP_THRESHOLD,
+                                prune_overlaps: bool = True,
+                                scheduler: CallScheduler | None = None,
+                                progress=None):
     """
     Finds restaurants in batches based on a list of latitude/longitude points.
 
@@ -22,54 +55,114 @@ def find_restaurants_in_batches(latlong_list_input: list[tuple[float, float, int
         radius_input: The default search radius (integer) - used if not in latlong_list_input tuples.
         limit_input: The limit for the number of points to process.
         amount_of_noise_input: The amount of noise to add to coordinates.
+        min_radius_meters: Saturated cells are not subdivided into children smaller than this.
+        max_workers: Maximum number of concurrent Places API calls.
+        use_cache: Whether to serve repeated Places API calls from the local response cache.
+        cache_ttl_hours: How long cached responses stay valid.
+        max_calls: Hard cap on billed Places API calls for the whole run, including refinement. None for no cap.
+        calls_per_minute: Rate limit for Places API calls, matching the project's quota.
+        run_id: Identifier of the run's checkpoint. A new one is generated if None.
+        resume: Continue the checkpointed run run_id instead of starting from latlong_list_input.
+        checkpoint_location: Local directory or gs:// prefix for checkpoints.
+        bq_sync_mode: "incremental" to MERGE only new and changed rows into BigQuery, "full" to reload the table.
+        use_density_map: Plan the starting circles from the density map of earlier runs, and update it.
+        overlap_threshold: Points whose circle has more than this share of its area inside other circles
+            are dropped, in (0, 1]; at 1 only fully covered circles are.
+        prune_overlaps: Whether to drop overlapping points at all. Without it, the grid is only cut down to limit_input.
+        scheduler: Optional CallScheduler shared with other runs. This run's calls wait on its
+            rate limit, so concurrent runs stay within the quota together, and still count against max_calls.
+        progress: Optional callable receiving the crawl's counts after each searched cell (see iterate_over_calls).
 
     Returns:
-        A dictionary of restaurants found.
+        A dictionary of restaurants found, as merged into the store (with first_seen set).
     """
     
     # Get bucket name here as it's needed for saving results
+    if prune_overlaps and not 0 < overlap_threshold <= 1:
+        raise ValueError(f"overlap_threshold must be above 0 and at most 1, got {overlap_threshold}")
+
     restaurant_bucket_name = get_bucket_name(project_id=project_id_input, version_id="latest")
 
-    # Apply limit
-    n_points = len(latlong_list_input)
-    if n_points > limit_input:
-        print(f"Number of points {n_points} is above the set limit of {limit_input}")
-        print("Going to randomly sample the points")
-        random_indices = random.sample(range(n_points), limit_input)
-        latlong_list_processed = [latlong_list_input[i] for i in random_indices]
+    if resume:
+        if not run_id:
+            raise ValueError("A run_id is required to resume a run.")
+        checkpoint = CrawlCheckpoint.load(run_id, location=checkpoint_location)
     else:
-        latlong_list_processed = latlong_list_input
-        
+        checkpoint = CrawlCheckpoint(run_id or new_run_id(), location=checkpoint_location)
+    print(f'Checkpointing run {checkpoint.run_id} to {checkpoint.path}')
+
+    # Prune overlapping circles, then apply limit
+    if checkpoint.resumed:
+        # The grid to search comes from the checkpoint
+        latlong_list_processed = []
+    else:
+        # Both steps measure coverage on the same sample points, computed once and only if needed
+        coverage = CircleCoverage(latlong_list_input)
+        kept = range(len(latlong_list_input))
+        if prune_overlaps:
+            kept = coverage.prune(overlap_threshold)
+            print(f"Pruning overlapping circles kept {len(kept)} of {len(latlong_list_input)} points")
+        if len(kept) > limit_input:
+            print(f"Number of points {len(kept)} is above the set limit of {limit_input}")
+            print("Going to choose the points that cover the most area")
+            kept = coverage.select(limit_input, kept)
+        latlong_list_processed = [latlong_list_input[i] for i in kept]
+
+    # Noise is applied before planning, so split and merged circles keep their shape when searched
+    latlong_list_processed = jitter_grid(latlong_list_processed, amount_of_noise_input)
+    density_map = DensityMap.load(restaurant_bucket_name) if use_density_map else None
+    if density_map is not None and not checkpoint.resumed:
+        latlong_list_processed = density_map.plan(latlong_list_processed, min_radius_meters)
+
     print('This is the lat long grid to be processed:', latlong_list_processed)
     print('The latlong_list_processed has', str(len(latlong_list_processed)), 'elements')
 
-    # Pass over the grid
-    restaurants, saturated_list = iterate_over_calls(latlong_list_processed, 
-                                                     restaurants={}, 
-                                                     project_id=project_id_input, 
-                                                     amount_of_noise=amount_of_noise_input)
-    print('After first grid we found', str(len(restaurants)), 'restaurants')
+    # Saturated cells are refined as soon as they are found, so the refinement
+    # runs alongside the rest of the grid instead of after it
+    unresolved = []
+
+    def expand_saturated(lat, long, radius_val, depth, new_place_count, proven_radius, partition, primary_types):
+        # A refined cell that brought nothing new is not worth splitting further
+        if depth > 0 and new_place_count == 0:
+            return []
+        # Smaller circles beyond the 20th nearest place, or the same circle once per group of types
+        children = plan_refinement(lat, long, radius_val, proven_radius, partition, primary_types)
+        searchable = [child for child in children if child[2] >= min_radius_meters]
+        if len(searchable) < len(children):
+            unresolved.append((lat, long, radius_val))
+        return searchable
+
+    cache = ResponseCache(ttl_hours=cache_ttl_hours) if use_cache else None
+    run_scheduler = CallScheduler(max_calls=max_calls, calls_per_minute=calls_per_minute, shared_rate=scheduler)
+    try:
+        restaurants, saturated_list = iterate_over_calls(latlong_list_processed,
+                                                         restaurants={},
+                                                         project_id=project_id_input,
+                                                         amount_of_noise=0,
+                                                         max_workers=max_workers,
+                                                         expand_saturated=expand_saturated,
+                                                         cache=cache,
+                                                         scheduler=run_scheduler,
+                                                         checkpoint=checkpoint,
+                                                         progress=progress)
+    finally:
+        if cache is not None:
+            cache.close()
+    print('After the grid and refined cells we found a TOTAL', str(len(restaurants)), 'restaurants')
     print('The saturated_list has', str(len(saturated_list)), 'elements')
+    print(str(len(unresolved)), 'cells were still saturated at the minimum radius')
+    run_scheduler.report()
 
-    # Take the saturated list and generate spoke points
-    points_list: list[tuple[float, float, int]] = []
-    for lat, long, radius_val in saturated_list: # Assuming radius_val from saturated_list is what we need
-        points = generate_spoke_points(lat, long, spoke_generation_radius_meters)  # Use the new parameter
-        # Ensure radius is at least 1, e.g. by max(1, int(radius_val / 2))
-        new_radius = max(1, int(radius_val / 2))
-        points_with_radius = [(new_lat, new_long, new_radius) for new_lat, new_long in points]
-        points_list.extend(points_with_radius)
-     
-    if points_list: # Only run if there are points to process
-        restaurants, _ = iterate_over_calls(points_list, 
-                                            restaurants=restaurants, 
-                                            project_id=project_id_input, 
-                                            amount_of_noise=amount_of_noise_input)
-        print('After expanded list we found a TOTAL', str(len(restaurants)), 'restaurants')
-    else:
-        print('No points in saturated list to expand search.')
+    with _store_lock:
+        # The crawl's restaurants come back with the first_seen and displayName kept in the store
+        all_restaurants, restaurants = update_json_and_save(new_data=restaurants, bucket_name=restaurant_bucket_name,
+                                                            project_id=project_id_input, bq_sync_mode=bq_sync_mode)
 
-    update_json_and_save(new_data=restaurants, bucket_name=restaurant_bucket_name, project_id=project_id_input)
+        if density_map is not None:
+            # Read again, so the searches of runs that finished since this one started are kept
+            density_map = DensityMap.load(restaurant_bucket_name)
+            density_map.update(all_restaurants, searched_cells=checkpoint.processed, saturated_cells=saturated_list)
+            density_map.save(restaurant_bucket_name)
     
     return restaurants
 
@@ -84,23 +177,73 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("--radius", required=False, type=int, default=666)
     parser.add_argument("--latlong_list", required=False, default="postcodes/latlong.csv")
+    parser.add_argument("--maps_zone_name", required=False, default=None)
     parser.add_argument("--limit", required=False, type=int, default=20)
-    parser.add_argument("--amount_of_noise", required=False, type=float, default=0.002)
+    # Defaults to 0.002 for postcode grids and to 0 for zone grids (see below)
+    parser.add_argument("--amount_of_noise", required=False, type=float, default=None)
     parser.add_argument("--latlong_resolution", required=False, type=int, default=2)
-    parser.add_argument("--spoke_radius", required=False, type=int, default=100)  # New argument
+    parser.add_argument("--overlap_threshold", required=False, type=float, default=DEFAULT_OVERLAP_THRESHOLD)
+    parser.add_argument("--no_prune", "--no-prune", dest="no_prune", action="store_true")
+    parser.add_argument("--min_radius", required=False, type=int, default=DEFAULT_MIN_RADIUS)
+    parser.add_argument("--max_workers", required=False, type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--cache_ttl", "--cache-ttl", dest="cache_ttl", required=False, type=float, default=DEFAULT_CACHE_TTL_HOURS)
+    parser.add_argument("--no_cache", "--no-cache", dest="no_cache", action="store_true")
+    parser.add_argument("--max_calls", required=False, type=int, default=None)
+    parser.add_argument("--calls_per_minute", required=False, type=int, default=DEFAULT_CALLS_PER_MINUTE)
+    parser.add_argument("--run_id", required=False, default=None)
+    parser.add_argument("--resume", required=False, default=None, metavar="RUN_ID")
+    parser.add_argument("--checkpoint_location", required=False, default=CHECKPOINT_LOCATION)
+    parser.add_argument("--bq_sync", required=False, choices=["incremental", "full"], default=BQ_SYNC_MODE)
+    parser.add_argument("--migrate_store", action="store_true")
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--no_density_map", "--no-density-map", dest="no_density_map", action="store_true")
     args = parser.parse_args()
+    if not 0 < args.overlap_threshold <= 1:
+        parser.error("--overlap_threshold must be above 0 and at most 1")
 
     print('These are the arguments passed: \n', args)
 
+    if args.migrate_store:
+        # One-time conversion of the legacy single-file store into the first base snapshot, then exit
+        try:
+            migrate_json_store(get_bucket_name(project_id=project_id, version_id="latest"), force=args.force)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        raise SystemExit(0)
+
+    if args.compact:
+        # Fold the deltas written since the last base snapshot into a new one, then exit
+        compact_restaurant_store(get_bucket_name(project_id=project_id, version_id="latest"))
+        raise SystemExit(0)
+
     # This part remains in main, as it prepares the input for the function
     # For command-line execution, we still fetch from bucket.
     # The Streamlit app will prepare and pass this list directly.
-    restaurant_bucket_name_main = get_bucket_name(project_id=project_id, version_id="latest")
-    initial_latlong_list = get_latlong_from_bucket(project_id=project_id,
-                                                   bucket_name=restaurant_bucket_name_main,
-                                                   latlong_list=args.latlong_list, 
-                                                   latlong_resolution=args.latlong_resolution,
-                                                   radius=args.radius) # args.radius is used here to construct items in initial_latlong_list
+    if args.resume:
+        # The remaining grid is read from the checkpoint
+        initial_latlong_list = []
+    elif args.maps_zone_name:
+        # Plan a hexagonal grid over the zone's bounding box instead of reading the postcode CSV
+        initial_latlong_list = get_latlong_from_zone(project_id=project_id,
+                                                     maps_zone_name=args.maps_zone_name,
+                                                     radius=args.radius)
+    else:
+        restaurant_bucket_name_main = get_bucket_name(project_id=project_id, version_id="latest")
+        initial_latlong_list = get_latlong_from_bucket(project_id=project_id,
+                                                       bucket_name=restaurant_bucket_name_main,
+                                                       latlong_list=args.latlong_list, 
+                                                       latlong_resolution=args.latlong_resolution,
+                                                       radius=args.radius) # args.radius is used here to construct items in initial_latlong_list
+
+    if args.amount_of_noise is None:
+        # Noise moves hexagonal zone circles off the lattice, which opens gaps between them
+        amount_of_noise = 0 if args.maps_zone_name else 0.002
+    else:
+        amount_of_noise = args.amount_of_noise
+        if args.maps_zone_name and amount_of_noise:
+            print(f"Warning: --amount_of_noise {amount_of_noise} moves zone circles off the hexagonal lattice "
+                  f"and can leave gaps between them")
 
     # Call the refactored function
     found_restaurants = find_restaurants_in_batches(
@@ -108,8 +251,20 @@ if __name__ == '__main__':
         project_id_input=project_id,
         radius_input=args.radius, # Pass original radius for consistency, though it's mainly used by get_latlong_from_bucket now
         limit_input=int(args.limit),
-        amount_of_noise_input=float(args.amount_of_noise),
-        spoke_generation_radius_meters=args.spoke_radius  # Pass the new argument
+        amount_of_noise_input=float(amount_of_noise),
+        min_radius_meters=args.min_radius,
+        max_workers=args.max_workers,
+        use_cache=not args.no_cache,
+        cache_ttl_hours=args.cache_ttl,
+        max_calls=args.max_calls,
+        calls_per_minute=args.calls_per_minute,
+        run_id=args.resume or args.run_id,
+        resume=bool(args.resume),
+        checkpoint_location=args.checkpoint_location,
+        bq_sync_mode=args.bq_sync,
+        use_density_map=not args.no_density_map,
+        overlap_threshold=args.overlap_threshold,
+        prune_overlaps=not args.no_prune
     )
 
     print(f"Function find_restaurants_in_batches completed. Found {len(found_restaurants)} restaurants.")
@@ -1,50 +1,140 @@
+import copy
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
 
 from restaurant_finder.config import (
     EXCLUDED_PRIMARY_TYPES,
     EXCLUDED_TYPES,
     INCLUDED_PRIMARY_TYPES,
+    MAX_RATE_LIMIT_RETRIES,
 )
+from restaurant_finder.call_scheduler import STAGE_GRID
+from restaurant_finder.response_cache import hash_type_filters
+
+PLACES_SEARCH_NEARBY_URL = 'https://places.googleapis.com/v1/places:searchNearby'
+PLACES_FIELD_MASK = 'places.displayName,places.id,places.shortFormattedAddress,places.priceLevel,places.rating,places.primaryType,places.userRatingCount,places.types,places.location'
+
+
+class PlacesClient:
+    """
+    Reusable client for the Places searchNearby endpoint.
+
+    Holds one keep-alive session with a connection pool sized for the crawl's
+    concurrency, plus the headers and type filters built once per run.
+    Successful responses are read from and written to the optional ResponseCache.
+    Calls that miss the cache go through the optional CallScheduler, which
+    enforces the run's call budget and rate limit.
+    A single instance can be shared between threads.
+    """
 
+    def __init__(self, api_key, pool_size=10, timeout=10, cache=None, scheduler=None):
+        self.timeout = timeout
+        self.cache = cache
+        self.scheduler = scheduler
 
-def send_request(lat, long, radius, rank, API_KEY):
-
-    url = 'https://places.googleapis.com/v1/places:searchNearby'
-    headers = {
-    'Content-Type': 'application/json',
-    'X-Goog-Api-Key': API_KEY,
-    'X-Goog-FieldMask': 'places.displayName,places.id,places.shortFormattedAddress,places.priceLevel,places.rating,places.primaryType,places.userRatingCount,places.types'
-    }
-    data = {
-    "rankPreference": rank,
-    "includedPrimaryTypes": INCLUDED_PRIMARY_TYPES,
-    "excludedPrimaryTypes": EXCLUDED_PRIMARY_TYPES,
-    "excludedTypes": EXCLUDED_TYPES,
-    "locationRestriction": {
-        "circle": {
-        "center": {
-            "latitude": lat,
-            "longitude": long
-        },
-        "radius": radius
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, int(pool_size)))
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept-Encoding': 'gzip',
+            'X-Goog-Api-Key': api_key,
+            'X-Goog-FieldMask': PLACES_FIELD_MASK,
+        })
+
+        self.payload_template = {
+            "includedPrimaryTypes": list(INCLUDED_PRIMARY_TYPES),
+            "excludedPrimaryTypes": list(EXCLUDED_PRIMARY_TYPES),
+            "excludedTypes": list(EXCLUDED_TYPES),
         }
-    }
-    }
-
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=10) # Added timeout
-
-        if response.status_code == 200:
-            response_json = response.json()
-            return response_json
-        else:
-            print(f"Error: API request failed with status code {response.status_code}")
-            print(f"Response text: {response.text}")
-            return {"error": f"API request failed with status code {response.status_code}", "details": response.text}
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error: RequestException during API call: {e}")
-        return {"error": f"RequestException: {e}"}
-    except ValueError as e: # Catch errors during response.json() parsing if status was 200 but content is not valid JSON
-        print(f"Error: Failed to parse JSON response: {e}")
-        return {"error": f"JSON parsing error: {e}"}
\ No newline at end of file
+        # The field mask is part of the hash, so responses fetched with fewer fields are not reused
+        self.filters_hash = hash_type_filters({**self.payload_template, 'fieldMask': PLACES_FIELD_MASK})
+        self._partition_hashes = {}
+
+    def filters_hash_for(self, included_types=None):
+        """
+        Hash of the type filters of a request, with included_types replacing the included primary types.
+        """
+        if included_types is None:
+            return self.filters_hash
+        key = tuple(included_types)
+        filters_hash = self._partition_hashes.get(key)
+        if filters_hash is None:
+            filters_hash = hash_type_filters({**self.payload_template, 'includedPrimaryTypes': list(key),
+                                              'fieldMask': PLACES_FIELD_MASK})
+            self._partition_hashes[key] = filters_hash
+        return filters_hash
+
+    def build_payload(self, lat, long, radius, rank, included_types=None):
+        # Shallow copy: the type lists are shared with the template and never mutated
+        data = copy.copy(self.payload_template)
+        if included_types is not None:
+            data["includedPrimaryTypes"] = list(included_types)
+        data["rankPreference"] = rank
+        data["locationRestriction"] = {
+            "circle": {
+                "center": {
+                    "latitude": lat,
+                    "longitude": long
+                },
+                "radius": radius
+            }
+        }
+        return data
+
+    def search_nearby(self, lat, long, radius, rank, stage=STAGE_GRID, included_types=None):
+        """
+        Searches one circle. included_types, if given, replaces INCLUDED_PRIMARY_TYPES
+        for this call only, to search a circle again for one group of types.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(lat, long, radius, rank, self.filters_hash_for(included_types))
+            cached_response = self.cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
+
+        if self.scheduler is not None and not self.scheduler.acquire(stage):
+            return {"error": "API call budget exhausted", "budget_exhausted": True}
+
+        data = self.build_payload(lat, long, radius, rank, included_types)
+
+        try:
+            response = self.session.post(PLACES_SEARCH_NEARBY_URL, json=data, timeout=self.timeout)
+            # Quota exceeded: back off and retry, the retried call is not billed twice
+            for attempt in range(MAX_RATE_LIMIT_RETRIES):
+                if response.status_code != 429:
+                    break
+                time.sleep(2 ** attempt)
+                if self.scheduler is not None:
+                    self.scheduler.wait_for_token()
+                response = self.session.post(PLACES_SEARCH_NEARBY_URL, json=data, timeout=self.timeout)
+
+            if response.status_code == 200:
+                response_json = response.json()
+                if cache_key is not None:
+                    self.cache.set(cache_key, response_json)
+                return response_json
+            else:
+                print(f"Error: API request failed with status code {response.status_code}")
+                print(f"Response text: {response.text}")
+                return {"error": f"API request failed with status code {response.status_code}", "details": response.text}
+
+        except requests.exceptions.RequestException as e:
+            print(f"Error: RequestException during API call: {e}")
+            return {"error": f"RequestException: {e}"}
+        except ValueError as e: # Catch errors during response.json() parsing if status was 200 but content is not valid JSON
+            print(f"Error: Failed to parse JSON response: {e}")
+            return {"error": f"JSON parsing error: {e}"}
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
@@ -0,0 +1,107 @@
+import sys
+
+import pandas as pd
+
+# Compact in-memory representation of the restaurants found by a crawl.
+# A crawl can hold hundreds of thousands of places, so each one is a slotted
+# object instead of a dict, and the values repeated across places (dates,
+# price levels, primary types and whole type lists) are shared, not copied.
+
+_types_pool = {}
+
+
+def intern_value(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def intern_types(types):
+    """
+    Returns a shared tuple of interned strings for a list of place types.
+    """
+    types = tuple(sys.intern(place_type) for place_type in types or ())
+    return _types_pool.setdefault(types, types)
+
+
+class Restaurant:
+    """
+    One restaurant in the store, keyed elsewhere by its place id.
+
+    Dates are 'YYYY-MM-DD' strings. first_seen is None for entries older than
+    that field, and latitude/longitude are None for entries stored before
+    locations were requested. Use from_place for Places API results and
+    from_dict / to_dict at the JSON boundaries.
+    """
+
+    __slots__ = ('displayName', 'shortFormattedAddress', 'rating', 'priceLevel', 'last_seen',
+                 'first_seen', 'primary_type', 'user_rating_count', 'types', 'latitude', 'longitude')
+
+    def __init__(self, displayName='NA', shortFormattedAddress='NA', rating=0, priceLevel='NA',
+                 last_seen=None, first_seen=None, primary_type=None, user_rating_count=0, types=(),
+                 latitude=None, longitude=None):
+        self.displayName = displayName
+        self.shortFormattedAddress = shortFormattedAddress
+        self.rating = rating
+        self.priceLevel = intern_value(priceLevel)
+        self.last_seen = intern_value(last_seen)
+        self.first_seen = intern_value(first_seen)
+        self.primary_type = intern_value(primary_type)
+        self.user_rating_count = user_rating_count
+        self.types = intern_types(types)
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @classmethod
+    def from_place(cls, place, seen_date):
+        """
+        Builds a record from one place of a searchNearby response.
+        """
+        location = place.get('location', {})
+        return cls(displayName=place['displayName']['text'],
+                   shortFormattedAddress=place.get('shortFormattedAddress', 'NA'),
+                   rating=place.get('rating', 0),
+                   priceLevel=place.get('priceLevel', 'NA'),
+                   last_seen=seen_date,
+                   primary_type=place.get('primaryType', 'NA'),
+                   user_rating_count=place.get('userRatingCount', 0),
+                   types=place.get('types', []),
+                   latitude=location.get('latitude'),
+                   longitude=location.get('longitude'))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['types'] = list(self.types)
+        # Older entries have no first_seen; they are written without the key, as in the JSON store
+        if data['first_seen'] is None:
+            del data['first_seen']
+        return data
+
+    def __eq__(self, other):
+        if not isinstance(other, Restaurant):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"Restaurant({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+
+def records_to_json(value):
+    """
+    `default` hook for json.dump, so dicts of records are written without building dict copies first.
+    """
+    if isinstance(value, Restaurant):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def restaurants_to_frame(restaurants):
+    """
+    Builds a DataFrame indexed by place id with one column per record field.
+    """
+    records = list(restaurants.values())
+    columns = {name: [getattr(record, name) for record in records] for name in Restaurant.__slots__}
+    columns['types'] = [list(types) for types in columns['types']]
+    return pd.DataFrame(columns, index=pd.Index(list(restaurants.keys())))
@@ -0,0 +1,87 @@
+from collections import Counter
+
+from restaurant_finder.config import MAX_RESULTS_PER_SEARCH, PRIMARY_TYPE_PARTITIONS
+from restaurant_finder.geo_functions import cover_annulus
+
+# Children per saturated circle below the first level of a spatial split (tile_circle)
+SPATIAL_BRANCHING = 7
+
+_partition_of_type = {place_type: partition
+                      for partition, place_types in PRIMARY_TYPE_PARTITIONS.items()
+                      for place_type in place_types}
+
+
+def estimate_places(radius, proven_radius):
+    """
+    Estimated number of places in a saturated circle, assuming the density of its
+    proven disc (MAX_RESULTS_PER_SEARCH places within proven_radius) holds across it.
+    Returns None when the proven radius is unknown.
+    """
+    if proven_radius <= 0:
+        return None
+    return MAX_RESULTS_PER_SEARCH * (radius / proven_radius) ** 2
+
+
+def spatial_split_calls(expected_places, first_level_calls=SPATIAL_BRANCHING):
+    """
+    Expected calls to clear a circle of expected_places by splitting it into
+    circles of half the radius, level after level, until none saturates.
+    """
+    calls = 0
+    level_calls = first_level_calls
+    while expected_places >= MAX_RESULTS_PER_SEARCH:
+        calls += level_calls
+        level_calls *= SPATIAL_BRANCHING
+        # Half the radius holds a quarter of the places
+        expected_places /= 4
+    return calls
+
+
+def type_split_calls(expected_places, primary_types):
+    """
+    Expected calls to clear a circle by searching it once per PRIMARY_TYPE_PARTITIONS
+    group, then splitting spatially the groups that still saturate.
+
+    The share of each group is taken from the primary types of the saturated
+    response, smoothed so that no group is assumed empty.
+    """
+    counts = Counter(_partition_of_type[place_type] for place_type in primary_types
+                     if place_type in _partition_of_type)
+    total = sum(counts.values()) + len(PRIMARY_TYPE_PARTITIONS)
+    calls = 0
+    for partition in PRIMARY_TYPE_PARTITIONS:
+        share = (counts[partition] + 1) / total
+        calls += 1 + spatial_split_calls(expected_places * share)
+    return calls
+
+
+def plan_refinement(lat, long, radius, proven_radius, partition, primary_types):
+    """
+    Chooses how to break up a saturated circle: into smaller circles, or into
+    searches of the same circle for each group of types, whichever is expected
+    to take fewer calls.
+
+    A circle already restricted to a group of types is only split spatially,
+    and so is a circle whose proven radius is unknown.
+
+    Args:
+        lat: Latitude of the searched circle.
+        long: Longitude of the searched circle.
+        radius: Radius of the searched circle in meters.
+        proven_radius: Radius of the disc fully covered by the response (see covered_radius).
+        partition: Name of the PRIMARY_TYPE_PARTITIONS group the circle was searched for, or None.
+        primary_types: Primary types of the places in the saturated response.
+
+    Returns:
+        List of (latitude, longitude, radius, partition) tuples for the children.
+    """
+    spatial_children = [(child_lat, child_long, child_radius, partition)
+                        for child_lat, child_long, child_radius in cover_annulus(lat, long, radius, proven_radius)]
+    expected_places = estimate_places(radius, proven_radius)
+    if partition is not None or expected_places is None or not spatial_children:
+        return spatial_children
+
+    spatial_calls = spatial_split_calls(expected_places, first_level_calls=len(spatial_children))
+    if type_split_calls(expected_places, primary_types) < spatial_calls:
+        return [(lat, long, radius, name) for name in PRIMARY_TYPE_PARTITIONS]
+    return spatial_children
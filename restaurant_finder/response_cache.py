@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from restaurant_finder.config import (
+    CACHE_LATLONG_RESOLUTION,
+    DEFAULT_CACHE_MAX_ENTRIES,
+    DEFAULT_CACHE_TTL_HOURS,
+    PLACES_CACHE_PATH,
+)
+
+# How many writes happen between two eviction sweeps
+EVICTION_INTERVAL = 500
+
+
+def hash_type_filters(payload_template):
+    """
+    Returns a short stable hash of the type filters sent with every request.
+
+    Changing INCLUDED_PRIMARY_TYPES or the excluded lists in config.py changes
+    the hash, so responses fetched with the old filters are never reused.
+    """
+    encoded = json.dumps(payload_template, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    Persistent cache of Places searchNearby responses backed by SQLite.
+
+    Entries expire after ttl_hours. Once the cache holds more than max_entries,
+    the oldest entries are evicted. The cache can be shared between threads.
+    """
+
+    def __init__(self, path=PLACES_CACHE_PATH, ttl_hours=DEFAULT_CACHE_TTL_HOURS,
+                 max_entries=DEFAULT_CACHE_MAX_ENTRIES, latlong_resolution=CACHE_LATLONG_RESOLUTION):
+        self.path = path
+        self.ttl_seconds = float(ttl_hours) * 3600
+        self.max_entries = int(max_entries)
+        self.latlong_resolution = int(latlong_resolution)
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, created_at REAL NOT NULL, response TEXT NOT NULL)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)')
+        self._connection.commit()
+        self.evict()
+
+    def make_key(self, lat, long, radius, rank, filters_hash):
+        lat = round(float(lat), self.latlong_resolution)
+        long = round(float(long), self.latlong_resolution)
+        return f'{lat:.{self.latlong_resolution}f}|{long:.{self.latlong_resolution}f}|{float(radius):.1f}|{rank}|{filters_hash}'
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT created_at, response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or time.time() - row[0] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[1])
+
+    def set(self, key, response):
+        encoded = json.dumps(response)
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses (key, created_at, response) VALUES (?, ?, ?)',
+                (key, time.time(), encoded))
+            self._connection.commit()
+            self._writes += 1
+            evict_now = self._writes % EVICTION_INTERVAL == 0
+        if evict_now:
+            self.evict()
+
+    def evict(self):
+        """
+        Deletes expired entries, then the oldest ones beyond max_entries.
+        """
+        with self._lock:
+            self._connection.execute(
+                'DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+            self._connection.execute(
+                'DELETE FROM responses WHERE key IN ('
+                'SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,))
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
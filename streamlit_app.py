@@ -2,19 +2,46 @@ import streamlit as st
 import pandas as pd
 import os
 import sys
-from datetime import datetime
+from datetime import date, datetime
 
 try:
-    from restaurant_finder.main import find_restaurants_in_batches
+    from restaurant_finder.jobs import JOB_DONE, JOB_FAILED, JOB_INTERRUPTED, JobManager
     from restaurant_finder.aux_functions import get_latlong_from_bucket
 except ImportError as e:
-    st.error(f"Error importing find_restaurants_in_batches or get_latlong_from_bucket: {e}. Ensure restaurant_finder module and its dependencies are accessible.")
+    st.error(f"Error importing JobManager or get_latlong_from_bucket: {e}. Ensure restaurant_finder module and its dependencies are accessible.")
     # You might want to stop the app here or provide more specific instructions
     # For now, we'll let it potentially fail later if the import didn't work.
 
+from restaurant_finder.clients import get_table_version
+from restaurant_finder.config import (
+    BIGQUERY_DATASET_ID,
+    BIGQUERY_TABLE_ID,
+    CHECKPOINT_LOCATION,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_MIN_RADIUS,
+    JOB_POLL_SECONDS,
+    NEW_RESTAURANTS_DAYS,
+    VIEWER_CACHE_MAX_ENTRIES,
+    VIEWER_CACHE_TTL_SECONDS,
+)
+from restaurant_finder.data_processing import query_new_restaurants
+from google.api_core.exceptions import NotFound
+from restaurant_finder.records import restaurants_to_frame
+
 # Import for BigQuery Table Viewer
 from restaurant_finder.bq_table_viewer import display_bq_table
 
+
+# Prepared result frames kept in each session, most recently opened last
+RESULTS_KEPT_PER_SESSION = 3
+
+
+@st.cache_resource
+def get_job_manager():
+    # One manager per server process, shared by every session
+    return JobManager()
+
+
 def restaurant_finder_app(): # Renamed from main
     st.title("Restaurant Finder")
 
@@ -39,9 +66,20 @@ def restaurant_finder_app(): # Renamed from main
                                       min_value=0.0, value=0.002, step=0.0001, format="%.4f",
                                       help="Noise added to coordinates for broader search, if needed by the backend.")
 
-    spoke_radius_input = st.number_input("Spoke Generation Radius (meters)",
-                                         min_value=10, value=100, step=10,
-                                         help="Radius in meters for generating additional search points around saturated areas.")
+    min_radius_input = st.number_input("Minimum Refinement Radius (meters)",
+                                       min_value=10, value=DEFAULT_MIN_RADIUS, step=10,
+                                       help="Saturated areas are split into smaller circles until they are no longer saturated or would go below this radius.")
+
+    max_workers_input = st.number_input("Concurrent API Workers",
+                                        min_value=1, max_value=64, value=DEFAULT_MAX_WORKERS, step=1,
+                                        help="Number of Places API calls to run in parallel.")
+
+    max_calls_input = st.number_input("Maximum API Calls (0 = no limit)",
+                                      min_value=0, value=0, step=100,
+                                      help="Hard cap on billed Places API calls for the whole crawl, including the refinement of saturated areas.")
+
+    use_cache_input = st.checkbox("Use cached API responses", value=True,
+                                  help="Reuse Places API responses from earlier runs on the same grid instead of paying for them again.")
 
     if st.button("Find Restaurants"):
         # --- Processing Logic ---
@@ -93,107 +131,23 @@ def restaurant_finder_app(): # Renamed from main
 
             st.info(f"Prepared {len(latlong_list_input)} coordinates for processing.")
             
-            # Call Backend Function
-            st.info("Finding restaurants... This may take a few minutes.")
-            with st.spinner('Processing...'):
-                restaurants_dict = find_restaurants_in_batches(
-                    latlong_list_input=latlong_list_input,
-                    project_id_input=project_id_input,
-                    radius_input=default_radius_meters, 
-                    limit_input=int(limit_coords),
-                    amount_of_noise_input=float(amount_of_noise),
-                    spoke_generation_radius_meters=int(spoke_radius_input)
-                )
-
-            today_str = datetime.today().strftime('%Y-%m-%d')
-
-            # Display Results
-            if restaurants_dict:
-                st.success(f"Found {len(restaurants_dict)} unique restaurants!")
-                results_df = pd.DataFrame.from_dict(restaurants_dict, orient='index')
-
-                # Date filtering logic
-                if 'first_seen' in results_df.columns:
-                    st.write(f"Filtering for 'first_seen' date: {today_str}")
-                    try:
-                        # Convert to datetime, coercing errors to NaT
-                        dt_series = pd.to_datetime(results_df['first_seen'], errors='coerce')
-                        # Format to string 'YYYY-MM-DD'; NaT will become 'NaT' (a string) or stay pd.NaT depending on pandas version
-                        results_df['first_seen'] = dt_series.dt.strftime('%Y-%m-%d')
-                        
-                        # Ensure everything is a string. Replace 'NaT' strings or any non-string (like actual pd.NaT if strftime didn't convert it) with empty string.
-                        # A robust way to check for pd.NaT if it wasn't converted to string 'NaT' by strftime:
-                        # results_df['first_seen'] = results_df['first_seen'].apply(lambda x: '' if pd.isna(x) else x)
-                        # Then, ensure all are strings, especially if 'NaT' strings are present.
-                        results_df['first_seen'] = results_df['first_seen'].astype(str)
-                        # Replace string 'NaT' (if NaT was converted to this string by strftime or astype) with empty string
-                        results_df['first_seen'] = results_df['first_seen'].replace('NaT', '')
-
-                    except Exception as e:
-                        st.warning(f"Error during 'first_seen' column processing: {e}. Attempting to proceed, but date filtering may be affected.")
-                        # As a fallback, ensure the column is string type to prevent subsequent errors, filling errors with empty string
-                        results_df['first_seen'] = results_df['first_seen'].astype(str).fillna('')
-
-                    # Now, the column should be all strings (either 'YYYY-MM-DD' or '')
-                    # The original check 'is_string_dtype' might be too strict if mixed (e.g. actual NaT objects),
-                    # but after the above conversions, it should be safer.
-                    # However, direct comparison should work fine now.
-                    
-                    # Proceed with filtering
-                    filtered_df = results_df[results_df['first_seen'] == today_str]
-                    if not filtered_df.empty or results_df['first_seen'].eq(today_str).any():
-                        results_df = filtered_df
-                    elif not results_df['first_seen'].eq('').all(): # Only warn if there were actual dates that didn't match
-                        st.info(f"No entries found for 'first_seen' date: {today_str}. Displaying all entries.")
-                    # No explicit warning if all were empty strings (i.e. invalid dates)
-
-                else:
-                    st.warning("Warning: 'first_seen' column not found in results. Cannot apply date filter.")
-
-                # Define columns to display, checking if they exist
-                display_cols = []
-                potential_cols = ['displayName', 'shortFormattedAddress', 'rating', 'priceLevel', 'primary_type', 'user_rating_count', 'location']
-                for col in potential_cols:
-                    if col in results_df.columns:
-                        display_cols.append(col)
-                
-                if 'displayName' in results_df.columns: # Check if primary key column exists
-                     st.dataframe(results_df[display_cols])
-                else:
-                    st.info("No 'displayName' column in results, cannot display table.")
-
-
-                # Optional Map Display:
-                # The Places API response includes geometry.location.lat and geometry.location.lng
-                # Assuming 'location' column might be a dict {'lat': ..., 'lng': ...} or similar
-                # Or that iterate_over_calls was modified to return flat lat/lng.
-                # For now, let's assume 'latitude' and 'longitude' columns are added by the backend if possible,
-                # or we extract them if they are nested.
-                
-                # Attempt to extract lat/lng if 'location' column with dicts exists
-                if 'location' in results_df.columns and not results_df.empty and isinstance(results_df['location'].iloc[0], dict):
-                    try:
-                        results_df['latitude'] = results_df['location'].apply(lambda loc: loc.get('lat') if isinstance(loc, dict) else None)
-                        results_df['longitude'] = results_df['location'].apply(lambda loc: loc.get('lng') if isinstance(loc, dict) else None)
-                        # Drop rows where lat/lng extraction failed
-                        map_df = results_df.dropna(subset=['latitude', 'longitude'])
-                        if not map_df.empty:
-                           st.map(map_df[['latitude', 'longitude']])
-                        else:
-                           st.info("Could not extract latitude/longitude from 'location' data for map display.")
-                    except Exception as e:
-                        st.warning(f"Could not process 'location' data for map display: {e}")
-
-                elif 'latitude' in results_df.columns and 'longitude' in results_df.columns:
-                     st.map(results_df[['latitude', 'longitude']].dropna())
-                else:
-                    st.info("Map display skipped: 'latitude'/'longitude' columns not found or 'location' field not in expected format.")
-
-            else:
-                st.info("No restaurants found for the given locations.")
+            # Run the crawl in the background; its progress is shown below and polled
+            job_id = get_job_manager().submit(
+                latlong_list_input=latlong_list_input,
+                project_id_input=project_id_input,
+                radius_input=default_radius_meters, 
+                limit_input=int(limit_coords),
+                amount_of_noise_input=float(amount_of_noise),
+                min_radius_meters=int(min_radius_input),
+                max_workers=int(max_workers_input),
+                use_cache=bool(use_cache_input),
+                max_calls=int(max_calls_input) or None
+            )
+            st.session_state['job_id'] = job_id
+            st.success(f"Submitted crawl job {job_id}. You can leave or refresh this page; the crawl keeps running.")
 
         except ImportError: 
-            st.error("Critical Error: A required backend function ('find_restaurants_in_batches' or 'get_latlong_from_bucket') could not be imported. Please check server logs and ensure the 'restaurant_finder' module is correctly installed and accessible.")
+            st.error("Critical Error: A required backend function ('JobManager' or 'get_latlong_from_bucket') could not be imported. Please check server logs and ensure the 'restaurant_finder' module is correctly installed and accessible.")
         except ValueError as ve: # Catch specific ValueErrors from path parsing or function calls
             st.error(f"Configuration or Input Error: {ve}")
         except FileNotFoundError as fnfe: # If get_latlong_from_bucket raises this for GCS
@@ -204,4 +158,196 @@ def restaurant_finder_app(): # Renamed from main
             st.error("Could not parse the CSV file from GCS. Please ensure it's a valid CSV with expected columns ('LAT', 'LONG', optionally 'RADIUS_KM').")
         except Exception as e: # General catch-all for other unexpected errors
             st.error(f"An unexpected error occurred during GCS processing or restaurant finding: {e}")
-            st.error("Details: " + str(e))
\ No newline at end of file
+            st.error("Details: " + str(e))
+
+    crawl_jobs_panel()
+
+
+def crawl_jobs_panel():
+    """
+    Lists the crawl jobs and shows the selected one, polling it while it runs.
+    """
+    jobs = get_job_manager().list_jobs()
+    if not jobs:
+        return
+    st.header("Crawl Jobs")
+
+    job_ids = [job.job_id for job in jobs]
+    statuses = {job.job_id: job.status for job in jobs}
+    selected = st.session_state.get('job_id')
+    job_id = st.selectbox("Job", job_ids, index=job_ids.index(selected) if selected in job_ids else 0,
+                          format_func=lambda job_id: f"{job_id} ({statuses[job_id]})")
+    st.session_state['job_id'] = job_id
+
+    if statuses[job_id] == JOB_DONE:
+        show_job(job_id)
+    else:
+        # Only this part of the page reruns while the job is polled
+        st.fragment(show_job, run_every=JOB_POLL_SECONDS)(job_id, statuses[job_id])
+
+
+def show_job(job_id, polled_status=None):
+    """
+    Shows the status and counts of a crawl job, and its results once it is done.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        st.warning(f"Crawl job {job_id} not found.")
+        return
+    if polled_status is not None and job.status != polled_status:
+        # The job moved on: redraw the whole page, which stops polling once it has finished
+        st.rerun()
+
+    st.write(f"Status: **{job.status}**, submitted at {job.submitted_at}")
+    progress = job.progress
+    metrics = st.columns(4)
+    metrics[0].metric("Cells searched", progress.get('cells_done', 0))
+    metrics[1].metric("Places found", progress.get('places_found', 0))
+    metrics[2].metric("Saturated cells", progress.get('saturated_cells', 0))
+    metrics[3].metric("API calls", progress.get('calls_spent') or 0)
+    if job.active:
+        st.caption(f"{progress.get('cells_pending', 0)} cells waiting. Refreshed every {JOB_POLL_SECONDS} seconds.")
+    elif job.status == JOB_FAILED:
+        st.error(f"Crawl job {job_id} failed: {job.error}")
+    elif job.status == JOB_INTERRUPTED:
+        st.warning(f"Crawl job {job_id} stopped when the app restarted. "
+                   f"Resume it from the command line with --resume {job_id} "
+                   f"--checkpoint_location {job.params.get('checkpoint_location', CHECKPOINT_LOCATION)}.")
+    elif job.status == JOB_DONE:
+        display_results(get_results_frame(job_id))
+
+
+def normalize_first_seen(first_seen):
+    """
+    Parses first_seen values in any format in one vectorized pass.
+
+    Returns:
+        A tuple (dates, labels): the values as datetimes (NaT when missing or
+        unparseable) and as 'YYYY-MM-DD' strings ('' when missing or unparseable).
+    """
+    dates = pd.to_datetime(first_seen, errors='coerce', format='mixed').dt.normalize()
+    labels = dates.dt.strftime('%Y-%m-%d').fillna('')
+    return dates, labels
+
+
+def prepare_results(restaurants_dict):
+    """
+    Builds the DataFrame shown for a crawl's results, with first_seen parsed once.
+    """
+    results_df = restaurants_to_frame(restaurants_dict)
+    results_df['first_seen_date'], results_df['first_seen'] = normalize_first_seen(results_df['first_seen'])
+    return results_df
+
+
+def get_results_frame(job_id):
+    """
+    The prepared results of a finished job, kept in the session so reruns reuse them.
+    Only the last RESULTS_KEPT_PER_SESSION jobs opened are kept.
+    """
+    results = st.session_state.setdefault('results', {})
+    if job_id not in results:
+        results[job_id] = prepare_results(get_job_manager().load_result(job_id))
+        for old_job_id in list(results)[:-RESULTS_KEPT_PER_SESSION]:
+            del results[old_job_id]
+    return results[job_id]
+
+
+def display_results(results_df):
+    """
+    Shows a crawl's restaurants, filtered by rating, review count, type and first_seen date.
+
+    Filters are applied to the prepared frame, so changing them never reads or runs the crawl again.
+    By default only the restaurants first seen today are shown; if none were, the range spans
+    every first_seen date in the results.
+    """
+    if results_df.empty:
+        st.info("No restaurants found for the given locations.")
+        return
+    st.success(f"Found {len(results_df)} unique restaurants!")
+
+    today = pd.Timestamp(datetime.today()).normalize()
+    known_dates = results_df['first_seen_date'].dropna()
+    if known_dates.eq(today).any():
+        default_range = (today.date(), today.date())
+    elif not known_dates.empty:
+        default_range = (known_dates.min().date(), known_dates.max().date())
+    else:
+        default_range = None
+
+    filter_cols = st.columns(2)
+    min_rating = filter_cols[0].slider("Minimum rating", min_value=0.0, max_value=5.0, value=0.0, step=0.1)
+    min_reviews = filter_cols[1].number_input("Minimum number of reviews", min_value=0, value=0, step=10)
+    primary_types = st.multiselect("Types", sorted(results_df['primary_type'].dropna().unique()),
+                                   help="Leave empty to show every type.")
+
+    mask = (results_df['rating'] >= min_rating) & (results_df['user_rating_count'] >= min_reviews)
+    if primary_types:
+        mask &= results_df['primary_type'].isin(primary_types)
+    if default_range is not None:
+        first_seen_range = st.date_input("First seen between", value=default_range)
+        # While a range is being picked the widget holds a single date
+        if len(first_seen_range) == 2:
+            start, end = (pd.Timestamp(value) for value in first_seen_range)
+            mask &= results_df['first_seen_date'].between(start, end)
+    filtered_df = results_df[mask]
+    st.write(f"Showing {len(filtered_df)} of {len(results_df)} restaurants")
+
+    display_cols = ['displayName', 'shortFormattedAddress', 'rating', 'priceLevel', 'primary_type',
+                    'user_rating_count', 'first_seen']
+    st.dataframe(filtered_df[display_cols])
+
+    map_df = filtered_df[['latitude', 'longitude']].dropna().astype(float)
+    if not map_df.empty:
+        st.map(map_df)
+    else:
+        st.info("Map display skipped: no restaurant with a location matches the filters.")
+
+
+@st.cache_data(ttl=VIEWER_CACHE_TTL_SECONDS, max_entries=VIEWER_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_new_restaurants(project_id, days, min_rating, min_reviews, max_reviews, today, version):
+    # today and version (see clients.bump_table_version) only key the cache: the window
+    # moves every day, and a crawl synced from this app shows up straight away
+    return query_new_restaurants(project_id, days, min_rating, min_reviews, max_reviews)
+
+
+def new_restaurants_app():
+    """
+    Recent openings, read from the new restaurants view in BigQuery.
+    """
+    st.title("New Restaurants")
+    project_id_input = st.text_input("Google Cloud Project ID", value=os.environ.get('PROJECT_ID', ''))
+    days = st.slider("First seen in the last N days", min_value=1, max_value=NEW_RESTAURANTS_DAYS, value=30)
+    min_rating = st.slider("Rated above", min_value=0.0, max_value=5.0, value=4.0, step=0.1)
+    min_reviews, max_reviews = st.slider("Number of reviews", min_value=0, max_value=1000, value=(5, 60))
+    if not project_id_input:
+        st.info("Enter the Google Cloud Project ID.")
+        return
+
+    table_ref = f"{project_id_input}.{BIGQUERY_DATASET_ID}.{BIGQUERY_TABLE_ID}"
+    try:
+        new_df = cached_new_restaurants(project_id_input, days, min_rating, min_reviews, max_reviews,
+                                        date.today().isoformat(), get_table_version(table_ref))
+    except NotFound:
+        st.error("The new restaurants view does not exist yet. It is created when a crawl syncs to BigQuery.")
+        return
+
+    st.write(f"{len(new_df)} restaurants first seen in the last {days} days")
+    st.dataframe(new_df[['displayName', 'rating', 'user_rating_count', 'shortFormattedAddress', 'primary_type',
+                         'types', 'first_seen']])
+    map_df = new_df[['latitude', 'longitude']].dropna()
+    if not map_df.empty:
+        st.map(map_df)
+
+
+def main():
+    page = st.sidebar.radio("Navigation", ["Restaurant Finder", "New Restaurants", "BigQuery Table Viewer"])
+    if page == "BigQuery Table Viewer":
+        display_bq_table()
+    elif page == "New Restaurants":
+        new_restaurants_app()
+    else:
+        restaurant_finder_app()
+
+
+if __name__ == "__main__":
+    main()
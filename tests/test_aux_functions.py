@@ -0,0 +1,105 @@
+import io
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder import aux_functions
+
+read_csv = pd.read_csv
+
+
+def read_grid(csv_text, chunksize, radius=500, latlong_resolution=2):
+    """
+    Runs get_latlong_from_bucket over csv_text instead of a file in the bucket.
+    """
+    paths = []
+
+    def fake_read_csv(path, **kwargs):
+        paths.append(path)
+        return read_csv(io.StringIO(csv_text), **kwargs)
+
+    with patch('restaurant_finder.aux_functions.pd.read_csv', side_effect=fake_read_csv):
+        grid = aux_functions.get_latlong_from_bucket('test-project', 'test-bucket', 'grids/points.csv',
+                                                     latlong_resolution=latlong_resolution, radius=radius,
+                                                     chunksize=chunksize)
+    assert paths == ['gs://test-bucket/grids/points.csv']
+    return grid
+
+
+class TestGetLatlongFromBucket(unittest.TestCase):
+
+    def test_radius_column_overrides_and_is_filled_with_the_default(self):
+        csv_text = ("POSTCODE,LAT,LONG,RADIUS\n"
+                    "A1,51.501,-0.101,800\n"
+                    "A2,51.602,-0.202,\n")
+        self.assertEqual(read_grid(csv_text, chunksize=None),
+                         [(51.5, -0.1, 800.0), (51.6, -0.2, 500.0)])
+
+    def test_default_radius_without_a_radius_column(self):
+        csv_text = "LAT,LONG,NAME\n51.501,-0.101,x\n51.602,-0.202,y\n"
+        self.assertEqual(read_grid(csv_text, chunksize=None, radius=666),
+                         [(51.5, -0.1, 666), (51.6, -0.2, 666)])
+
+    def test_points_are_deduplicated_across_chunks(self):
+        # After rounding, rows 1, 2 and 4 are the same point, spread over three chunks of two rows
+        csv_text = ("LAT,LONG\n"
+                    "51.501,-0.101\n"
+                    "51.499,-0.099\n"
+                    "51.602,-0.202\n"
+                    "51.5,-0.1\n"
+                    "51.703,-0.303\n")
+        chunked = read_grid(csv_text, chunksize=2)
+        self.assertEqual(chunked, [(51.5, -0.1, 500), (51.6, -0.2, 500), (51.7, -0.3, 500)])
+        # Reading the file in one go gives the same points
+        self.assertEqual(read_grid(csv_text, chunksize=None), chunked)
+
+    def test_points_with_the_same_place_but_another_radius_are_kept(self):
+        csv_text = "LAT,LONG,RADIUS\n51.501,-0.101,800\n51.502,-0.102,1000\n51.503,-0.103,800\n"
+        self.assertEqual(read_grid(csv_text, chunksize=1),
+                         [(51.5, -0.1, 800.0), (51.5, -0.1, 1000.0)])
+
+    def test_rows_without_coordinates_are_dropped(self):
+        csv_text = ("LAT,LONG\n"
+                    "51.501,-0.101\n"
+                    ",-0.202\n"
+                    "51.602,\n"
+                    "51.703,-0.303\n")
+        self.assertEqual(read_grid(csv_text, chunksize=2), [(51.5, -0.1, 500), (51.7, -0.3, 500)])
+
+    def test_empty_file(self):
+        self.assertEqual(read_grid("LAT,LONG\n", chunksize=2), [])
+
+
+class TestGetLatlongFromZone(unittest.TestCase):
+
+    @patch('restaurant_finder.aux_functions.plan_hex_grid')
+    @patch('restaurant_finder.aux_functions.get_secret')
+    def test_corner_secrets_are_parsed(self, mock_get_secret, mock_plan_hex_grid):
+        secrets = {'london_top_left': '(51.6, -0.2)', 'london_bottom_right': '( 51.4 ,0.1 )'}
+        mock_get_secret.side_effect = lambda project_id, secret_id, version_id: secrets[secret_id]
+
+        grid = aux_functions.get_latlong_from_zone('test-project', 'london', 500)
+
+        self.assertIs(grid, mock_plan_hex_grid.return_value)
+        mock_plan_hex_grid.assert_called_once_with((51.6, -0.2), (51.4, 0.1), 500)
+        self.assertEqual([call_args[0] for call_args in mock_get_secret.call_args_list],
+                         [('test-project', 'london_top_left'), ('test-project', 'london_bottom_right')])
+
+    @patch('restaurant_finder.aux_functions.plan_hex_grid')
+    @patch('restaurant_finder.aux_functions.get_secret')
+    def test_malformed_corner_is_rejected(self, mock_get_secret, mock_plan_hex_grid):
+        for malformed in ['(51.6; -0.2)', '(51.6)', 'north, west']:
+            with self.subTest(corner=malformed):
+                mock_get_secret.side_effect = [malformed, '(51.4, 0.1)']
+                with self.assertRaises((ValueError, IndexError)):
+                    aux_functions.get_latlong_from_zone('test-project', 'london', 500)
+        mock_plan_hex_grid.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
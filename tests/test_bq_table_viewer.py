@@ -0,0 +1,99 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from google.cloud import bigquery
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder import bq_table_viewer
+
+SCHEMA = [
+    bigquery.SchemaField("displayName", "STRING"),
+    bigquery.SchemaField("rating", "FLOAT"),
+    bigquery.SchemaField("user_rating_count", "INTEGER"),
+    bigquery.SchemaField("types", "STRING", mode="REPEATED"),
+]
+
+
+class TestBuildPageQuery(unittest.TestCase):
+
+    def test_filters_are_parameters(self):
+        sql, parameters = bq_table_viewer.build_page_query(
+            "p.d.t", SCHEMA, ["displayName", "rating"],
+            [("rating", ">=", "4.5"), ("displayName", "LIKE", "%'; DROP TABLE x; --"), ("user_rating_count", "IS NOT NULL", "")],
+            page=2, page_size=50, order_by="rating")
+        self.assertEqual(sql, "SELECT `displayName`, `rating` FROM `p.d.t` "
+                              "WHERE `rating` >= @filter_0 AND `displayName` LIKE @filter_1 AND `user_rating_count` IS NOT NULL "
+                              "ORDER BY `rating` LIMIT @page_size OFFSET @page_offset")
+        values = {parameter.name: (parameter.type_, parameter.value) for parameter in parameters}
+        self.assertEqual(values["filter_0"], ("FLOAT64", 4.5))
+        self.assertEqual(values["filter_1"], ("STRING", "%'; DROP TABLE x; --"))
+        self.assertEqual(values["page_offset"], ("INT64", 100))
+
+    def test_unknown_columns_are_rejected(self):
+        with self.assertRaises(ValueError):
+            bq_table_viewer.build_page_query("p.d.t", SCHEMA, ["rating`; --"], [], 0, 10)
+        self.assertEqual([field.name for field in bq_table_viewer.filterable_fields(SCHEMA)],
+                         ["displayName", "rating", "user_rating_count"])
+
+
+def make_table(table_type):
+    table = bigquery.Table.from_api_repr({"tableReference": {"projectId": "p", "datasetId": "d", "tableId": "t"},
+                                          "type": table_type})
+    table.schema = SCHEMA
+    return table
+
+
+class TestReadPage(unittest.TestCase):
+
+    def test_unfiltered_pages_are_read_without_a_query(self):
+        client = MagicMock()
+        table = make_table("TABLE")
+        bq_table_viewer.read_page(client, table, ["rating"], [], page=3, page_size=20)
+        client.query.assert_not_called()
+        _, kwargs = client.list_rows.call_args
+        self.assertEqual([field.name for field in kwargs["selected_fields"]], ["rating"])
+        self.assertEqual((kwargs["start_index"], kwargs["max_results"]), (60, 20))
+
+        bq_table_viewer.read_page(client, table, ["rating"], [("rating", ">", "4")], page=0, page_size=20)
+        client.query.return_value.result.return_value.to_arrow.assert_called_once_with(create_bqstorage_client=True)
+
+    def test_views_are_read_with_a_query(self):
+        for table_type in ("VIEW", "MATERIALIZED_VIEW"):
+            client = MagicMock()
+            bq_table_viewer.read_page(client, make_table(table_type), ["rating"], [], page=1, page_size=20)
+            client.list_rows.assert_not_called()
+            sql = client.query.call_args[0][0]
+            self.assertEqual(sql, "SELECT `rating` FROM `p.d.t` LIMIT @page_size OFFSET @page_offset")
+
+
+class TestPageCache(unittest.TestCase):
+
+    def setUp(self):
+        bq_table_viewer._cached_page.clear()
+        bq_table_viewer._table_metadata.clear()
+
+    @patch('restaurant_finder.bq_table_viewer.read_page')
+    @patch('restaurant_finder.bq_table_viewer._viewer_client')
+    def test_repeat_views_are_cached_until_the_table_changes(self, mock_client, mock_read_page):
+        table = bigquery.Table("p.d.t", schema=SCHEMA)
+        mock_client.return_value.get_table.return_value = table
+        mock_read_page.return_value.to_pandas.return_value = "page"
+
+        def view(modified, version):
+            return bq_table_viewer._cached_page("p.d.t", ("rating",), (), 0, 10, None, modified, version)
+
+        self.assertEqual(view("2025-05-19T00:00:00", 0), "page")
+        view("2025-05-19T00:00:00", 0)
+        self.assertEqual(mock_read_page.call_count, 1)
+
+        # Written elsewhere (new modified time) or by this process (new version)
+        view("2025-05-20T00:00:00", 0)
+        view("2025-05-20T00:00:00", 1)
+        self.assertEqual(mock_read_page.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import patch
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder.call_scheduler import CallScheduler, STAGE_GRID, STAGE_REFINEMENT
+
+
+class TestCallScheduler(unittest.TestCase):
+
+    def test_budget_is_enforced_and_counted_per_stage(self):
+        scheduler = CallScheduler(max_calls=3, calls_per_minute=60000)
+        self.assertTrue(scheduler.acquire(STAGE_GRID))
+        self.assertTrue(scheduler.acquire(STAGE_GRID))
+        self.assertTrue(scheduler.acquire(STAGE_REFINEMENT))
+        self.assertFalse(scheduler.acquire(STAGE_REFINEMENT))
+
+        self.assertEqual(scheduler.calls_by_stage, {STAGE_GRID: 2, STAGE_REFINEMENT: 1})
+        self.assertEqual(scheduler.refused_by_stage, {STAGE_REFINEMENT: 1})
+        self.assertEqual(scheduler.budget_left(), 0)
+
+    def test_token_bucket_waits_once_burst_is_spent(self):
+        scheduler = CallScheduler(calls_per_minute=60, burst=2)
+        with patch('restaurant_finder.call_scheduler.time.sleep') as mock_sleep:
+            scheduler.acquire()
+            scheduler.acquire()
+            mock_sleep.assert_not_called()
+            # The bucket is empty: the next call has to wait for a refill
+            with patch('restaurant_finder.call_scheduler.time.monotonic',
+                       side_effect=[scheduler._last_refill, scheduler._last_refill + 1]):
+                scheduler.acquire()
+            mock_sleep.assert_called_once()
+            self.assertAlmostEqual(mock_sleep.call_args[0][0], 1.0, places=2)
+
+    def test_runs_keep_their_budgets_and_share_the_rate_limit(self):
+        shared = CallScheduler(calls_per_minute=60, burst=2)
+        first = CallScheduler(max_calls=1, shared_rate=shared)
+        second = CallScheduler(max_calls=5, shared_rate=shared)
+        self.assertTrue(first.acquire())
+        self.assertFalse(first.acquire())
+        self.assertTrue(second.acquire())
+        self.assertEqual((first.calls_spent, second.calls_spent), (1, 1))
+
+        # Both runs drew from the shared bucket, so the next call waits
+        with patch('restaurant_finder.call_scheduler.time.sleep') as mock_sleep, \
+                patch('restaurant_finder.call_scheduler.time.monotonic',
+                      side_effect=[shared._last_refill, shared._last_refill + 1]):
+            second.acquire()
+        mock_sleep.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder import clients
+
+
+class TestClientRegistry(unittest.TestCase):
+
+    def setUp(self):
+        clients.clear_cache()
+
+    def tearDown(self):
+        clients.clear_cache()
+
+    @patch('restaurant_finder.clients.bigquery.Client')
+    @patch('restaurant_finder.clients.storage.Client')
+    def test_clients_are_created_once_and_shared(self, mock_storage, mock_bigquery):
+        self.assertIs(clients.get_storage_client(), clients.get_storage_client())
+        mock_storage.assert_called_once_with()
+
+        # BigQuery clients are kept per project
+        self.assertIs(clients.get_bigquery_client('p1'), clients.get_bigquery_client('p1'))
+        clients.get_bigquery_client('p2')
+        self.assertEqual([call.kwargs for call in mock_bigquery.call_args_list], [{'project': 'p1'}, {'project': 'p2'}])
+
+        # Dropped clients are created again on next use
+        clients.clear_cache()
+        clients.get_storage_client()
+        self.assertEqual(mock_storage.call_count, 2)
+
+    @patch('restaurant_finder.clients.storage.Client')
+    def test_concurrent_first_use_creates_one_client(self, mock_storage):
+        started = threading.Barrier(8)
+
+        def get():
+            started.wait()
+            clients.get_storage_client()
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        mock_storage.assert_called_once_with()
+
+    @patch('restaurant_finder.clients.time.monotonic')
+    @patch('restaurant_finder.clients.secretmanager.SecretManagerServiceClient')
+    def test_secrets_are_fetched_once_per_ttl(self, mock_secret_client, mock_monotonic):
+        access = mock_secret_client.return_value.access_secret_version
+        access.return_value.payload.data = b'api-key'
+
+        mock_monotonic.return_value = 1000.0
+        self.assertEqual(clients.get_secret('p', 'maps_key', ttl_seconds=600), 'api-key')
+        mock_monotonic.return_value = 1599.0
+        self.assertEqual(clients.get_secret('p', 'maps_key', ttl_seconds=600), 'api-key')
+        access.assert_called_once_with(request={'name': 'projects/p/secrets/maps_key/versions/latest'})
+
+        # Other secrets are cached separately
+        clients.get_secret('p', 'other_key', ttl_seconds=600)
+        self.assertEqual(access.call_count, 2)
+
+        # Once the TTL has passed the value is fetched again
+        mock_monotonic.return_value = 1600.0
+        clients.get_secret('p', 'maps_key', ttl_seconds=600)
+        self.assertEqual(access.call_count, 3)
+
+        # clear_cache drops secrets too
+        clients.clear_cache()
+        clients.get_secret('p', 'maps_key', ttl_seconds=600)
+        self.assertEqual(access.call_count, 4)
+
+    def test_table_versions_count_writes(self):
+        self.assertEqual(clients.get_table_version('p.d.t_versions'), 0)
+        clients.bump_table_version('p.d.t_versions')
+        clients.bump_table_version('p.d.t_versions')
+        self.assertEqual(clients.get_table_version('p.d.t_versions'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
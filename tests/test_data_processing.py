@@ -0,0 +1,505 @@
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from google.cloud import bigquery
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder import data_processing
+from restaurant_finder.checkpoint import CrawlCheckpoint
+from restaurant_finder.records import Restaurant
+
+
+def make_places(prefix, n):
+    return {'places': [{'id': f'{prefix}{i}', 'displayName': {'text': f'{prefix} {i}'}} for i in range(n)]}
+
+
+class TestIterateOverCalls(unittest.TestCase):
+
+    @patch('restaurant_finder.data_processing.access_secret_version', return_value='key')
+    @patch('restaurant_finder.data_processing.PlacesClient')
+    def test_concurrent_results_merge_and_saturated_cells_expand(self, mock_places_client, _mock_secret):
+        # Cell (1, 1) is saturated, its expanded children and (2, 2) are not
+        def fake_search_nearby(lat, long, radius, rank, stage, included_types=None):
+            if (lat, long) == (1.0, 1.0):
+                return make_places('sat', 20)
+            if (lat, long) == (2.0, 2.0):
+                return make_places('grid', 3)
+            if (lat, long) == (3.0, 3.0):
+                return {}
+            return make_places(f'child{lat}_', 2)
+        mock_search_nearby = mock_places_client.return_value.__enter__.return_value.search_nearby
+        mock_search_nearby.side_effect = fake_search_nearby
+
+        expanded = []
+        def expand_saturated(lat, long, radius, depth, new_place_count, proven_radius, partition, primary_types):
+            expanded.append((lat, long, radius, depth, new_place_count))
+            return [(10.0, 10.0, radius / 2), (11.0, 11.0, radius / 2)]
+
+        restaurants, saturated_list = data_processing.iterate_over_calls(
+            [(1.0, 1.0, 100), (2.0, 2.0, 100), (3.0, 3.0, 100)],
+            restaurants={},
+            project_id='test-project',
+            amount_of_noise=0,
+            max_workers=4,
+            expand_saturated=expand_saturated)
+
+        self.assertEqual(saturated_list, [(1.0, 1.0, 100)])
+        self.assertEqual(expanded, [(1.0, 1.0, 100, 0, 20)])
+        self.assertEqual(mock_search_nearby.call_count, 5)
+        # The places of the saturated call are kept as well
+        self.assertEqual(len(restaurants), 20 + 3 + 2 + 2)
+        self.assertIn('sat0', restaurants)
+        self.assertEqual(restaurants['grid0'].displayName, 'grid 0')
+        mock_places_client.assert_called_once_with('key', pool_size=4, cache=None, scheduler=None)
+
+    @patch('restaurant_finder.data_processing.access_secret_version', return_value='key')
+    @patch('restaurant_finder.data_processing.PlacesClient')
+    def test_saturated_children_are_refined_recursively(self, mock_places_client, _mock_secret):
+        # The root and its child at (10, 10) are saturated; the child returns only new places
+        def fake_search_nearby(lat, long, radius, rank, stage, included_types=None):
+            if radius == 100:
+                return make_places('root', 20)
+            if (lat, long) == (10.0, 10.0):
+                return make_places('dense', 20)
+            return make_places(f'leaf{lat}_', 1)
+        mock_search_nearby = mock_places_client.return_value.__enter__.return_value.search_nearby
+        mock_search_nearby.side_effect = fake_search_nearby
+
+        expanded = []
+        def expand_saturated(lat, long, radius, depth, new_place_count, proven_radius, partition, primary_types):
+            expanded.append((lat, long, radius, depth, new_place_count))
+            if depth == 0:
+                return [(10.0, 10.0, radius / 2), (11.0, 11.0, radius / 2)]
+            return [(20.0, 20.0, radius / 2)]
+
+        restaurants, saturated_list = data_processing.iterate_over_calls(
+            [(1.0, 1.0, 100)],
+            restaurants={},
+            project_id='test-project',
+            amount_of_noise=0.5,
+            max_workers=2,
+            expand_saturated=expand_saturated)
+
+        # Refined cells are not jittered, so the children are searched where they were planned
+        self.assertEqual([cell[3] for cell in expanded], [0, 1])
+        self.assertEqual(expanded[1][:3], (10.0, 10.0, 50.0))
+        self.assertEqual(len(saturated_list), 2)
+        self.assertEqual(mock_search_nearby.call_count, 4)
+        self.assertIn('leaf20.0_0', restaurants)
+
+    @patch('restaurant_finder.data_processing.access_secret_version', return_value='key')
+    @patch('restaurant_finder.data_processing.PlacesClient')
+    def test_checkpointed_run_resumes_without_repeating_calls(self, mock_places_client, _mock_secret):
+        # The first run runs out of budget after two calls; the resumed run finishes the grid
+        calls = []
+        budget = {'left': 2}
+        def fake_search_nearby(lat, long, radius, rank, stage, included_types=None):
+            if budget['left'] == 0:
+                return {'error': 'API call budget exhausted', 'budget_exhausted': True}
+            budget['left'] -= 1
+            calls.append((lat, long))
+            return make_places(f'p{lat}_', 1)
+        mock_search_nearby = mock_places_client.return_value.__enter__.return_value.search_nearby
+        mock_search_nearby.side_effect = fake_search_nearby
+
+        grid = [(1.0, 1.0, 100), (2.0, 2.0, 100), (3.0, 3.0, 100), (4.0, 4.0, 100)]
+        with tempfile.TemporaryDirectory() as location:
+            checkpoint = CrawlCheckpoint('run1', location=location, every=1)
+            restaurants, _ = data_processing.iterate_over_calls(
+                grid, restaurants={}, project_id='test-project', amount_of_noise=0,
+                max_workers=1, checkpoint=checkpoint)
+            self.assertEqual(len(restaurants), 2)
+
+            resumed = CrawlCheckpoint.load('run1', location=location)
+            self.assertFalse(resumed.complete)
+            self.assertEqual(len(resumed.pending), 2)
+
+            budget['left'] = 10
+            restaurants, _ = data_processing.iterate_over_calls(
+                [], restaurants={}, project_id='test-project', amount_of_noise=0,
+                max_workers=1, checkpoint=resumed)
+
+            self.assertEqual(len(restaurants), 4)
+            self.assertEqual(sorted(calls), [(lat, long) for lat, long, _ in grid])
+            self.assertTrue(CrawlCheckpoint.load('run1', location=location).complete)
+
+    @patch('restaurant_finder.data_processing.access_secret_version', return_value='key')
+    @patch('restaurant_finder.data_processing.PlacesClient')
+    def test_failed_calls_stay_pending_and_are_retried_on_resume(self, mock_places_client, _mock_secret):
+        calls = []
+        failing = {(2.0, 2.0)}
+        def fake_search_nearby(lat, long, radius, rank, stage, included_types=None):
+            calls.append((lat, long))
+            if (lat, long) in failing:
+                return {'error': 'API request failed with status code 429', 'details': 'quota'}
+            return make_places(f'p{lat}_', 1)
+        mock_search_nearby = mock_places_client.return_value.__enter__.return_value.search_nearby
+        mock_search_nearby.side_effect = fake_search_nearby
+
+        grid = [(1.0, 1.0, 100), (2.0, 2.0, 100), (3.0, 3.0, 100)]
+        with tempfile.TemporaryDirectory() as location:
+            checkpoint = CrawlCheckpoint('run1', location=location, every=1)
+            restaurants, _ = data_processing.iterate_over_calls(
+                grid, restaurants={}, project_id='test-project', amount_of_noise=0,
+                max_workers=1, checkpoint=checkpoint)
+            self.assertEqual(len(restaurants), 2)
+            # The failed cell does not count as searched, for the density map either
+            self.assertNotIn((2.0, 2.0, 100, 0, None), checkpoint.processed)
+
+            resumed = CrawlCheckpoint.load('run1', location=location)
+            self.assertFalse(resumed.complete)
+            self.assertEqual(resumed.pending, [(2.0, 2.0, 100, 0, None)])
+
+            failing.clear()
+            calls.clear()
+            restaurants, _ = data_processing.iterate_over_calls(
+                [], restaurants={}, project_id='test-project', amount_of_noise=0,
+                max_workers=1, checkpoint=resumed)
+
+            self.assertEqual(calls, [(2.0, 2.0)])
+            self.assertEqual(len(restaurants), 3)
+            self.assertTrue(CrawlCheckpoint.load('run1', location=location).complete)
+
+    def test_checkpoint_log_replays_children_and_places(self):
+        with tempfile.TemporaryDirectory() as location:
+            checkpoint = CrawlCheckpoint('run1', location=location, every=2)
+            checkpoint.start([(1.0, 1.0, 100, 0, None), (2.0, 2.0, 100, 0, None)])
+            child = (1.0, 1.0, 50, 1, 'asian')
+            checkpoint.record_cell((1.0, 1.0, 100, 0, None), {'p1': Restaurant(displayName='A')},
+                                   saturated=(1.0, 1.0, 100), children=[child])
+            # Buffered until `every` cells have been searched
+            self.assertEqual(len(os.listdir(checkpoint.path)), 1)
+            checkpoint.record_cell(child, {'p1': Restaurant(displayName='A', rating=4.5)})
+
+            resumed = CrawlCheckpoint.load('run1', location=location)
+            self.assertEqual(resumed.pending, [(2.0, 2.0, 100, 0, None)])
+            self.assertEqual(resumed.processed, [(1.0, 1.0, 100, 0, None), child])
+            self.assertEqual(resumed.saturated_list, [(1.0, 1.0, 100)])
+            self.assertEqual(resumed.restaurants['p1'].rating, 4.5)
+            self.assertFalse(resumed.complete)
+
+
+    @patch('restaurant_finder.data_processing.access_secret_version', return_value='key')
+    @patch('restaurant_finder.data_processing.PlacesClient')
+    def test_type_partitions_search_the_same_circle_per_group(self, mock_places_client, _mock_secret):
+        searched = []
+        def fake_search_nearby(lat, long, radius, rank, stage, included_types=None):
+            searched.append((lat, long, radius, included_types))
+            if included_types is None:
+                return make_places('all', 20)
+            return make_places(included_types[0], 3)
+        mock_search_nearby = mock_places_client.return_value.__enter__.return_value.search_nearby
+        mock_search_nearby.side_effect = fake_search_nearby
+
+        def expand_saturated(lat, long, radius, depth, new_place_count, proven_radius, partition, primary_types):
+            return [(lat, long, radius, 'asian'), (lat, long, radius, 'european')]
+
+        restaurants, _ = data_processing.iterate_over_calls(
+            [(1.0, 1.0, 100)], restaurants={}, project_id='test-project', amount_of_noise=0,
+            max_workers=2, expand_saturated=expand_saturated)
+
+        self.assertEqual(len(restaurants), 20 + 3 + 3)
+        self.assertEqual(sorted(types[0] for _, _, _, types in searched if types),
+                         ['asian_restaurant', 'french_restaurant'])
+        self.assertTrue(all(cell[:3] == (1.0, 1.0, 100) for cell in searched))
+
+
+class TestCoveredRadius(unittest.TestCase):
+
+    def test_radius_is_the_distance_to_the_last_ranked_place(self):
+        places = [{'id': 'near', 'location': {'latitude': 51.5, 'longitude': -0.1}},
+                  {'id': 'far', 'location': {'latitude': 51.501, 'longitude': -0.1}}]
+
+        self.assertAlmostEqual(data_processing.covered_radius(51.5, -0.1, 1000, places), 111.2, delta=0.5)
+        # Never beyond the searched circle, and unknown without locations
+        self.assertEqual(data_processing.covered_radius(51.5, -0.1, 100, places), 100)
+        self.assertEqual(data_processing.covered_radius(51.5, -0.1, 1000, [{'id': 'x'}]), 0.0)
+
+
+class TestRestaurantStore(unittest.TestCase):
+
+    def test_table_round_trip(self):
+        restaurants = {
+            'id1': Restaurant(displayName='A', shortFormattedAddress='1 St', rating=4.5, priceLevel='NA',
+                              last_seen='2025-05-19', first_seen='2025-05-01', primary_type='thai_restaurant',
+                              user_rating_count=10, types=['thai_restaurant', 'restaurant']),
+            'id2': Restaurant(displayName='B', shortFormattedAddress='2 St', rating=0, priceLevel='PRICE_LEVEL_MODERATE',
+                              last_seen='2025-05-19', primary_type='thai_restaurant',
+                              user_rating_count=0, types=[]),
+        }
+        table = data_processing.restaurants_to_table(restaurants)
+
+        self.assertEqual(table.schema, data_processing.RESTAURANT_STORE_SCHEMA)
+        round_trip = data_processing.table_to_restaurants(table)
+        self.assertEqual(round_trip, restaurants)
+        # Repeated values are shared between records rather than copied
+        self.assertIs(round_trip['id1'].primary_type, round_trip['id2'].primary_type)
+        self.assertIs(round_trip['id1'].last_seen, round_trip['id2'].last_seen)
+
+
+    @patch('restaurant_finder.data_processing.get_storage_client')
+    def test_deltas_replay_over_base_and_compact(self, mock_get_client):
+        # In-memory bucket: blob name -> bytes
+        objects = {}
+        def make_blob(name):
+            blob = MagicMock()
+            blob.name = name
+            blob.exists.side_effect = lambda: name in objects
+            blob.download_as_bytes.side_effect = lambda: objects[name]
+            blob.download_as_string.side_effect = lambda: objects[name]
+            blob.upload_from_string.side_effect = lambda data, content_type=None: objects.__setitem__(name, data)
+            return blob
+        bucket = mock_get_client.return_value.bucket.return_value
+        bucket.blob.side_effect = make_blob
+        bucket.list_blobs.side_effect = lambda prefix: [make_blob(name) for name in objects if name.startswith(prefix)]
+
+        def restaurant(name, seen):
+            return Restaurant(displayName=name, shortFormattedAddress='', rating=4.0, priceLevel='NA',
+                              last_seen=seen, first_seen='2025-01-01', primary_type='restaurant',
+                              user_rating_count=1, types=[])
+
+        data_processing.write_restaurant_store('bucket', {'a': restaurant('A', '2025-01-01')}, as_of='20250101_000000')
+        to_table = data_processing.restaurants_to_table
+        data_processing.write_restaurant_delta('bucket', to_table({'b': restaurant('B', '2025-02-01')}),
+                                               to_table({'a': restaurant('A2', '2025-02-01')}), run_at=datetime(2025, 2, 1))
+        data_processing.write_restaurant_delta('bucket', to_table({'c': restaurant('C', '2025-03-01')}), to_table({}),
+                                               run_at=datetime(2025, 3, 1))
+
+        latest = data_processing.read_old_restaurants('bucket')
+        self.assertEqual(sorted(latest), ['a', 'b', 'c'])
+        self.assertEqual(latest['a'].displayName, 'A2')
+
+        in_february = data_processing.table_to_restaurants(
+            data_processing.read_restaurant_store('bucket', as_of=datetime(2025, 2, 15)))
+        self.assertEqual(sorted(in_february), ['a', 'b'])
+
+        new_since = data_processing.read_restaurant_changes('bucket', since=datetime(2025, 1, 15), change='new')
+        self.assertEqual(sorted(new_since.column('restaurant_id').to_pylist()), ['b', 'c'])
+
+        data_processing.compact_restaurant_store('bucket')
+        self.assertIn('restaurant_store/base/20250301_000000_000000.parquet', objects)
+        self.assertEqual(data_processing.read_old_restaurants('bucket'), latest)
+
+        # Migrating a legacy file over a store that already has snapshots would hide every run since
+        objects['restaurants.json'] = json.dumps({'z': {'displayName': 'Z'}}).encode()
+        with self.assertRaises(ValueError):
+            data_processing.migrate_json_store('bucket')
+        self.assertEqual(data_processing.read_old_restaurants('bucket'), latest)
+        self.assertEqual(data_processing.migrate_json_store('bucket', force=True).num_rows, 1)
+
+
+class TestMergeRestaurantTables(unittest.TestCase):
+
+    def test_crawl_is_split_into_new_updated_and_unchanged(self):
+        old = data_processing.restaurants_to_table({
+            'a': Restaurant(displayName='A', rating=4.0, last_seen='2025-01-01', first_seen='2024-06-01', types=['cafe']),
+            'b': Restaurant(displayName='B', rating=3.0, last_seen='2025-01-01', first_seen='2025-01-01'),
+        })
+        crawl = data_processing.restaurants_to_table({
+            'a': Restaurant(displayName='A renamed', rating=4.5, last_seen='2025-05-19', types=['cafe', 'bakery']),
+            'c': Restaurant(displayName='C', rating=5.0, last_seen='2025-05-19'),
+        })
+
+        new, updated, unchanged = data_processing.merge_restaurant_tables(old, crawl)
+
+        new = data_processing.table_to_restaurants(new)
+        updated = data_processing.table_to_restaurants(updated)
+        unchanged = data_processing.table_to_restaurants(unchanged)
+        self.assertEqual(list(new), ['c'])
+        self.assertEqual(new['c'].first_seen, '2025-05-19')
+        self.assertEqual(list(updated), ['a'])
+        self.assertEqual((updated['a'].displayName, updated['a'].first_seen), ('A', '2024-06-01'))
+        self.assertEqual((updated['a'].rating, updated['a'].last_seen), (4.5, '2025-05-19'))
+        self.assertEqual(updated['a'].types, ('cafe', 'bakery'))
+        self.assertEqual(list(unchanged), ['b'])
+
+    @patch('restaurant_finder.data_processing.sync_restaurants_to_bigquery')
+    @patch('restaurant_finder.data_processing.deltas_since_last_base', return_value=1)
+    @patch('restaurant_finder.data_processing.write_restaurant_delta')
+    @patch('restaurant_finder.data_processing.read_restaurant_store')
+    def test_update_returns_the_crawl_with_first_seen(self, mock_read_store, _mock_delta, _mock_deltas, _mock_sync):
+        mock_read_store.return_value = data_processing.restaurants_to_table({
+            'a': Restaurant(displayName='A', last_seen='2025-01-01', first_seen='2024-06-01'),
+            'b': Restaurant(displayName='B', last_seen='2025-01-01', first_seen='2025-01-01'),
+        })
+        crawl = {'a': Restaurant(displayName='A', last_seen='2025-05-19'),
+                 'c': Restaurant(displayName='C', last_seen='2025-05-19')}
+
+        all_restaurants, crawled = data_processing.update_json_and_save(crawl, 'bucket', 'p')
+
+        self.assertEqual(all_restaurants.num_rows, 3)
+        self.assertEqual({restaurant_id: restaurant.first_seen for restaurant_id, restaurant in crawled.items()},
+                         {'a': '2024-06-01', 'c': '2025-05-19'})
+
+
+class TestLoadRowsToBigQuery(unittest.TestCase):
+
+    @patch('restaurant_finder.data_processing.get_bigquery_client')
+    def test_rows_are_loaded_in_chunks_and_failures_reported(self, mock_get_client):
+        client = mock_get_client.return_value
+        loaded = []
+        def fake_load(chunk_file, destination, job_config):
+            rows = [json.loads(line) for line in chunk_file.read().splitlines()]
+            loaded.append(([row['restaurant_id'] for row in rows], job_config.write_disposition))
+            job = MagicMock()
+            if rows[0]['restaurant_id'] == 'id2':
+                job.result.side_effect = Exception('bad chunk')
+            return job
+        client.load_table_from_file.side_effect = fake_load
+
+        rows = data_processing.table_to_rows(
+            data_processing.restaurants_to_table({f'id{i}': Restaurant() for i in range(5)}))
+        rows_loaded, failed_chunks = data_processing.load_rows_to_bigquery(rows, 'p.d.t', 'p', chunk_rows=2)
+
+        self.assertEqual(loaded, [(['id0', 'id1'], 'WRITE_TRUNCATE'),
+                                  (['id2', 'id3'], 'WRITE_APPEND'),
+                                  (['id4'], 'WRITE_APPEND')])
+        self.assertEqual(rows_loaded, 3)
+        self.assertEqual(failed_chunks, [(1, 'bad chunk')])
+
+
+class TestSyncRestaurantsToBigQuery(unittest.TestCase):
+
+    @patch('restaurant_finder.data_processing.get_bigquery_client')
+    def test_changed_rows_are_staged_and_merged(self, mock_get_client):
+        client = mock_get_client.return_value
+        table = bigquery.Table('p.restaurants_dataset.restaurants_table', schema=data_processing.RESTAURANTS_SCHEMA)
+        table.time_partitioning, table.clustering_fields = data_processing.restaurants_table_layout()
+        client.get_table.return_value = table
+        changed = data_processing.restaurants_to_table(
+            {'id1': Restaurant(displayName='A', last_seen='2025-05-19', first_seen='2025-05-19')})
+
+        data_processing.sync_restaurants_to_bigquery(changed, all_restaurants={}, project_id='p',
+                                                     run_key='20250519_120000_000001')
+
+        self.assertEqual(client.load_table_from_file.call_count, 1)
+        merge_query = client.query.call_args[0][0]
+        self.assertIn('MERGE `p.restaurants_dataset.restaurants_table`', merge_query)
+        self.assertIn('ON target.restaurant_id = source.restaurant_id', merge_query)
+        # Each run stages into its own table, so concurrent runs never drop each other's
+        self.assertIn('USING `p.restaurants_dataset.restaurants_table_staging_20250519_120000_000001`', merge_query)
+        client.delete_table.assert_called_once_with('p.restaurants_dataset.restaurants_table_staging_20250519_120000_000001',
+                                                    not_found_ok=True)
+
+    @patch('restaurant_finder.data_processing.load_rows_to_bigquery', return_value=(1, [(1, 'bad chunk')]))
+    @patch('restaurant_finder.data_processing.get_bigquery_client')
+    def test_merge_is_skipped_when_a_chunk_fails_to_stage(self, mock_get_client, _mock_load):
+        client = mock_get_client.return_value
+        client.get_table.return_value = bigquery.Table('p.restaurants_dataset.restaurants_table',
+                                                       schema=data_processing.RESTAURANTS_SCHEMA)
+        changed = data_processing.restaurants_to_table({'id1': Restaurant(), 'id2': Restaurant()})
+
+        with patch('restaurant_finder.data_processing.ensure_restaurants_table_layout'), \
+                patch('restaurant_finder.data_processing.ensure_new_restaurants_view'):
+            data_processing.sync_restaurants_to_bigquery(changed, all_restaurants={}, project_id='p', run_key='k')
+
+        client.query.assert_not_called()
+        client.delete_table.assert_called_once_with('p.restaurants_dataset.restaurants_table_staging_k', not_found_ok=True)
+
+    @patch('restaurant_finder.data_processing.upload_restaurants_to_bigquery')
+    @patch('restaurant_finder.data_processing.get_bigquery_client')
+    def test_missing_table_is_built_from_full_store(self, mock_get_client, mock_full_upload):
+        mock_get_client.return_value.get_table.side_effect = data_processing.NotFound('missing')
+        all_restaurants = data_processing.restaurants_to_table({'id1': Restaurant(), 'id2': Restaurant()})
+        changed = data_processing.restaurants_to_table({'id1': Restaurant()})
+
+        data_processing.sync_restaurants_to_bigquery(changed, all_restaurants, project_id='p')
+
+        mock_full_upload.assert_called_once_with(all_restaurants, 'p', run_key=None)
+        mock_get_client.return_value.query.assert_not_called()
+
+    @patch('restaurant_finder.data_processing.get_bigquery_client')
+    def test_unpartitioned_table_is_converted_and_view_created(self, mock_get_client):
+        client = mock_get_client.return_value
+        def get_table(ref):
+            # A table from before partitioning, and no view yet
+            if ref.endswith('restaurants_table'):
+                return bigquery.Table(ref, schema=data_processing.RESTAURANTS_SCHEMA)
+            raise data_processing.NotFound('missing')
+        client.get_table.side_effect = get_table
+        changed = data_processing.restaurants_to_table({'id1': Restaurant()})
+
+        data_processing.sync_restaurants_to_bigquery(changed, all_restaurants={}, project_id='p')
+
+        queries = [call_args[0][0] for call_args in client.query.call_args_list]
+        self.assertTrue(queries[0].startswith('INSERT INTO `p.restaurants_dataset.restaurants_table_partitioned`'))
+        self.assertIn('CREATE OR REPLACE VIEW `p.restaurants_dataset.new_restaurants_view`', queries[1])
+        # The view compares first_seen itself to a date, so BigQuery can prune partitions
+        self.assertIn('WHERE first_seen >= DATE_SUB(CURRENT_DATE(), INTERVAL 60 DAY)', queries[1])
+        self.assertIn('MERGE', queries[2])
+
+    def test_unpartitioned_table_is_rebuilt_and_swapped_in(self):
+        client = MagicMock()
+        # An old table, from before the location columns were added
+        old_schema = [field for field in data_processing.RESTAURANTS_SCHEMA if field.name not in ('latitude', 'longitude')]
+        table = bigquery.Table('p.restaurants_dataset.restaurants_table', schema=old_schema)
+
+        self.assertTrue(data_processing.ensure_restaurants_table_layout(client, table))
+
+        table_ref = 'p.restaurants_dataset.restaurants_table'
+        layout_ref = 'p.restaurants_dataset.restaurants_table_partitioned'
+        # The rebuilt table has the full schema, with its descriptions, and the layout
+        created = client.create_table.call_args[0][0]
+        self.assertEqual(created.reference.table_id, 'restaurants_table_partitioned')
+        self.assertEqual(created.schema, data_processing.RESTAURANTS_SCHEMA)
+        self.assertEqual(created.time_partitioning.field, 'first_seen')
+        self.assertEqual(created.clustering_fields, ['primary_type', 'user_rating_count'])
+        self.assertTrue(data_processing.has_restaurants_table_layout(created))
+
+        insert = client.query.call_args[0][0]
+        self.assertIn(f'INSERT INTO `{layout_ref}` (restaurant_id, displayName', insert)
+        self.assertIn(f'FROM `{table_ref}`', insert)
+        self.assertNotIn('latitude', insert)
+        self.assertNotIn('CREATE OR REPLACE', insert)
+
+        # Built aside, then swapped in: drop the old table, copy the new one over, clean up
+        steps = [(name, call_args.args) for name, call_args in
+                 ((call_args[0], call_args) for call_args in client.mock_calls)
+                 if name in ('delete_table', 'create_table', 'query', 'copy_table')]
+        self.assertEqual([name for name, _ in steps],
+                         ['delete_table', 'create_table', 'query', 'delete_table', 'copy_table', 'delete_table'])
+        self.assertEqual(steps[3][1], (table_ref,))
+        self.assertEqual(steps[4][1], (layout_ref, table_ref))
+        self.assertEqual(steps[5][1], (layout_ref,))
+
+        # A table with the layout is left alone
+        client.reset_mock()
+        table = bigquery.Table('p.d.t')
+        table.time_partitioning, table.clustering_fields = data_processing.restaurants_table_layout()
+        self.assertFalse(data_processing.ensure_restaurants_table_layout(client, table))
+        client.query.assert_not_called()
+
+
+class TestQueryNewRestaurants(unittest.TestCase):
+
+    @patch('restaurant_finder.data_processing.get_bigquery_client')
+    def test_filters_are_parameters_and_days_are_capped(self, mock_get_client):
+        client = mock_get_client.return_value
+
+        result = data_processing.query_new_restaurants('p', days=365, min_rating=4.2, min_reviews=5, max_reviews=60)
+
+        query, = client.query.call_args[0]
+        job_config = client.query.call_args[1]['job_config']
+        self.assertIn('FROM `p.restaurants_dataset.new_restaurants_view`', query)
+        self.assertIn('WHERE first_seen >= DATE_SUB(CURRENT_DATE(), INTERVAL @days DAY)', query)
+        self.assertIn('ORDER BY rating DESC', query)
+        values = {parameter.name: (parameter.type_, parameter.value) for parameter in job_config.query_parameters}
+        # The view only holds NEW_RESTAURANTS_DAYS days, so longer windows are capped to it
+        self.assertEqual(values, {'days': ('INT64', 60), 'min_reviews': ('INT64', 5),
+                                  'max_reviews': ('INT64', 60), 'min_rating': ('FLOAT64', 4.2)})
+        self.assertIs(result, client.query.return_value.result.return_value.to_dataframe.return_value)
+
+        data_processing.query_new_restaurants('p', days=7, min_rating=0, min_reviews=0, max_reviews=10)
+        days = [parameter.value for parameter in client.query.call_args[1]['job_config'].query_parameters
+                if parameter.name == 'days']
+        self.assertEqual(days, [7])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from datetime import date
+
+import numpy as np
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder import data_processing
+from restaurant_finder.density_map import DensityMap, geohash_centres, geohash_encode
+from restaurant_finder.geo_functions import destination_points
+from restaurant_finder.records import Restaurant
+
+
+def store_with_places(lat, long, count, spread):
+    # count places scattered within spread meters of (lat, long)
+    rng = np.random.default_rng(0)
+    lats, longs = destination_points(lat, long, spread * np.sqrt(rng.random(count)), rng.random(count) * 360)
+    return data_processing.restaurants_to_table({
+        f'{lat}_{i}': Restaurant(latitude=float(place_lat), longitude=float(place_long))
+        for i, (place_lat, place_long) in enumerate(zip(lats, longs))
+    })
+
+
+class TestGeohash(unittest.TestCase):
+
+    def test_encode_and_centres(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11)[0], 'u4pruydqqvj')
+        lats, longs = geohash_centres(['u4pruy'])
+        self.assertEqual(geohash_encode(lats, longs)[0], 'u4pruy')
+
+
+class TestDensityMap(unittest.TestCase):
+
+    def test_dense_circles_are_split_and_sparse_ones_merged(self):
+        dense = (51.51, -0.13)
+        sparse = (51.30, -0.50)
+        ring_lats, ring_longs = destination_points(*sparse, 1000 * np.sqrt(3), np.arange(0, 360, 60))
+        sparse_grid = [(*sparse, 1000)] + [(lat, long, 1000) for lat, long in zip(ring_lats, ring_longs)]
+
+        density_map = DensityMap()
+        store = store_with_places(*dense, 400, 1500)
+        density_map.update(store, searched_cells=[(*dense, 1000)] + sparse_grid, saturated_cells=[(*dense, 1000)],
+                           today=date(2025, 5, 19))
+        self.assertEqual(density_map.cells['saturated'].sum(), 1)
+
+        self.assertGreater(density_map.expected_places(*dense, 1000), 20)
+        self.assertEqual(density_map.expected_places(*sparse, 1000), 0)
+        self.assertIsNone(density_map.expected_places(40.0, -74.0, 1000))
+
+        planned = density_map.plan([(*dense, 1000)], min_radius=100)
+        self.assertGreater(len(planned), 7)
+        self.assertTrue(all(radius < 1000 for _, _, radius in planned))
+
+        # Seven hexagonal neighbours in the searched but empty area collapse into a single circle
+        planned = density_map.plan(sparse_grid, min_radius=100)
+        self.assertEqual(len(planned), 1)
+        self.assertAlmostEqual(planned[0][2], 1000 * (1 + np.sqrt(3)), delta=1)
+
+        # Unknown areas are searched as planned
+        self.assertEqual(density_map.plan([(40.0, -74.0, 1000)], min_radius=100), [(40.0, -74.0, 1000)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder import geo_functions
+
+
+class TestGeoKernel(unittest.TestCase):
+
+    def test_haversine_distance_london_paris(self):
+        distance = geo_functions.haversine_distance(51.5074, -0.1278, 48.8566, 2.3522)
+        self.assertAlmostEqual(distance / 1000, 343.5, delta=1.0)
+
+    def test_destination_points_round_trip(self):
+        bearings = np.arange(0, 360, 45)
+        lats, longs = geo_functions.destination_points(51.5, -0.1, 1000, bearings)
+        distances = geo_functions.haversine_distance(51.5, -0.1, lats, longs)
+        np.testing.assert_allclose(distances, 1000, rtol=1e-9)
+
+    def test_bounding_box_contains_circle(self):
+        south, west, north, east = geo_functions.bounding_box(51.5, -0.1, 1000)
+        lats, longs = geo_functions.destination_points(51.5, -0.1, 1000, np.arange(0, 360, 5))
+        self.assertTrue(np.all((lats >= south - 1e-9) & (lats <= north + 1e-9)))
+        self.assertTrue(np.all((longs >= west - 1e-9) & (longs <= east + 1e-9)))
+
+    def test_circle_overlap(self):
+        self.assertAlmostEqual(geo_functions.circle_overlap(51.5, -0.1, 100, 51.5, -0.1, 100), np.pi * 100 ** 2)
+        self.assertEqual(geo_functions.circle_overlap(51.5, -0.1, 100, 51.6, -0.1, 100), 0.0)
+        # Two unit-ish circles one radius apart share about 39% of their area
+        lat2, long2 = geo_functions.destination_points(51.5, -0.1, 100, 90)
+        overlap = geo_functions.circle_overlap(51.5, -0.1, 100, lat2, long2, 100)
+        self.assertAlmostEqual(overlap / (np.pi * 100 ** 2), 0.391, places=3)
+
+
+class TestCoveragePlanning(unittest.TestCase):
+
+    def assert_covered(self, sample_lats, sample_longs, circles):
+        circle_lats, circle_longs, circle_radii = (np.array(column) for column in zip(*circles))
+        distances = geo_functions.haversine_distance(sample_lats[:, None], sample_longs[:, None],
+                                                     circle_lats[None, :], circle_longs[None, :])
+        self.assertTrue(np.all(np.any(distances <= circle_radii[None, :] + 1e-6, axis=1)))
+
+    def test_tile_circle_covers_parent(self):
+        rng = np.random.default_rng(0)
+        children = geo_functions.tile_circle(51.5, -0.1, 1000)
+        self.assertEqual(len(children), 7)
+        self.assertTrue(all(radius == 500 for _, _, radius in children))
+
+        distances = 1000 * np.sqrt(rng.random(2000)) * 0.999
+        lats, longs = geo_functions.destination_points(51.5, -0.1, distances, rng.random(2000) * 360)
+        self.assert_covered(lats, longs, children)
+
+    def test_cover_annulus_skips_the_known_disc(self):
+        rng = np.random.default_rng(0)
+        # The known disc reaches past half the radius: only the six ring children are needed
+        self.assertEqual(len(geo_functions.cover_annulus(51.5, -0.1, 1000, 600)), 6)
+        self.assertEqual(geo_functions.cover_annulus(51.5, -0.1, 1000, 1000), [])
+        self.assertEqual(len(geo_functions.cover_annulus(51.5, -0.1, 1000, 0)), 7)
+
+        # A smaller known disc is ringed again at half the scale instead of re-searching the centre
+        children = geo_functions.cover_annulus(51.5, -0.1, 1000, 300)
+        self.assertEqual(sorted(radius for _, _, radius in children), [250] * 6 + [500] * 6)
+        distances = 300 + 700 * np.sqrt(rng.random(2000)) * 0.999
+        lats, longs = geo_functions.destination_points(51.5, -0.1, distances, rng.random(2000) * 360)
+        self.assert_covered(lats, longs, children)
+
+    def test_plan_hex_grid_covers_box(self):
+        rng = np.random.default_rng(0)
+        circles = geo_functions.plan_hex_grid((51.55, -0.2), (51.45, 0.0), 666)
+        lats = rng.uniform(51.45, 51.55, 2000)
+        longs = rng.uniform(-0.2, 0.0, 2000)
+        self.assert_covered(lats, longs, circles)
+
+
+class TestGridPruning(unittest.TestCase):
+
+    def setUp(self):
+        # A dense cluster of almost identical postcode circles and two isolated ones
+        cluster_lats, cluster_longs = geo_functions.destination_points(51.5, -0.1, np.arange(10) * 20, 45)
+        self.cluster = [(float(lat), float(long), 666) for lat, long in zip(cluster_lats, cluster_longs)]
+        self.isolated = [(51.6, -0.3, 666), (51.4, 0.1, 666)]
+
+    def test_prune_drops_mostly_covered_circles(self):
+        kept = geo_functions.prune_overlapping_circles(self.cluster + self.isolated, overlap_threshold=0.8)
+        self.assertLess(len(kept), len(self.cluster))
+        self.assertTrue(all(circle in kept for circle in self.isolated))
+        # Nothing overlaps fully, so a threshold of 1 keeps every distinct circle
+        self.assertEqual(len(geo_functions.prune_overlapping_circles(self.isolated, overlap_threshold=1)), 2)
+        # Even the lowest threshold keeps circles that overlap nothing, and the first circle of the cluster
+        kept = geo_functions.prune_overlapping_circles(self.cluster + self.isolated, overlap_threshold=0.0)
+        self.assertTrue(all(circle in kept for circle in self.isolated))
+        self.assertEqual(len(kept), 3)
+        # Circles covered entirely are dropped at a threshold of 1
+        self.assertEqual(geo_functions.prune_overlapping_circles(self.isolated * 2, overlap_threshold=1), self.isolated)
+
+    def test_limit_keeps_isolated_circles(self):
+        chosen = geo_functions.select_max_coverage(self.cluster + self.isolated, limit=3)
+        self.assertEqual(len(chosen), 3)
+        self.assertTrue(all(circle in chosen for circle in self.isolated))
+
+    def test_prune_and_limit_share_one_sampling(self):
+        circles = self.cluster + self.isolated
+        with patch('restaurant_finder.geo_functions._coverage_samples',
+                   wraps=geo_functions._coverage_samples) as mock_samples:
+            coverage = geo_functions.CircleCoverage(circles)
+            kept = coverage.prune(overlap_threshold=0.8)
+            chosen = coverage.select(3, kept)
+        mock_samples.assert_called_once()
+        self.assertEqual(len(chosen), 3)
+        self.assertTrue(set(chosen.tolist()) <= set(kept.tolist()))
+        self.assertEqual({circles[i] for i in kept}, set(geo_functions.prune_overlapping_circles(circles, 0.8)))
+        self.assertTrue(all(circle in [circles[i] for i in chosen] for circle in self.isolated))
+
+    def test_grid_index_buckets_match_a_brute_force_search(self):
+        rng = np.random.default_rng(0)
+        lats, longs = 51.5 + rng.random(2000) * 0.1, -0.1 + rng.random(2000) * 0.1
+        index = geo_functions.GridIndex(lats, longs, cell_meters=300)
+        self.assertEqual(sum(len(bucket) for bucket in index.buckets.values()), 2000)
+        for lat, long in [(51.55, -0.05), (51.5, -0.1), (51.6, 0.0)]:
+            distances = geo_functions.haversine_distance(lat, long, lats, longs)
+            self.assertEqual(sorted(index.query(lat, long, 500).tolist()), np.flatnonzero(distances <= 500).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
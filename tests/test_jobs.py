@@ -0,0 +1,70 @@
+import tempfile
+import threading
+import unittest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder.jobs import JOB_DONE, JOB_FAILED, JOB_INTERRUPTED, CrawlJob, JobManager
+from restaurant_finder.records import Restaurant
+
+
+class TestJobManager(unittest.TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+
+    def test_jobs_run_in_the_background_and_persist_their_results(self):
+        release = threading.Event()
+        reported = threading.Event()
+        calls = []
+
+        def crawl(latlong_list_input, project_id_input, checkpoint_location, run_id, scheduler, progress):
+            calls.append((run_id, scheduler, checkpoint_location))
+            progress({'cells_done': 1, 'cells_pending': 1, 'places_found': 1, 'saturated_cells': 0, 'calls_spent': 1})
+            reported.set()
+            release.wait(5)
+            return {'place_1': Restaurant(displayName='Test Cafe', last_seen='2025-05-19')}
+
+        manager = JobManager(location=self.location, crawl=crawl, save_every_seconds=0)
+        job_id = manager.submit(latlong_list_input=[(51.5, -0.1, 500)], project_id_input='test-project-id')
+
+        # submit returns while the crawl is still running; progress can be polled
+        self.assertTrue(reported.wait(5))
+        job = manager.get(job_id)
+        self.assertTrue(job.active)
+        self.assertEqual(job.progress['cells_done'], 1)
+        # Checkpoints are kept with the jobs, so they outlive the container when the location is durable
+        self.assertEqual(job.params, {'project_id_input': 'test-project-id', 'n_points': 1,
+                                      'checkpoint_location': f'{self.location}/checkpoints'})
+
+        release.set()
+        manager.shutdown()
+        self.assertEqual(manager.get(job_id).status, JOB_DONE)
+        # The job id is the run id of the crawl's checkpoint, and every job shares the manager's rate limit
+        self.assertEqual(calls, [(job_id, manager.scheduler, f'{self.location}/checkpoints')])
+
+        # A new manager, as after a restart, finds the job and its results
+        reopened = JobManager(location=self.location, crawl=crawl)
+        self.assertEqual([job.job_id for job in reopened.list_jobs()], [job_id])
+        self.assertEqual(reopened.load_result(job_id)['place_1'].displayName, 'Test Cafe')
+
+    def test_failed_and_interrupted_jobs(self):
+        def crawl(**kwargs):
+            raise ValueError("no grid")
+
+        manager = JobManager(location=self.location, crawl=crawl)
+        job_id = manager.submit(latlong_list_input=[])
+        manager.shutdown()
+        self.assertEqual(manager.get(job_id).status, JOB_FAILED)
+        self.assertEqual(manager.get(job_id).error, "ValueError: no grid")
+
+        # A job left running by a process that stopped is reported as interrupted
+        stale = CrawlJob('20250519_120000_abcdef', params={}, status='running')
+        manager._save(stale)
+        self.assertEqual(JobManager(location=self.location, crawl=crawl).get(stale.job_id).status, JOB_INTERRUPTED)
+
+
+if __name__ == '__main__':
+    unittest.main()
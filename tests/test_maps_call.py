@@ -0,0 +1,92 @@
+import copy
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder.call_scheduler import STAGE_REFINEMENT
+from restaurant_finder.maps_call import PLACES_FIELD_MASK, PLACES_SEARCH_NEARBY_URL, PlacesClient
+from restaurant_finder.response_cache import ResponseCache
+
+
+def make_response(status_code, body=None):
+    response = MagicMock(status_code=status_code, text='body')
+    response.json.return_value = body
+    return response
+
+
+class TestPlacesClient(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(path=':memory:', ttl_hours=1)
+        self.scheduler = MagicMock()
+        self.scheduler.acquire.return_value = True
+        self.client = PlacesClient('test-key', cache=self.cache, scheduler=self.scheduler)
+        self.client.session.post = MagicMock()
+
+    def tearDown(self):
+        self.client.close()
+        self.cache.close()
+
+    def test_session_headers(self):
+        headers = self.client.session.headers
+        self.assertEqual(headers['X-Goog-Api-Key'], 'test-key')
+        self.assertEqual(headers['X-Goog-FieldMask'], PLACES_FIELD_MASK)
+        self.assertEqual(headers['Content-Type'], 'application/json')
+        self.assertEqual(headers['Accept-Encoding'], 'gzip')
+
+    def test_payloads_never_mutate_the_template(self):
+        template = copy.deepcopy(self.client.payload_template)
+
+        payload = self.client.build_payload(51.5, -0.1, 500, 'DISTANCE', included_types=['cafe'])
+        self.assertEqual(payload['includedPrimaryTypes'], ['cafe'])
+        self.assertEqual(payload['locationRestriction']['circle'],
+                         {'center': {'latitude': 51.5, 'longitude': -0.1}, 'radius': 500})
+        payload['excludedTypes'] = []
+        payload['includedPrimaryTypes'].append('bar')
+
+        self.assertEqual(self.client.payload_template, template)
+        self.assertNotIn('rankPreference', self.client.payload_template)
+        self.assertNotEqual(self.client.filters_hash_for(['cafe']), self.client.filters_hash)
+
+    @patch('restaurant_finder.maps_call.time.sleep')
+    def test_rate_limited_calls_are_retried_without_a_second_budget_slot(self, mock_sleep):
+        self.client.session.post.side_effect = [make_response(429), make_response(429),
+                                                make_response(200, {'places': [{'id': 'a'}]})]
+
+        response = self.client.search_nearby(51.5, -0.1, 500, 'DISTANCE', stage=STAGE_REFINEMENT)
+
+        self.assertEqual(response, {'places': [{'id': 'a'}]})
+        self.assertEqual(self.client.session.post.call_count, 3)
+        self.assertEqual(self.client.session.post.call_args[0][0], PLACES_SEARCH_NEARBY_URL)
+        self.scheduler.acquire.assert_called_once_with(STAGE_REFINEMENT)
+        self.assertEqual(self.scheduler.wait_for_token.call_count, 2)
+        self.assertEqual([call_args[0][0] for call_args in mock_sleep.call_args_list], [1, 2])
+
+        # The successful response is cached: the same search does not call the API again
+        self.assertEqual(self.client.search_nearby(51.5, -0.1, 500, 'DISTANCE'), response)
+        self.assertEqual(self.client.session.post.call_count, 3)
+        self.scheduler.acquire.assert_called_once()
+
+    def test_errors_are_not_cached(self):
+        self.client.session.post.side_effect = [make_response(500), requests.exceptions.ConnectionError('down'),
+                                                make_response(200, {'places': []})]
+
+        self.assertIn('error', self.client.search_nearby(51.5, -0.1, 500, 'DISTANCE'))
+        self.assertIn('error', self.client.search_nearby(51.5, -0.1, 500, 'DISTANCE'))
+        self.assertEqual(self.client.search_nearby(51.5, -0.1, 500, 'DISTANCE'), {'places': []})
+        self.assertEqual(self.client.session.post.call_count, 3)
+
+    def test_spent_budget_skips_the_call(self):
+        self.scheduler.acquire.return_value = False
+        response = self.client.search_nearby(51.5, -0.1, 500, 'DISTANCE')
+        self.assertTrue(response['budget_exhausted'])
+        self.client.session.post.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
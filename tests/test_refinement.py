@@ -0,0 +1,46 @@
+import unittest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder import refinement
+from restaurant_finder.config import INCLUDED_PRIMARY_TYPES, PRIMARY_TYPE_PARTITIONS
+
+
+class TestPlanRefinement(unittest.TestCase):
+
+    def test_partitions_cover_the_included_types_once(self):
+        partition_types = [place_type for place_types in PRIMARY_TYPE_PARTITIONS.values() for place_type in place_types]
+        self.assertEqual(sorted(partition_types), sorted(INCLUDED_PRIMARY_TYPES))
+
+    def test_split_costs(self):
+        self.assertEqual(refinement.spatial_split_calls(19), 0)
+        self.assertEqual(refinement.spatial_split_calls(40), 7)
+        self.assertEqual(refinement.spatial_split_calls(100), 7 + 49)
+        # Five groups, none expected to saturate on its own
+        self.assertEqual(refinement.type_split_calls(30, ['thai_restaurant'] * 10 + ['italian_restaurant'] * 10), 5)
+
+    def test_dense_mixed_block_is_split_by_type(self):
+        # 20 places within 100 m of a 400 m circle: about 320 places, so spatial splitting takes two levels
+        mixed = ['thai_restaurant', 'italian_restaurant', 'mexican_restaurant', 'turkish_restaurant', 'restaurant'] * 4
+        children = refinement.plan_refinement(51.5, -0.1, 400, 100, None, mixed)
+        self.assertEqual([child[3] for child in children], list(PRIMARY_TYPE_PARTITIONS))
+        self.assertTrue(all(child[:3] == (51.5, -0.1, 400) for child in children))
+
+    def test_single_cuisine_block_and_partitioned_cells_are_split_spatially(self):
+        # All places share one group, so searching per group would not clear it
+        children = refinement.plan_refinement(51.5, -0.1, 400, 240, None, ['sushi_restaurant'] * 20)
+        self.assertEqual(len(children), 6)
+        self.assertTrue(all(child[2] < 400 and child[3] is None for child in children))
+
+        children = refinement.plan_refinement(51.5, -0.1, 400, 100, 'asian', ['sushi_restaurant'] * 20)
+        self.assertTrue(all(child[2] < 400 and child[3] == 'asian' for child in children))
+
+        # Without a proven radius there is nothing to estimate from
+        children = refinement.plan_refinement(51.5, -0.1, 400, 0, None, ['thai_restaurant'] * 20)
+        self.assertEqual(len(children), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
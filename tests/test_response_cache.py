@@ -0,0 +1,49 @@
+import unittest
+from unittest.mock import patch
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from restaurant_finder.response_cache import ResponseCache, hash_type_filters
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(path=':memory:', ttl_hours=1, max_entries=2)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_keys_are_quantized(self):
+        key_a = self.cache.make_key(51.5000001, -0.1000001, 500, 'DISTANCE', 'abc')
+        key_b = self.cache.make_key(51.5000002, -0.1000002, 500, 'DISTANCE', 'abc')
+        key_c = self.cache.make_key(51.5000002, -0.1000002, 500, 'DISTANCE', 'other-filters')
+        self.assertEqual(key_a, key_b)
+        self.assertNotEqual(key_a, key_c)
+
+    def test_get_returns_stored_response_until_ttl(self):
+        self.cache.set('key', {'places': [{'id': 'a'}]})
+        self.assertEqual(self.cache.get('key'), {'places': [{'id': 'a'}]})
+
+        with patch('restaurant_finder.response_cache.time.time', return_value=10 ** 12):
+            self.assertIsNone(self.cache.get('key'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_evict_keeps_newest_entries(self):
+        for i, timestamp in enumerate([100.0, 200.0, 300.0]):
+            with patch('restaurant_finder.response_cache.time.time', return_value=timestamp):
+                self.cache.set(f'key{i}', {'i': i})
+        with patch('restaurant_finder.response_cache.time.time', return_value=300.0):
+            self.cache.evict()
+            self.assertIsNone(self.cache.get('key0'))
+            self.assertEqual(self.cache.get('key2'), {'i': 2})
+
+    def test_filter_hash_changes_with_filters(self):
+        self.assertNotEqual(hash_type_filters({'includedPrimaryTypes': ['a']}),
+                            hash_type_filters({'includedPrimaryTypes': ['a', 'b']}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import patch, MagicMock, call
+from unittest.mock import patch, call
 import pandas as pd # Required for type hints and mocking if df operations are involved
 from datetime import datetime, date # Added for the new test
 import numpy as np # For np.nan for the new test case
@@ -20,22 +20,33 @@ except ModuleNotFoundError:
     print("Failed to import streamlit_app. Check its internal imports and project structure.")
     raise
 
+import tempfile
+
+from restaurant_finder import data_processing
+from restaurant_finder.jobs import JOB_DONE, CrawlJob, JobManager
+from restaurant_finder.records import Restaurant
+
 # Define a dummy DataFrame to be returned by mocked functions if needed
 dummy_df = pd.DataFrame({'col1': [1, 2], 'col2': ['A', 'B']})
 dummy_restaurants_dict = {
-    'restaurant1': {'displayName': 'Test Cafe', 'shortFormattedAddress': '123 Test St', 'rating': 4.5}
+    'restaurant1': Restaurant(displayName='Test Cafe', shortFormattedAddress='123 Test St', rating=4.5)
 }
 dummy_lat_long_list = [(10.0, 20.0, 500), (30.0, 40.0, 1000)]
 
 
+class StopScript(BaseException):
+    # Stands in for the exception st.stop() raises, which is not an Exception so the app's handlers let it through
+    pass
+
+
 class TestStreamlitAppGCSProcessing(unittest.TestCase):
 
     @patch('streamlit_app.st')
     @patch('streamlit_app.get_latlong_from_bucket')
-    @patch('streamlit_app.find_restaurants_in_batches')
-    @patch('streamlit_app.pd.DataFrame.from_dict') # If results are processed
-    def test_successful_gcs_path_processing(self, mock_from_dict, mock_find_restaurants, mock_get_latlong, mock_st):
+    @patch('streamlit_app.get_job_manager')
+    def test_successful_gcs_path_processing(self, mock_get_job_manager, mock_get_latlong, mock_st):
         # --- Setup Mocks ---
+        mock_get_job_manager.return_value.list_jobs.return_value = [] # No crawl jobs to show
         # Simulate UI inputs
         # The order of side_effect values should match the order of st.text_input/st.number_input calls in streamlit_app.py
         mock_st.text_input.side_effect = [
@@ -46,20 +57,15 @@ class TestStreamlitAppGCSProcessing(unittest.TestCase):
             1.0,  # default_radius_for_input_km (1.0 km = 1000 m)
             10,   # limit_coords
             0.002,# amount_of_noise
-            100   # spoke_radius_input
+            100,  # min_radius_input
+            8,    # max_workers_input
+            500   # max_calls_input
         ]
         mock_st.button.return_value = True # Simulate button click
 
         # Mock external function calls
         mock_get_latlong.return_value = dummy_lat_long_list
-        mock_find_restaurants.return_value = dummy_restaurants_dict
-        mock_from_dict.return_value = dummy_df # If DataFrame conversion happens
-
-        # Mock spinner to act as a context manager
-        mock_spinner_instance = MagicMock()
-        mock_st.spinner.return_value = mock_spinner_instance
-        mock_spinner_instance.__enter__.return_value = None
-        mock_spinner_instance.__exit__.return_value = None
+        mock_get_job_manager.return_value.submit.return_value = "job-1"
         
         # --- Execute ---
         streamlit_app.main()
@@ -75,14 +81,17 @@ class TestStreamlitAppGCSProcessing(unittest.TestCase):
             radius=expected_radius_meters
         )
 
-        # 2. Assert find_restaurants_in_batches was called with the result
-        mock_find_restaurants.assert_called_once_with(
+        # 2. Assert the crawl was submitted as a background job with the result
+        mock_get_job_manager.return_value.submit.assert_called_once_with(
             latlong_list_input=dummy_lat_long_list,
             project_id_input="test-project-id",
             radius_input=expected_radius_meters,
             limit_input=10,
             amount_of_noise_input=0.002,
-            spoke_generation_radius_meters=100
+            min_radius_meters=100,
+            max_workers=8,
+            use_cache=True,
+            max_calls=500
         )
 
         # 3. Assert that no st.error was called
@@ -93,122 +102,164 @@ class TestStreamlitAppGCSProcessing(unittest.TestCase):
         self.assertIn(call.info("PROJECT_ID environment variable set to: test-project-id"), mock_st.method_calls)
         self.assertIn(call.info("Attempting to read from GCS bucket: 'test-bucket', file: 'data/coords.csv'"), mock_st.method_calls)
         self.assertIn(call.info(f"Prepared {len(dummy_lat_long_list)} coordinates for processing."), mock_st.method_calls)
-        self.assertIn(call.info("Finding restaurants... This may take a few minutes."), mock_st.method_calls)
+        self.assertIn(call.success("Submitted crawl job job-1. You can leave or refresh this page; the crawl keeps running."),
+                      mock_st.method_calls)
+        mock_st.session_state.__setitem__.assert_called_with('job_id', 'job-1')
+
+    @patch('streamlit_app.st')
+    @patch('streamlit_app.get_job_manager')
+    def test_finished_job_results_are_shown(self, mock_get_job_manager, mock_st):
+        # --- Setup Mocks ---
+        job = CrawlJob("job-1", params={}, status=JOB_DONE, progress={'cells_done': 2, 'places_found': 1})
+        mock_get_job_manager.return_value.list_jobs.return_value = [job]
+        mock_get_job_manager.return_value.get.return_value = job
+        mock_get_job_manager.return_value.load_result.return_value = dummy_restaurants_dict
+        mock_st.session_state = {"job_id": "job-1"}
+        mock_st.selectbox.return_value = "job-1"
+        mock_st.columns.return_value = [mock_st] * 4
+        mock_st.slider.return_value = 0.0
+        mock_st.number_input.return_value = 0
+        mock_st.multiselect.return_value = []
+
+        # --- Execute ---
+        streamlit_app.crawl_jobs_panel()
+
+        # --- Assertions ---
+        mock_get_job_manager.return_value.load_result.assert_called_once_with("job-1")
+        mock_st.fragment.assert_not_called() # A finished job is not polled
         self.assertIn(call.success(f"Found {len(dummy_restaurants_dict)} unique restaurants!"), mock_st.method_calls)
 
+        # Reruns, e.g. after a filter changes, reuse the prepared results kept in the session
+        streamlit_app.crawl_jobs_panel()
+        mock_get_job_manager.return_value.load_result.assert_called_once_with("job-1")
+        self.assertIn("job-1", mock_st.session_state["results"])
+
 
     @patch('streamlit_app.st')
     @patch('streamlit_app.get_latlong_from_bucket')
-    @patch('streamlit_app.find_restaurants_in_batches')
-    def test_invalid_gcs_path_no_prefix(self, mock_find_restaurants, mock_get_latlong, mock_st):
+    @patch('streamlit_app.get_job_manager')
+    def test_invalid_gcs_path_no_prefix(self, mock_get_job_manager, mock_get_latlong, mock_st):
         # --- Setup Mocks ---
+        mock_get_job_manager.return_value.list_jobs.return_value = [] # No crawl jobs to show
         mock_st.text_input.side_effect = [
             "test-project-id",
             "invalid-path/data.csv"  # Invalid GCS path
         ]
-        mock_st.number_input.side_effect = [1.0, 10, 0.002, 100] # Values don't matter much here
+        mock_st.number_input.side_effect = [1.0, 10, 0.002, 100, 8, 0] # Values don't matter much here
         mock_st.button.return_value = True
+        mock_st.stop.side_effect = StopScript
 
         # --- Execute ---
-        streamlit_app.main()
+        with self.assertRaises(StopScript):
+            streamlit_app.main()
 
         # --- Assertions ---
         mock_st.error.assert_called_once_with("Invalid GCS path format. Must start with 'gs://'.")
         mock_st.stop.assert_called_once()
         mock_get_latlong.assert_not_called()
-        mock_find_restaurants.assert_not_called()
+        mock_get_job_manager.return_value.submit.assert_not_called()
 
     @patch('streamlit_app.st')
     @patch('streamlit_app.get_latlong_from_bucket')
-    @patch('streamlit_app.find_restaurants_in_batches')
-    def test_invalid_gcs_path_incomplete(self, mock_find_restaurants, mock_get_latlong, mock_st):
+    @patch('streamlit_app.get_job_manager')
+    def test_invalid_gcs_path_incomplete(self, mock_get_job_manager, mock_get_latlong, mock_st):
         # --- Setup Mocks ---
+        mock_get_job_manager.return_value.list_jobs.return_value = [] # No crawl jobs to show
         mock_st.text_input.side_effect = [
             "test-project-id",
             "gs://test-bucket"  # Incomplete GCS path (missing file)
         ]
-        mock_st.number_input.side_effect = [1.0, 10, 0.002, 100]
+        mock_st.number_input.side_effect = [1.0, 10, 0.002, 100, 8, 0]
         mock_st.button.return_value = True
+        mock_st.stop.side_effect = StopScript
 
         # --- Execute ---
-        streamlit_app.main()
+        with self.assertRaises(StopScript):
+            streamlit_app.main()
 
         # --- Assertions ---
         mock_st.error.assert_called_once_with("Invalid GCS path format. Must include bucket name and file path (e.g., gs://bucket/file.csv).")
         mock_st.stop.assert_called_once()
         mock_get_latlong.assert_not_called()
-        mock_find_restaurants.assert_not_called()
+        mock_get_job_manager.return_value.submit.assert_not_called()
 
     @patch('streamlit_app.st')
     @patch('streamlit_app.get_latlong_from_bucket')
-    @patch('streamlit_app.find_restaurants_in_batches')
-    def test_gcs_read_fails_empty_list_returned(self, mock_find_restaurants, mock_get_latlong, mock_st):
+    @patch('streamlit_app.get_job_manager')
+    def test_gcs_read_fails_empty_list_returned(self, mock_get_job_manager, mock_get_latlong, mock_st):
         # --- Setup Mocks ---
+        mock_get_job_manager.return_value.list_jobs.return_value = [] # No crawl jobs to show
         mock_st.text_input.side_effect = [
             "test-project-id",
             "gs://test-bucket/data/empty.csv"
         ]
-        mock_st.number_input.side_effect = [1.0, 10, 0.002, 100]
+        mock_st.number_input.side_effect = [1.0, 10, 0.002, 100, 8, 0]
         mock_st.button.return_value = True
+        mock_st.stop.side_effect = StopScript
         
         mock_get_latlong.return_value = [] # Simulate GCS returning no valid coordinates
 
         # --- Execute ---
-        streamlit_app.main()
+        with self.assertRaises(StopScript):
+            streamlit_app.main()
 
         # --- Assertions ---
         mock_get_latlong.assert_called_once() # Should still be called
         mock_st.error.assert_called_once_with("No valid coordinates found in the GCS file, or the file is empty.")
         mock_st.stop.assert_called_once()
-        mock_find_restaurants.assert_not_called()
+        mock_get_job_manager.return_value.submit.assert_not_called()
 
     @patch('streamlit_app.st')
     @patch('streamlit_app.get_latlong_from_bucket')
-    @patch('streamlit_app.find_restaurants_in_batches')
-    def test_project_id_missing(self, mock_find_restaurants, mock_get_latlong, mock_st):
+    @patch('streamlit_app.get_job_manager')
+    def test_project_id_missing(self, mock_get_job_manager, mock_get_latlong, mock_st):
         # --- Setup Mocks ---
+        mock_get_job_manager.return_value.list_jobs.return_value = [] # No crawl jobs to show
         mock_st.text_input.side_effect = [
             "",  # Empty project_id_input
             "gs://test-bucket/data/coords.csv" 
         ]
-        mock_st.number_input.side_effect = [1.0, 10, 0.002, 100]
+        mock_st.number_input.side_effect = [1.0, 10, 0.002, 100, 8, 0]
         mock_st.button.return_value = True
+        mock_st.stop.side_effect = StopScript
 
         # --- Execute ---
-        streamlit_app.main()
+        with self.assertRaises(StopScript):
+            streamlit_app.main()
 
         # --- Assertions ---
         mock_st.error.assert_called_once_with("Please enter the Google Cloud Project ID.")
         mock_st.stop.assert_called_once()
         mock_get_latlong.assert_not_called()
-        mock_find_restaurants.assert_not_called()
+        mock_get_job_manager.return_value.submit.assert_not_called()
 
     @patch('streamlit_app.st')
     @patch('streamlit_app.get_latlong_from_bucket') # Still need to mock it even if not called
-    @patch('streamlit_app.find_restaurants_in_batches')
-    def test_gcs_path_missing(self, mock_find_restaurants, mock_get_latlong, mock_st):
+    @patch('streamlit_app.get_job_manager')
+    def test_gcs_path_missing(self, mock_get_job_manager, mock_get_latlong, mock_st):
         # --- Setup Mocks ---
+        mock_get_job_manager.return_value.list_jobs.return_value = [] # No crawl jobs to show
         mock_st.text_input.side_effect = [
             "test-project-id", 
             ""  # Empty gcs_path_input
         ]
-        mock_st.number_input.side_effect = [1.0, 10, 0.002, 100]
+        mock_st.number_input.side_effect = [1.0, 10, 0.002, 100, 8, 0]
         mock_st.button.return_value = True
+        mock_st.stop.side_effect = StopScript
 
         # --- Execute ---
-        streamlit_app.main()
+        with self.assertRaises(StopScript):
+            streamlit_app.main()
 
         # --- Assertions ---
         mock_st.error.assert_called_once_with("Please enter the GCS path for the coordinates CSV file.")
         mock_st.stop.assert_called_once()
         mock_get_latlong.assert_not_called()
-        mock_find_restaurants.assert_not_called()
+        mock_get_job_manager.return_value.submit.assert_not_called()
 
     @patch('streamlit_app.st')
-    @patch('streamlit_app.get_latlong_from_bucket') # Mocked as it's part of the flow before filtering
-    @patch('streamlit_app.find_restaurants_in_batches')
     @patch('streamlit_app.datetime')
-    def test_filter_restaurants_by_first_seen_date_correct(self, mock_dt, mock_find_restaurants, mock_get_latlong, mock_st):
+    def test_filter_restaurants_by_first_seen_date_correct(self, mock_dt, mock_st):
         # --- Setup Mocks ---
         mock_today = date(2025, 5, 19)
         
@@ -222,40 +273,27 @@ class TestStreamlitAppGCSProcessing(unittest.TestCase):
         # mock_dt.today.return_value.strftime.return_value = mock_today.strftime('%Y-%m-%d')
 
         sample_restaurants_data = {
-            "id1": {"displayName": "Restaurant A", "first_seen": "2025-05-19", "location": {"lat":1, "lng":1}},
-            "id2": {"displayName": "Restaurant B", "first_seen": "2025-05-18", "location": {"lat":1, "lng":1}},
-            "id3": {"displayName": "Restaurant C", "first_seen": "2025-05-19", "location": {"lat":1, "lng":1}},
-            "id4": {"displayName": "Restaurant D", "location": {"lat":1, "lng":1}}, # No first_seen
-            "id5": {"displayName": "Restaurant E", "first_seen": "2024-01-01", "location": {"lat":1, "lng":1}},
+            "id1": {"displayName": "Restaurant A", "first_seen": "2025-05-19", "latitude": 1, "longitude": 1},
+            "id2": {"displayName": "Restaurant B", "first_seen": "2025-05-18", "latitude": 1, "longitude": 1},
+            "id3": {"displayName": "Restaurant C", "first_seen": "2025-05-19", "latitude": 1, "longitude": 1},
+            "id4": {"displayName": "Restaurant D", "latitude": 1, "longitude": 1}, # No first_seen
+            "id5": {"displayName": "Restaurant E", "first_seen": "2024-01-01", "latitude": 1, "longitude": 1},
             # Test with actual date object, app should convert it
-            "id6": {"displayName": "Restaurant F", "first_seen": date(2025, 5, 19), "location": {"lat":1, "lng":1}}, 
+            "id6": {"displayName": "Restaurant F", "first_seen": date(2025, 5, 19), "latitude": 1, "longitude": 1}, 
         }
-        mock_find_restaurants.return_value = sample_restaurants_data
+        sample_restaurants_data = {restaurant_id: Restaurant.from_dict(data)
+                                   for restaurant_id, data in sample_restaurants_data.items()}
 
-        # Simulate UI inputs necessary to reach the relevant part of the code
-        mock_st.text_input.side_effect = [
-            "test-project-id",  # project_id_input
-            "gs://test-bucket/data/coords.csv"  # gcs_path_input
-        ]
-        mock_st.number_input.side_effect = [
-            1.0,  # default_radius_for_input_km
-            10,   # limit_coords
-            0.002,# amount_of_noise
-            100   # spoke_radius_input
-        ]
-        mock_st.button.return_value = True # Simulate button click
-
-        # Mock get_latlong_from_bucket to return some dummy data
-        mock_get_latlong.return_value = [(10.0, 20.0, 500)] # Dummy coordinate list
-
-        # Mock spinner to act as a context manager
-        mock_spinner_instance = MagicMock()
-        mock_st.spinner.return_value = mock_spinner_instance
-        mock_spinner_instance.__enter__.return_value = None
-        mock_spinner_instance.__exit__.return_value = None
+        # Filter widgets left at their defaults
+        mock_st.columns.return_value = [mock_st, mock_st]
+        mock_st.slider.return_value = 0.0
+        mock_st.number_input.return_value = 0
+        mock_st.multiselect.return_value = []
+        mock_st.date_input.side_effect = lambda label, value: value
 
         # --- Execute ---
-        streamlit_app.main()
+        # The results of a finished crawl job are prepared once, then shown with display_results
+        streamlit_app.display_results(streamlit_app.prepare_results(sample_restaurants_data))
 
         # --- Assertions ---
         # Check that st.dataframe was called
@@ -279,15 +317,98 @@ class TestStreamlitAppGCSProcessing(unittest.TestCase):
         self.assertNotIn("id4", displayed_df.index) # No 'first_seen'
         self.assertNotIn("id5", displayed_df.index)
 
-        # Verify that the warning for 'first_seen' not found was NOT called for id4 (it is handled)
-        # but that the general processing continued.
-        # We expect a warning for 'first_seen' column not found if the *column itself* is missing,
-        # not for individual rows. The current code applies a warning if the column is missing entirely.
-        # If 'id4' caused a specific warning that we want to check, the app logic would need to do that.
-        # The current test setup implies the column 'first_seen' WILL exist due to other entries.
-        
-        # Check that st.write was called with the filtering message
-        mock_st.write.assert_any_call(f"Filtering for 'first_seen' date: {mock_today.strftime('%Y-%m-%d')}")
+        # The first_seen filter defaults to today, since some restaurants were first seen today
+        mock_st.date_input.assert_called_once_with("First seen between", value=(mock_today, mock_today))
+        mock_st.write.assert_any_call("Showing 3 of 6 restaurants")
+
+        # Loosening the filters is applied to the same frame: without a date range every restaurant is shown
+        mock_st.date_input.side_effect = lambda label, value: (value[0],)
+        streamlit_app.display_results(streamlit_app.prepare_results(sample_restaurants_data))
+        self.assertEqual(len(mock_st.dataframe.call_args[0][0]), 6)
+
+    @patch('streamlit_app.st')
+    @patch('restaurant_finder.data_processing.sync_restaurants_to_bigquery')
+    @patch('restaurant_finder.data_processing.deltas_since_last_base', return_value=1)
+    @patch('restaurant_finder.data_processing.write_restaurant_delta')
+    @patch('restaurant_finder.data_processing.read_restaurant_store')
+    @patch('restaurant_finder.main.iterate_over_calls')
+    @patch('restaurant_finder.main.get_bucket_name', return_value='test-bucket')
+    def test_job_results_default_to_restaurants_first_seen_today(self, _mock_bucket, mock_iterate, mock_read_store,
+                                                                 _mock_delta, _mock_deltas, _mock_sync, mock_st):
+        # --- Setup Mocks ---
+        today = datetime.today().strftime('%Y-%m-%d')
+        # The store knows one of the places; the crawl finds it again along with a new one
+        mock_read_store.return_value = data_processing.restaurants_to_table({
+            'known': Restaurant(displayName='Old Diner', last_seen='2025-01-01', first_seen='2024-06-01',
+                                latitude=51.5, longitude=-0.1)})
+        # Places parsed from the API carry no first_seen; the merge into the store sets it
+        mock_iterate.return_value = ({
+            'known': Restaurant(displayName='Old Diner', last_seen=today, latitude=51.5, longitude=-0.1),
+            'new': Restaurant(displayName='New Bistro', last_seen=today, latitude=51.5, longitude=-0.1),
+        }, [])
+
+        manager = JobManager(location=tempfile.mkdtemp())
+        job_id = manager.submit(latlong_list_input=[(51.5, -0.1, 500)], project_id_input='test-project-id',
+                                radius_input=500, limit_input=10, amount_of_noise_input=0,
+                                use_cache=False, use_density_map=False, checkpoint_location=tempfile.mkdtemp())
+        manager.shutdown()
+        self.assertEqual(manager.get(job_id).status, JOB_DONE)
+
+        # Filter widgets left at their defaults
+        mock_st.columns.return_value = [mock_st, mock_st]
+        mock_st.slider.return_value = 0.0
+        mock_st.number_input.return_value = 0
+        mock_st.multiselect.return_value = []
+        mock_st.date_input.side_effect = lambda label, value: value
+
+        # --- Execute ---
+        streamlit_app.display_results(streamlit_app.prepare_results(manager.load_result(job_id)))
+
+        # --- Assertions ---
+        today_date = datetime.today().date()
+        mock_st.date_input.assert_called_once_with("First seen between", value=(today_date, today_date))
+        displayed_df = mock_st.dataframe.call_args[0][0]
+        self.assertEqual(list(displayed_df.index), ['new'])
+        self.assertEqual(displayed_df.loc['new', 'first_seen'], today)
+
+
+class TestNewRestaurantsPage(unittest.TestCase):
+
+    def setUp(self):
+        streamlit_app.cached_new_restaurants.clear()
+
+    def set_inputs(self, mock_st):
+        mock_st.text_input.return_value = "test-project-id"
+        mock_st.slider.side_effect = [14, 4.0, (5, 60)]
+
+    @patch('streamlit_app.st')
+    @patch('streamlit_app.query_new_restaurants')
+    def test_new_restaurants_are_queried_and_shown(self, mock_query, mock_st):
+        self.set_inputs(mock_st)
+        mock_query.return_value = pd.DataFrame({
+            'displayName': ['New Bistro'], 'rating': [4.6], 'user_rating_count': [12],
+            'shortFormattedAddress': ['1 High St'], 'primary_type': ['restaurant'], 'types': [['restaurant']],
+            'first_seen': [date(2025, 5, 19)], 'latitude': [51.5], 'longitude': [-0.1]})
+
+        streamlit_app.new_restaurants_app()
+
+        mock_query.assert_called_once_with("test-project-id", 14, 4.0, 5, 60)
+        mock_st.write.assert_called_once_with("1 restaurants first seen in the last 14 days")
+        self.assertEqual(list(mock_st.dataframe.call_args[0][0]['displayName']), ['New Bistro'])
+        mock_st.map.assert_called_once()
+        mock_st.error.assert_not_called()
+
+    @patch('streamlit_app.st')
+    @patch('streamlit_app.query_new_restaurants')
+    def test_missing_view_is_reported(self, mock_query, mock_st):
+        self.set_inputs(mock_st)
+        mock_query.side_effect = streamlit_app.NotFound('new_restaurants_view')
+
+        streamlit_app.new_restaurants_app()
+
+        mock_st.error.assert_called_once_with(
+            "The new restaurants view does not exist yet. It is created when a crawl syncs to BigQuery.")
+        mock_st.dataframe.assert_not_called()
 
 
 class TestStreamlitAppDateFiltering(unittest.TestCase):
@@ -312,16 +433,9 @@ class TestStreamlitAppDateFiltering(unittest.TestCase):
         results_df = pd.DataFrame(data)
 
         # --- Apply the processing logic from streamlit_app.py ---
-        # 1. Convert to datetime, coercing errors
-        dt_series = pd.to_datetime(results_df['first_seen'], errors='coerce')
-        
-        # 2. Format to string 'YYYY-MM-DD'
-        # NaT becomes 'NaT' string, valid dates become 'YYYY-MM-DD'
-        results_df['first_seen'] = dt_series.dt.strftime('%Y-%m-%d')
-        
-        # 3. Ensure everything is a string and replace 'NaT' (string) with empty string
-        results_df['first_seen'] = results_df['first_seen'].astype(str)
-        results_df['first_seen'] = results_df['first_seen'].replace('NaT', '')
+        # Parse every format in one pass; unparseable and missing values become NaT and ''
+        dt_series, results_df['first_seen'] = streamlit_app.normalize_first_seen(results_df['first_seen'])
+        self.assertEqual(int(dt_series.isna().sum()), 4)
         # --- End of processing logic application ---
 
         # Perform filtering